@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+"""Benchmark of the ACF.dat parser on synthetic files with up to 10^6 rows.
+
+Run with ``python benchmarks/bench_acf_parser.py``.
+"""
+import argparse
+import io
+import time
+
+from aiida_bader.parsers import parse_acf
+from aiida_bader.testing import write_acf
+
+
+def parse_acf_legacy(data):
+    """The two-pass parser used before ``parse_acf``, kept for comparison."""
+    handle = io.StringIO(data.decode())
+    finished = any("NUMBER OF ELECTRONS" in line for line in handle.readlines())
+    handle.seek(0)
+    lines = handle.readlines()
+    return finished, [float(line.split()[4]) for line in lines[2:-4]]
+
+
+def best_of(func, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--max-exponent", type=int, default=6)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'rows':>10} {'MB':>8} {'parse_acf [s]':>14} {'legacy [s]':>11}")
+    for exponent in range(2, args.max_exponent + 1):
+        num_atoms = 10**exponent
+        text = io.StringIO()
+        write_acf(text, num_atoms)
+        data = text.getvalue().encode()
+        new = best_of(lambda: parse_acf(io.BytesIO(data)), args.repeat)
+        legacy = best_of(lambda: parse_acf_legacy(data), args.repeat)
+        print(f"{num_atoms:>10} {len(data) / 1e6:>8.1f} {new:>14.4f} {legacy:>11.4f}")
+
+
+if __name__ == "__main__":
+    main()
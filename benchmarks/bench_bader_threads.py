@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+"""Scaling of the bader executable with the number of OpenMP threads on a synthetic cube.
+
+Run with ``python benchmarks/bench_bader_threads.py --bader /path/to/bader``.
+"""
+import argparse
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+
+import numpy as np
+
+from aiida_bader.calculations import get_default_num_threads
+from aiida_bader.testing import synthetic_density, write_cube
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--bader", default=shutil.which("bader") or "bader")
+    parser.add_argument("--grid", type=int, default=200)
+    parser.add_argument("--max-threads", type=int, default=os.cpu_count())
+    parser.add_argument("--algorithm", default="neargrid")
+    args = parser.parse_args()
+
+    shape = (args.grid,) * 3
+    cell = np.eye(3) * 20.0
+    positions = [[5.0, 5.0, 5.0], [10.0, 12.0, 9.0], [15.0, 6.0, 14.0]]
+    with tempfile.TemporaryDirectory() as workdir:
+        with open(os.path.join(workdir, "charge_density.cube"), "w") as handle:
+            density = synthetic_density(shape, positions, cell, dtype=np.float32)
+            write_cube(handle, density, positions, [8, 8, 8], cell)
+        del density
+
+        print(
+            f"grid {shape}, default threads: {get_default_num_threads(np.prod(shape))}"
+        )
+        print(f"{'threads':>8} {'time [s]':>9} {'speedup':>8} {'efficiency':>10}")
+        serial = None
+        for num_threads in range(1, args.max_threads + 1):
+            env = dict(os.environ, OMP_NUM_THREADS=str(num_threads))
+            start = time.perf_counter()
+            subprocess.run(
+                [args.bader, "charge_density.cube", "-b", args.algorithm],
+                cwd=workdir,
+                env=env,
+                check=True,
+                capture_output=True,
+            )
+            elapsed = time.perf_counter() - start
+            serial = serial or elapsed
+            speedup = serial / elapsed
+            print(
+                f"{num_threads:>8} {elapsed:>9.3f} {speedup:>8.2f} {speedup / num_threads:>10.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
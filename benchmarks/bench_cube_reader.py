@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+"""Throughput and peak memory of the cube reader on synthetic 200^3 and 400^3 cubes.
+
+Run with ``python benchmarks/bench_cube_reader.py [--grids 200 400]``.
+"""
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+from aiida_bader.cube import read_cube, read_cube_header
+from aiida_bader.testing import synthetic_density, write_cube
+
+
+def read_cube_naive(handle):
+    """Split the whole file into Python strings, as a generic parser does."""
+    header = read_cube_header(handle)
+    return header, np.array(handle.read().split(), dtype=float).reshape(header["shape"])
+
+
+def measure(func):
+    tracemalloc.start()
+    start = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--grids", type=int, nargs="+", default=[200, 400])
+    parser.add_argument(
+        "--naive", action="store_true", help="also run the naive reader (slow)"
+    )
+    args = parser.parse_args()
+
+    cell = np.eye(3) * 20.0
+    positions = [[5.0, 5.0, 5.0], [10.0, 12.0, 9.0]]
+    with tempfile.TemporaryDirectory() as workdir:
+        for grid in args.grids:
+            path = os.path.join(workdir, f"density_{grid}.cube")
+            with open(path, "w") as handle:
+                density = synthetic_density(
+                    (grid,) * 3, positions, cell, dtype=np.float32
+                )
+                write_cube(handle, density, positions, [8, 8], cell)
+            del density
+            size = os.path.getsize(path) / 1e6
+
+            cases = {
+                "header only": lambda: read_cube_header(open(path)),
+                "float64": lambda: read_cube(open(path, "rb")),
+                "float32": lambda: read_cube(open(path, "rb"), dtype=np.float32),
+                "float32 memmap": lambda: read_cube(
+                    open(path, "rb"),
+                    dtype=np.float32,
+                    memmap=os.path.join(workdir, "density.raw"),
+                ),
+            }
+            if args.naive:
+                cases["naive split"] = lambda: read_cube_naive(open(path))
+
+            print(f"grid {grid}^3, {size:.0f} MB")
+            print(f"{'reader':>16} {'time [s]':>9} {'MB/s':>8} {'peak [MB]':>10}")
+            for name, func in cases.items():
+                elapsed, peak = measure(func)
+                print(
+                    f"{name:>16} {elapsed:>9.3f} {size / elapsed:>8.1f} {peak / 1e6:>10.1f}"
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+"""Overhead of the ``QeBaderWorkChain`` on the engine, the database and the repository.
+
+Batches of workflows run concurrently in this interpreter against the default profile,
+with the mock pw.x, pp.x and bader of ``aiida_bader.mock`` on a ``core.direct``
+computer, so that the timings are those of AiiDA and of the plugins and not of the
+codes. For each batch size the script reports the wall time, the median and 95th
+percentile of the duration of each stage, from the creation to the last modification
+of its node, and the growth of the database, of the repository and of the remote
+working directory. Run with::
+
+    python benchmarks/bench_workflow_overhead.py --batches 1 10 100 --json overhead.json
+
+Use a throwaway profile: every batch adds its nodes, files and remote folders.
+"""
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+
+import numpy as np
+from aiida import load_profile, orm
+from aiida.manage import get_manager
+from ase.build import bulk
+
+from aiida_bader import mock
+from aiida_bader.workchains import QeBaderWorkChain
+
+STAGES = [
+    "QeBaderWorkChain",
+    "PwBaseWorkChain",
+    "PwCalculation",
+    "PpCalculation",
+    "BaderBaseWorkChain",
+    "BaderCalculation",
+]
+
+# the pp.x parameters as given by the QE app
+OVERRIDES = {
+    "pp_valence": {"parameters": {"INPUTPP": {"plot_num": 0}, "PLOT": {"iflag": 3}}},
+    "pp_all": {"parameters": {"INPUTPP": {"plot_num": 21}, "PLOT": {"iflag": 3}}},
+}
+
+
+def directory_size(path):
+    """Return the total size in bytes of the files below ``path``."""
+    total = 0
+    for dirpath, _, filenames in os.walk(path):
+        for filename in filenames:
+            try:
+                total += os.lstat(os.path.join(dirpath, filename)).st_size
+            except OSError:
+                pass
+    return total
+
+
+def storage_snapshot(storage_path, workdir):
+    """Return the number of entities, and the size of the storage and of ``workdir``."""
+    storage = get_manager().get_profile_storage()
+    entities = storage.get_info()["entities"]
+    return {
+        "nodes": entities["Nodes"]["count"],
+        "links": entities["Links"]["count"],
+        "logs": entities["Logs"]["count"],
+        "storage_bytes": directory_size(storage_path) if storage_path else 0,
+        "remote_bytes": directory_size(workdir),
+    }
+
+
+def get_storage_path(profile):
+    """Return the folder of the database and repository of ``profile``, if local."""
+    config = profile.storage_config
+    if "filepath" in config:
+        return config["filepath"]
+    if config.get("repository_uri", "").startswith("file://"):
+        return config["repository_uri"][len("file://") :]
+    return None
+
+
+def stage_durations(roots):
+    """Return the durations in seconds of the processes called by ``roots``, by label."""
+    durations = {}
+    for root in roots:
+        for node in [root] + root.called_descendants:
+            durations.setdefault(node.process_label, []).append(node.mtime - node.ctime)
+    return {
+        label: np.array([delta.total_seconds() for delta in deltas])
+        for label, deltas in durations.items()
+    }
+
+
+def run_batch(builder, size):
+    """Run ``size`` copies of ``builder`` concurrently and return their nodes."""
+    runner = get_manager().create_runner(communicator=None)
+    processes = [runner.instantiate_process(builder) for _ in range(size)]
+    runner.loop.run_until_complete(
+        asyncio.gather(*(process.step_until_terminated() for process in processes))
+    )
+    return [process.node for process in processes]
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--batches", type=int, nargs="+", default=[1, 10, 100])
+    parser.add_argument("--grid", type=int, default=mock.DEFAULT_GRID)
+    parser.add_argument("--profile", default=None)
+    parser.add_argument("--workdir", default=None)
+    parser.add_argument("--json", default=None, help="write the results to this file")
+    args = parser.parse_args()
+
+    profile = load_profile(args.profile)
+    workdir = args.workdir or tempfile.mkdtemp(prefix="aiida-bader-mock-")
+    computer = mock.setup_mock_computer("aiida-bader-mock-overhead", workdir)
+    workdir = computer.get_workdir().split("{username}")[0]
+    codes = mock.setup_mock_codes(
+        computer,
+        tempfile.mkdtemp(),
+        grid=args.grid,
+        label_prefix=f"mock-grid{args.grid}",
+    )
+    family = mock.create_pseudo_family(
+        "aiida-bader-mock-family", ["Na", "Cl"], tempfile.mkdtemp()
+    )
+    builder = QeBaderWorkChain.get_builder_from_protocol(
+        codes["pw"],
+        codes["pp"],
+        codes["bader"],
+        orm.StructureData(ase=bulk("NaCl", "rocksalt", a=5.6)),
+        overrides={"scf": {"pseudo_family": family.label}, **OVERRIDES},
+    )
+    storage_path = get_storage_path(profile)
+
+    results = []
+    print(f"grid {args.grid}^3, profile {profile.name}, remote {workdir}")
+    for size in args.batches:
+        before = storage_snapshot(storage_path, workdir)
+        start = time.perf_counter()
+        roots = run_batch(builder, size)
+        wall_time = time.perf_counter() - start
+        after = storage_snapshot(storage_path, workdir)
+
+        growth = {key: (after[key] - before[key]) / size for key in before}
+        durations = stage_durations(roots)
+        result = {
+            "batch": size,
+            "failed": sum(not root.is_finished_ok for root in roots),
+            "wall_time": wall_time,
+            "throughput": size / wall_time,
+            "per_workflow": growth,
+            "stages": {
+                label: {
+                    "median": float(np.median(values)),
+                    "p95": float(np.percentile(values, 95)),
+                }
+                for label, values in durations.items()
+            },
+        }
+        results.append(result)
+
+        print(
+            f"\nbatch {size}: {wall_time:.1f} s, {result['throughput']:.2f} workflows/s, "
+            f"{result['failed']} failed"
+        )
+        print(f"{'stage':>20} {'median [s]':>11} {'p95 [s]':>9}")
+        for label in STAGES:
+            if label in result["stages"]:
+                stage = result["stages"][label]
+                print(f"{label:>20} {stage['median']:>11.2f} {stage['p95']:>9.2f}")
+        print(
+            f"per workflow: {growth['nodes']:.0f} nodes, {growth['links']:.0f} links, "
+            f"{growth['logs']:.0f} logs, {growth['storage_bytes'] / 1e3:.0f} kB "
+            f"storage, {growth['remote_bytes'] / 1e3:.0f} kB remote"
+        )
+
+    if args.json:
+        with open(args.json, "w", encoding="utf8") as handle:
+            json.dump({"grid": args.grid, "results": results}, handle, indent=2)
+
+
+if __name__ == "__main__":
+    main()
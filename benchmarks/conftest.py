@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+"""Fixtures of the pytest-benchmark suite.
+
+The suite runs offline against the default AiiDA profile, with codes on the
+``localhost`` computer that are never run and synthetic pseudopotentials. Run it with::
+
+    pytest benchmarks
+
+The results are saved as JSON in ``.benchmarks/``, see ``benchmarks/pytest.ini``, and
+two runs are compared with ``pytest-benchmark compare 0001 0002``.
+"""
+import io
+
+import pytest
+from aiida import load_profile, orm
+from ase.build import bulk
+from ase.data import atomic_numbers, chemical_symbols
+
+from aiida_bader.testing import write_upf
+
+load_profile()
+
+# One pseudopotential per element up to Rn, about the size of the SSSP and PSL libraries.
+ELEMENTS = chemical_symbols[1:87]
+PSEUDO_GROUP = "aiida_bader_benchmark"
+PSEUDO_FAMILY = "aiida_bader_benchmark_family"
+
+
+def _get_code(label, plugin):
+    """Return the code ``label`` on localhost, creating it if needed."""
+    try:
+        return orm.load_code(f"{label}@localhost")
+    except Exception:  # pylint: disable=broad-except
+        return orm.InstalledCode(
+            label=label,
+            computer=orm.load_computer("localhost"),
+            filepath_executable="/bin/true",
+            default_calc_job_plugin=plugin,
+        ).store()
+
+
+@pytest.fixture(scope="session")
+def codes():
+    """The pw.x, pp.x and bader codes."""
+    return {
+        "pw_code": _get_code("benchmark-pw", "quantumespresso.pw"),
+        "pp_code": _get_code("benchmark-pp", "quantumespresso.pp"),
+        "bader_code": _get_code("benchmark-bader", "bader.bader"),
+    }
+
+
+def _upf_data(element):
+    handle = io.StringIO()
+    write_upf(handle, element, min(atomic_numbers[element], 18))
+    return io.BytesIO(handle.getvalue().encode())
+
+
+@pytest.fixture(scope="session")
+def pseudo_group():
+    """A group with one ``UpfData`` per element, labelled by the element."""
+    from aiida_pseudo.data.pseudo import UpfData
+
+    group, created = orm.Group.collection.get_or_create(PSEUDO_GROUP)
+    if created:
+        pseudos = []
+        for element in ELEMENTS:
+            pseudo = UpfData(_upf_data(element), filename=f"{element}.upf")
+            pseudo.label = element
+            pseudos.append(pseudo.store())
+        group.add_nodes(pseudos)
+    return group
+
+
+@pytest.fixture(scope="session")
+def pseudo_family(tmp_path_factory):
+    """A pseudopotential family with cutoffs, as needed by the protocols."""
+    from aiida_pseudo.data.pseudo import UpfData
+    from aiida_pseudo.groups.family import CutoffsPseudoPotentialFamily
+
+    try:
+        return orm.load_group(PSEUDO_FAMILY)
+    except Exception:  # pylint: disable=broad-except
+        pass
+    dirpath = tmp_path_factory.mktemp("pseudos")
+    for element in ELEMENTS:
+        (dirpath / f"{element}.upf").write_bytes(_upf_data(element).getvalue())
+    family = CutoffsPseudoPotentialFamily.create_from_folder(
+        dirpath, PSEUDO_FAMILY, pseudo_type=UpfData
+    )
+    cutoffs = {
+        element: {"cutoff_wfc": 50.0, "cutoff_rho": 400.0} for element in ELEMENTS
+    }
+    family.set_cutoffs(cutoffs, "standard", unit="Ry")
+    return family
+
+
+def make_structure(num_kinds, repeat=1):
+    """Return a rocksalt-like ``StructureData`` with ``num_kinds`` elements."""
+    atoms = bulk("NaCl", "rocksalt", a=5.6, cubic=True).repeat(repeat)
+    symbols = [ELEMENTS[index % num_kinds] for index in range(len(atoms))]
+    atoms.set_chemical_symbols(symbols)
+    return orm.StructureData(ase=atoms)
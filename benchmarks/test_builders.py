@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+"""Benchmarks of the construction of the inputs of the workflows."""
+import pytest
+from aiida import orm
+from conftest import PSEUDO_FAMILY, PSEUDO_GROUP, make_structure
+
+from aiida_bader.utils import load_pseudos
+from aiida_bader.workchains import QeBaderWorkChain
+from aiida_bader.workgraph.qe_bader import bader_workgraph
+
+
+@pytest.mark.parametrize("repeat", [1, 3])
+def test_get_builder_from_protocol(benchmark, codes, pseudo_family, repeat):
+    structure = make_structure(2, repeat)
+    # the pp.x parameters as given by the QE app
+    overrides = {
+        "scf": {"pseudo_family": PSEUDO_FAMILY},
+        "pp_valence": {
+            "parameters": {"INPUTPP": {"plot_num": 0}, "PLOT": {"iflag": 3}}
+        },
+        "pp_all": {"parameters": {"INPUTPP": {"plot_num": 21}, "PLOT": {"iflag": 3}}},
+    }
+
+    builder = benchmark(
+        QeBaderWorkChain.get_builder_from_protocol,
+        structure=structure,
+        overrides=overrides,
+        **codes,
+    )
+    assert set(builder.scf.pw.pseudos) == {kind.name for kind in structure.kinds}
+
+
+@pytest.mark.parametrize("reference_density", ["pp", "core"])
+def test_bader_workgraph(benchmark, codes, pseudo_group, reference_density):
+    structure = make_structure(2)
+    pseudos = load_pseudos(structure, PSEUDO_GROUP)
+
+    wg = benchmark(
+        bader_workgraph,
+        structure=structure,
+        parameters=orm.Dict({"SYSTEM": {"ecutwfc": 30, "ecutrho": 240}}),
+        pseudos=pseudos,
+        reference_density=reference_density,
+        cube_code=codes["pw_code"],
+        cleanup="keep_density",
+        **codes,
+    )
+    assert "bader" in [task.name for task in wg.tasks]
+
+
+@pytest.mark.parametrize("num_kinds", [2, 8, 32])
+def test_load_pseudos(benchmark, pseudo_group, num_kinds):
+    structure = make_structure(num_kinds, 2)
+
+    pseudos = benchmark(load_pseudos, structure, PSEUDO_GROUP)
+    assert len(pseudos) == num_kinds
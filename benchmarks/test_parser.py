@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+"""Benchmarks of the ``BaderParser`` on synthetic ACF.dat files of increasing size."""
+import io
+
+import pytest
+from aiida import orm
+from aiida.common.links import LinkType
+
+from aiida_bader.parsers import BaderParser, parse_acf
+from aiida_bader.testing import write_acf
+
+SIZES = [10, 1_000, 100_000]
+
+
+def _acf_data(num_atoms):
+    handle = io.StringIO()
+    write_acf(handle, num_atoms)
+    return handle.getvalue().encode()
+
+
+@pytest.mark.parametrize("num_atoms", SIZES)
+def test_parse_acf(benchmark, num_atoms):
+    data = _acf_data(num_atoms)
+    columns, _ = benchmark(lambda: parse_acf(io.BytesIO(data)))
+    assert len(columns["charge"]) == num_atoms
+
+
+@pytest.mark.parametrize("num_atoms", SIZES)
+def test_bader_parser(benchmark, num_atoms):
+    node = orm.CalcJobNode(
+        computer=orm.load_computer("localhost"),
+        process_type="aiida.calculations:bader.bader",
+    )
+    node.set_option("resources", {"num_machines": 1})
+    node.store()
+    retrieved = orm.FolderData()
+    retrieved.base.repository.put_object_from_bytes(_acf_data(num_atoms), "ACF.dat")
+    retrieved.base.links.add_incoming(node, LinkType.CREATE, "retrieved")
+    retrieved.store()
+
+    results, calcfunction = benchmark(
+        BaderParser.parse_from_node, node, store_provenance=False
+    )
+    assert calcfunction.is_finished_ok
+    assert len(results["bader_charge"].get_array("charge")) == num_atoms
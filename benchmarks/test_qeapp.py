@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+"""Benchmarks of the shaping of the results in the QE app plugin.
+
+They are skipped if ``aiidalab_qe`` is not installed.
+"""
+import numpy as np
+import pytest
+from aiida import orm
+from aiida.common.links import LinkType
+from conftest import PSEUDO_GROUP, make_structure
+
+from aiida_bader.utils import load_pseudos
+
+pytest.importorskip("aiidalab_qe")
+
+SIZES = [(2, 1), (8, 2), (8, 4)]  # (kinds, repetitions): 8, 64 and 512 atoms
+
+
+def _results_process(structure, pseudos):
+    """Return a process node with the inputs and outputs that the results model reads."""
+    root = orm.WorkflowNode(process_type="aiida.workflows:quantumespresso.qeapp")
+    child = orm.WorkflowNode(process_type="aiida.workflows:bader.qe")
+    child.set_process_label("QeBaderWorkChain")
+    root.base.links.add_incoming(
+        structure.store(), LinkType.INPUT_WORK, "bader__structure"
+    )
+    for kind, pseudo in pseudos.items():
+        root.base.links.add_incoming(
+            pseudo, LinkType.INPUT_WORK, f"bader__scf__pw__pseudos__{kind}"
+        )
+    root.store()
+    child.base.links.add_incoming(root, LinkType.CALL_WORK, "bader")
+    child.store()
+
+    charges = orm.ArrayData()
+    charges.set_array("charge", np.linspace(0.5, 8.0, len(structure.sites)))
+    charges.store()
+    charges.base.links.add_incoming(child, LinkType.RETURN, "bader__bader_charge")
+    charges.base.links.add_incoming(root, LinkType.RETURN, "bader__bader__bader_charge")
+    return root
+
+
+@pytest.fixture(params=SIZES, ids=lambda size: f"{size[0]}kinds-x{size[1]}")
+def results_model(request, pseudo_group):
+    from aiida_bader.qeapp.result.model import BaderResultsModel
+
+    structure = make_structure(*request.param)
+    root = _results_process(structure, load_pseudos(structure, PSEUDO_GROUP))
+    model = BaderResultsModel()
+    model.process_uuid = root.uuid
+    return model
+
+
+def test_fetch_result(benchmark, results_model):
+    def fetch():
+        results_model.z_valencces = {}
+        results_model.fetch_result()
+
+    benchmark(fetch)
+    assert len(results_model.bader_charges) == len(results_model.structure.sites)
+
+
+def test_update_query(benchmark, results_model):
+    from table_widget import TableWidget
+
+    from aiida_bader.qeapp.result.panel import PAGE_SIZES, BaderResultsPanel
+
+    # the state of ``BaderResultsPanel._render`` without the structure viewer
+    # pylint: disable=protected-access
+    results_model.fetch_result()
+    panel = BaderResultsPanel(model=results_model)
+    panel._table = results_model.get_charge_table()
+    panel._indices = panel._table.site_index
+    panel._page = 0
+    panel.result_table = TableWidget(config={"pageSize": PAGE_SIZES[1]})
+    panel.aggregate_table = TableWidget()
+    panel._setup_controls()
+
+    benchmark(panel._update_query)
+    num_sites = len(results_model.structure.sites)
+    page_size = panel.page_size.value
+    assert len(panel.result_table.data) == min(num_sites, page_size)
+
+    last_page = (num_sites - 1) // page_size
+    panel._set_page(last_page)
+    assert panel._page == last_page
+    assert len(panel.result_table.data) == num_sites - last_page * page_size
@@ -22,10 +22,19 @@ def setup_code():
 
 
 @cli.command(help="Import the PAW pseudopotentials into the AiiDA database.")
-def setup_pseudos():
+@click.option(
+    "--archive-dir",
+    type=click.Path(exists=True, file_okay=False),
+    default=None,
+    envvar="AIIDA_BADER_PSEUDO_DIR",
+    help="Directory of the <group>.aiida archives, which are used instead of "
+    "downloading them.",
+)
+@click.argument("groups", nargs=-1)
+def setup_pseudos(archive_dir, groups):
 
     load_profile()
-    install_pseudos()
+    install_pseudos(groups or None, archive_dir=archive_dir)
 
 
 @cli.command(
@@ -40,5 +49,95 @@ def post_install():
     install_pseudos()
 
 
+@cli.command(
+    help="Write the timing of the stages of a finished workflow PK as a JSON trace, "
+    "which can be opened with Perfetto or chrome://tracing."
+)
+@click.argument("pk", type=int)
+@click.option(
+    "-o",
+    "--output",
+    type=click.File("w"),
+    default="-",
+    help="File to write the trace to, the standard output by default.",
+)
+def trace(pk, output):
+    import json
+
+    from aiida.orm import load_node
+
+    from aiida_bader.timing import TIMING_EXTRA, get_trace, get_workflow_timing
+
+    load_profile()
+    node = load_node(pk)
+    timing = node.base.extras.get(TIMING_EXTRA, None)
+    if timing is None or "stages" not in timing:
+        timing = get_workflow_timing(node)
+    json.dump(get_trace(timing), output, indent=1)
+
+
+@cli.command(
+    help="Show the counts by exit status, the wall and queue times per stage, the "
+    "failures and the daily throughput of the QeBaderWorkChain runs."
+)
+@click.option("-G", "--group", default=None, help="Only the work chains in this group.")
+@click.option(
+    "--since",
+    type=click.DateTime(),
+    default=None,
+    help="Only the work chains created at or after this date.",
+)
+@click.option(
+    "--until",
+    type=click.DateTime(),
+    default=None,
+    help="Only the work chains created before this date.",
+)
+@click.option(
+    "-d",
+    "--days",
+    type=int,
+    default=None,
+    help="Only the work chains created in the last DAYS days, instead of --since.",
+)
+@click.option(
+    "-f",
+    "--format",
+    "output_format",
+    type=click.Choice(["table", "json", "csv"]),
+    default="table",
+)
+@click.option(
+    "-o",
+    "--output",
+    type=click.File("w"),
+    default="-",
+    help="File to write to, the standard output by default.",
+)
+def stats(group, since, until, days, output_format, output):
+    import datetime
+    import json
+
+    from aiida.common import timezone
+
+    from aiida_bader.stats import format_stats, get_stats, write_stats_csv
+
+    load_profile()
+    if days is not None:
+        since = timezone.now() - datetime.timedelta(days=days)
+    # the dates of the options are in local time
+    since, until = (
+        None if value is None or value.tzinfo else timezone.make_aware(value)
+        for value in (since, until)
+    )
+    result = get_stats(group=group, since=since, until=until)
+    if output_format == "json":
+        json.dump(result, output, indent=1)
+    elif output_format == "csv":
+        write_stats_csv(result, output)
+    else:
+        click.echo(format_stats(result), file=output)
+
+
 if __name__ == "__main__":
     cli()
@@ -3,11 +3,235 @@
 from __future__ import absolute_import
 
 import os
+import shlex
 from collections import OrderedDict
 
 from aiida.common import CalcInfo, CodeInfo
+from aiida.common.escaping import escape_for_bash
 from aiida.engine import CalcJob
-from aiida.orm import Dict, RemoteData, StructureData, ArrayData, Str
+from aiida.orm import (
+    ArrayData,
+    Bool,
+    Dict,
+    Float,
+    CalcJobNode,
+    InstalledCode,
+    QueryBuilder,
+    RemoteData,
+    Str,
+    StructureData,
+)
+from aiida.orm.nodes.process.calculation.calcjob import CalcJobNodeCaching
+from aiida_pseudo.data.pseudo import UpfData
+
+
+ALGORITHMS = ("ongrid", "neargrid", "weight")
+PRINT_MODES = (
+    "all_atom",
+    "all_bader",
+    "sel_atom",
+    "sel_bader",
+    "sum_atom",
+    "sum_bader",
+    "atom_index",
+    "bader_index",
+)
+PARTITIONS = ("bader", "voronoi")
+TERMINATIONS = ("known", "pass")
+
+# Number of grid points per OpenMP thread below which adding threads does not pay off.
+POINTS_PER_THREAD = 2_000_000
+
+# Shell snippet that sets OMP_NUM_THREADS at runtime from the grid in the cube header.
+_AUTO_THREADS_TEXT = """\
+# one OpenMP thread per {points} grid points, up to the available cores
+_bader_points=$(sed -n '4,6p' {cube} | awk '{{n = $1 < 0 ? -$1 : $1; p = NR == 1 ? n : p * n}} END {{print p}}')
+_bader_threads=$(( (_bader_points + {points} - 1) / {points} ))
+[ "$_bader_threads" -gt "$(nproc)" ] && _bader_threads=$(nproc)
+[ "$_bader_threads" -lt 1 ] && _bader_threads=1
+export OMP_NUM_THREADS=$_bader_threads"""
+
+# Shell snippets that record when the job ran and the size of the cube files it read,
+# see ``aiida_bader.parsers.parse_timing``.
+_TIMING_START_TEXT = 'echo "start $(date +%s.%N)" > {filename}'
+_TIMING_CUBE_TEXT = (
+    'echo "cube {cube} {transfer} $([ -e {cube} ] && wc -c < {cube})" >> {filename}'
+)
+_TIMING_END_TEXT = 'echo "end $(date +%s.%N)" >> {filename}'
+
+
+DIGEST_MODES = ("full", "sampled", "off")
+# The extra with the digests of the charge densities of a ``BaderCalculation``.
+DIGEST_EXTRA = "density_digests"
+
+# The sampled digest hashes the file size and this many blocks spread over the file.
+DIGEST_BLOCK_SIZE = 2**16
+DIGEST_SAMPLES = 64
+
+_SAMPLED_DIGEST_COMMAND = """\
+size=$(wc -c < {path}) || exit 1
+blocks=$(( size / {block} + 1 ))
+{{ echo "$size"; i=0; while [ $i -lt {samples} ]; do \
+dd if={path} bs={block} skip=$(( blocks * i / {samples} )) count=1 2>/dev/null; \
+i=$(( i + 1 )); done; }} | sha256sum"""
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def validate_parameters(value, _):
+    """Validate the ``parameters`` input of the ``BaderCalculation``."""
+    if value is None:
+        return None
+    parameters = value.get_dict()
+    unknown = set(parameters) - {
+        "algorithm",
+        "refine_edge",
+        "vacuum",
+        "print",
+        "calculate",
+        "no_calculate",
+        "termination",
+    }
+    if unknown:
+        return f"Unknown bader parameters: {sorted(unknown)}"
+    if parameters.get("algorithm", ALGORITHMS[0]) not in ALGORITHMS:
+        return f"`algorithm` must be one of {ALGORITHMS}"
+    refine_edge = parameters.get("refine_edge", "auto")
+    if refine_edge != "auto" and not isinstance(refine_edge, int):
+        return "`refine_edge` must be `auto` or a number of iterations"
+    vacuum = parameters.get("vacuum", "off")
+    if vacuum not in ("off", "auto") and not _is_number(vacuum):
+        return "`vacuum` must be `off`, `auto` or a density threshold"
+    for mode in parameters.get("print", []):
+        name = mode[0] if isinstance(mode, (list, tuple)) else mode
+        if name not in PRINT_MODES:
+            return f"print mode `{name}` is not one of {PRINT_MODES}"
+        if isinstance(mode, (list, tuple)) and not name.startswith("sel_"):
+            return f"print mode `{name}` does not take indices"
+    for key in ("calculate", "no_calculate"):
+        for partition in parameters.get(key, []):
+            if partition not in PARTITIONS:
+                return f"`{key}` entries must be one of {PARTITIONS}"
+    if parameters.get("termination", TERMINATIONS[0]) not in TERMINATIONS:
+        return f"`termination` must be one of {TERMINATIONS}"
+    return None
+
+
+def get_default_num_threads(num_points, max_threads=None):
+    """Return the number of OpenMP threads for a grid with ``num_points`` points.
+
+    :param num_points: the number of points of the charge-density grid.
+    :param max_threads: optional upper limit, e.g. the number of available cores.
+    """
+    num_threads = max(1, -(-num_points // POINTS_PER_THREAD))
+    if max_threads is not None:
+        num_threads = min(num_threads, max_threads)
+    return num_threads
+
+
+def get_cmdline_params(parameters):
+    """Convert the ``parameters`` dictionary to bader command line options.
+
+    The supported keys are:
+
+    * ``algorithm``: ``ongrid``, ``neargrid`` or ``weight`` (``-b``).
+    * ``refine_edge``: ``auto`` or a number of iterations (``-r``).
+    * ``vacuum``: ``off``, ``auto`` or a density threshold (``-vac``).
+    * ``print``: list of print modes (``-p``). The ``sel_atom`` and ``sel_bader`` modes
+      are given as a list ``[mode, index, ...]``.
+    * ``calculate``/``no_calculate``: list of ``bader`` and ``voronoi`` (``-c``/``-n``).
+    * ``termination``: ``known`` or ``pass``, how the ascent trajectories end (``-m``).
+    """
+    params = []
+    if "algorithm" in parameters:
+        params.extend(["-b", parameters["algorithm"]])
+    if "refine_edge" in parameters:
+        params.extend(["-r", str(parameters["refine_edge"])])
+    if "vacuum" in parameters:
+        params.extend(["-vac", str(parameters["vacuum"])])
+    for mode in parameters.get("print", []):
+        if isinstance(mode, (list, tuple)):
+            params.extend(["-p"] + [str(item) for item in mode])
+        else:
+            params.extend(["-p", mode])
+    for partition in parameters.get("calculate", []):
+        params.extend(["-c", partition])
+    for partition in parameters.get("no_calculate", []):
+        params.extend(["-n", partition])
+    if "termination" in parameters:
+        params.extend(["-m", parameters["termination"]])
+    return params
+
+
+def validate_inputs(inputs, _):
+    """Validate the top-level inputs of the ``BaderCalculation``."""
+    if not inputs.get("reference_pseudos"):
+        return None
+    if "reference_charge_density_folder" in inputs:
+        return (
+            "Either a `reference_charge_density_folder` or the `reference_pseudos` can "
+            "be given, not both."
+        )
+    if "reference_code" not in inputs or "structure" not in inputs:
+        return "The `reference_code` and the `structure` are required by the `reference_pseudos`."
+    if inputs["reference_code"].computer.uuid != inputs["code"].computer.uuid:
+        return "The `reference_code` must be on the computer of the `code`."
+    return None
+
+
+def _get_digest_command(path, mode):
+    """Return the shell command that prints the digest of ``path`` first."""
+    quoted = shlex.quote(path)
+    if mode == "full":
+        return f"sha256sum {quoted}"
+    return _SAMPLED_DIGEST_COMMAND.format(
+        path=quoted, block=DIGEST_BLOCK_SIZE, samples=DIGEST_SAMPLES
+    )
+
+
+def _parse_digest(path, retval, stdout, stderr):
+    """Return the digest from the output of the command of ``_get_digest_command``."""
+    if retval != 0 or not stdout.strip():
+        raise OSError(f"Could not compute the digest of {path}: {stderr}")
+    return stdout.split()[0]
+
+
+def get_density_digest(transport, path, mode="full"):
+    """Return the SHA-256 digest of the remote file ``path``, computed on the remote.
+
+    :param transport: an open transport to the computer of the file.
+    :param mode: ``full`` hashes the whole file. ``sampled`` hashes the file size and
+        ``DIGEST_SAMPLES`` blocks spread over the file, the first of which holds the cube
+        header, so it reads a few MB at most, but misses changes in the other blocks.
+    :raise OSError: if the digest could not be computed.
+    """
+    command = _get_digest_command(path, mode)
+    return _parse_digest(path, *transport.exec_command_wait(command))
+
+
+async def get_density_digest_async(transport, path, mode="full"):
+    """Return the digest of the remote file ``path`` like ``get_density_digest``, but
+    without blocking the event loop while the remote computes it."""
+    command = _get_digest_command(path, mode)
+    return _parse_digest(path, *await transport.exec_command_wait_async(command))
+
+
+class BaderCalcJobNodeCaching(CalcJobNodeCaching):
+    """Hash a ``BaderCalculation`` node without its charge densities.
+
+    The remote folders and file names are left out of the hash, the densities are
+    compared by the digests in the ``density_digests`` extra instead, see
+    ``BaderCalculation.run``.
+    """
+
+    _hash_ignored_inputs = CalcJobNodeCaching._hash_ignored_inputs + [
+        "charge_density_folder",
+        "charge_density_filename",
+        "reference_charge_density_folder",
+        "reference_charge_density_filename",
+    ]
 
 
 class BaderCalculation(CalcJob):
@@ -16,6 +240,9 @@ class BaderCalculation(CalcJob):
     """
 
     _DEFAULT_OUTPUT_FILE = "ACF.dat"
+    _BASIN_FILE = "BCF.dat"
+    _ATOM_VOLUME_FILE = "AVF.dat"
+    _TIMING_FILE = "timing.txt"
 
     @classmethod
     def define(cls, spec):
@@ -50,12 +277,77 @@ class BaderCalculation(CalcJob):
             required=False,
             help="Name of the charge density file",
         )
+        spec.input_namespace(
+            "reference_pseudos",
+            valid_type=UpfData,
+            dynamic=True,
+            required=False,
+            help="Build the reference density in the job, before bader runs, by adding the "
+            "core densities of these pseudopotentials, one per kind of the `structure`, to "
+            "the charge density, instead of reading a `reference_charge_density_folder`.",
+        )
+        spec.input(
+            "reference_code",
+            valid_type=InstalledCode,
+            required=False,
+            help="Python code with NumPy, on the computer of the `code`, that builds the "
+            "reference density from the `reference_pseudos`. It is run without MPI in the "
+            "prepend text of the job.",
+        )
+        spec.input(
+            "reference_cutoff",
+            valid_type=Float,
+            required=False,
+            help="Radius in Bohr up to which the core densities of the `reference_pseudos` "
+            "are added. By default, where the core density becomes negligible.",
+        )
+        spec.input(
+            "parameters",
+            valid_type=Dict,
+            required=False,
+            validator=validate_parameters,
+            help="Options of the bader code, see `get_cmdline_params` for the supported keys",
+        )
+        spec.input(
+            "structure",
+            valid_type=StructureData,
+            required=False,
+            help="The structure of the charge density, used to sum the charges per element",
+        )
+        spec.input(
+            "retrieve_basins",
+            valid_type=Bool,
+            default=lambda: Bool(False),
+            required=False,
+            help="Retrieve BCF.dat and AVF.dat and parse them into the `bader_basins` output",
+        )
+        spec.input(
+            "metadata.options.num_threads",
+            valid_type=int,
+            required=False,
+            help="Number of OpenMP threads. Defaults to `num_cores_per_mpiproc` of the resources, "
+            "and if that is not set either, it is chosen at runtime from the grid size.",
+        )
+        spec.input(
+            "metadata.options.density_digest",
+            valid_type=str,
+            default="full",
+            validator=lambda value, _: None
+            if value in DIGEST_MODES
+            else f"`density_digest` must be one of {DIGEST_MODES}",
+            help="How the charge densities are hashed for caching, if caching is enabled: "
+            "`full` hashes the whole files, `sampled` only the size and blocks spread over "
+            "the files, which is faster for large files but can take densities that differ "
+            "elsewhere for the same, and `off` hashes the remote folders as for any other "
+            "calculation.",
+        )
         spec.inputs["metadata"]["options"]["parser_name"].default = "bader.bader"
         spec.inputs["metadata"]["options"]["resources"].default = {
             "num_machines": 1,
             "num_mpiprocs_per_machine": 1,
         }
         spec.inputs["metadata"]["options"]["withmpi"].default = False
+        spec.inputs.validator = validate_inputs
 
         #  exit codes
         spec.exit_code(
@@ -68,12 +360,109 @@ class BaderCalculation(CalcJob):
             "ERROR_NO_OUTPUT_FILE",
             message="The retrieved folder does not contain an output file.",
         )
+        spec.exit_code(
+            310,
+            "ERROR_INPUT_CUBE_MISSING",
+            message="A charge density cube file is missing.",
+        )
+        spec.exit_code(
+            311,
+            "ERROR_INPUT_CUBE_TRUNCATED",
+            message="A charge density cube file is truncated.",
+        )
+        spec.exit_code(
+            320,
+            "ERROR_OUTPUT_TRUNCATED",
+            message="The output file is truncated, bader was probably killed, e.g. for "
+            "running out of memory.",
+        )
         spec.output(
             "bader_charge",
             valid_type=ArrayData,
             required=True,
             help="Bader charges",
         )
+        spec.output(
+            "bader_basins",
+            valid_type=ArrayData,
+            required=False,
+            help="Bader basins and the basins of each atom, if `retrieve_basins` is set",
+        )
+
+    async def run(self):
+        """Take the outputs of a finished calculation on the same charge densities from
+        the cache, if caching is enabled.
+
+        The AiiDA cache compares the remote folders, so it only hits for the same folders.
+        The densities are hashed here by content instead, through the transport queue,
+        and stored in the ``density_digests`` extra, in which the earlier calculations
+        are looked up.
+        """
+        if (
+            self.node.exit_status is None
+            and not self.inputs.metadata.dry_run
+            and self.inputs.metadata.options.density_digest != "off"
+            and self.node.is_stored
+            and self.node.base.caching.should_use_cache()
+        ):
+            try:
+                digests = await self._get_density_digests(
+                    self.inputs.metadata.options.density_digest
+                )
+            except OSError as exc:
+                self.report(f"Warning: caching by remote folder, {exc}")
+            else:
+                self.node.base.extras.set(DIGEST_EXTRA, digests)
+                source = self._get_density_cache_source(digests)
+                if source is not None:
+                    self._take_from_cache(source)
+        return await super().run()
+
+    async def _get_density_digests(self, mode):
+        """Return the digests of the charge density and of the reference, if any."""
+        digests = {}
+        for name in ("charge_density", "reference_charge_density"):
+            if f"{name}_folder" not in self.inputs:
+                continue
+            remote_folder = self.inputs[f"{name}_folder"]
+            path = os.path.join(
+                remote_folder.get_remote_path(),
+                self.inputs[f"{name}_filename"].value,
+            )
+            authinfo = remote_folder.get_authinfo()
+            async with self.runner.transport.request_transport(authinfo) as request:
+                transport = await request
+                digests[name] = await get_density_digest_async(transport, path, mode)
+        return digests
+
+    def _get_density_cache_source(self, digests):
+        """Return a finished calculation with the same inputs and charge densities."""
+        node_hash = BaderCalcJobNodeCaching(self.node).compute_hash()
+        builder = QueryBuilder().append(
+            CalcJobNode,
+            filters={
+                "process_type": self.node.process_type,
+                "id": {"!==": self.node.pk},
+                f"extras.{DIGEST_EXTRA}.charge_density": digests["charge_density"],
+            },
+        )
+        for (node,) in builder.iterall():
+            if (
+                node.base.extras.get(DIGEST_EXTRA) == digests
+                and node.base.caching.is_valid_cache
+                and BaderCalcJobNodeCaching(node).compute_hash() == node_hash
+            ):
+                return node
+        return None
+
+    def _take_from_cache(self, source):
+        """Copy the outputs and the exit status of ``source``, as the AiiDA cache does."""
+        # pylint: disable=protected-access
+        self.node._add_outputs_from_cache(source)
+        self.node.set_exit_status(source.exit_status)
+        self.node.set_exit_message(source.exit_message)
+        self.node.base.extras.set(self.node.base.caching.CACHED_FROM_KEY, source.uuid)
+        self.report(f"Taken from the cache of {source.pk}, same charge densities")
 
     def prepare_for_submission(self, folder):
         """Create the input files from the input nodes passed
@@ -92,6 +481,12 @@ class BaderCalculation(CalcJob):
         calcinfo.retrieve_list = [
             self._DEFAULT_OUTPUT_FILE,
         ]
+        # The basin and timing files are only needed by the parser, so they are not stored
+        calcinfo.retrieve_temporary_list = [self._TIMING_FILE]
+        if self.inputs.retrieve_basins.value:
+            calcinfo.retrieve_temporary_list.extend(
+                [self._BASIN_FILE, self._ATOM_VOLUME_FILE]
+            )
 
         # Charge-density remote folder
         charge_density_folder = self.inputs.charge_density_folder
@@ -101,7 +496,7 @@ class BaderCalculation(CalcJob):
             self.inputs.charge_density_filename.value,
         )
         copy_infos = [(comp_uuid, remote_path, "charge_density.cube")]
-        if self.inputs.reference_charge_density_folder:
+        if "reference_charge_density_folder" in self.inputs:
             reference_charge_density_folder = (
                 self.inputs.reference_charge_density_folder
             )
@@ -111,12 +506,15 @@ class BaderCalculation(CalcJob):
                 self.inputs.reference_charge_density_filename.value,
             )
             copy_infos.append((comp_uuid, remote_path, "reference_charge_density.cube"))
+        transfers = {}
         for copy_info in copy_infos:
             if (
                 self.inputs.code.computer.uuid == copy_info[0]
             ):  # if running on the same computer - make a symlink
                 calcinfo.remote_symlink_list.append(copy_info)
+                transfers[copy_info[2]] = "symlink"
             else:  # if not - copy the folder
+                transfers[copy_info[2]] = "copy"
                 self.report(
                     f"Warning: Transferring cube file {charge_density_folder.get_remote_path()} from "
                     + f"computer {charge_density_folder.computer.label} to computer {self.inputs.code.computer.label}. "
@@ -124,11 +522,88 @@ class BaderCalculation(CalcJob):
                 )
                 calcinfo.remote_copy_list.append(copy_info)
 
+        reference_text = ""
+        if self.inputs.get("reference_pseudos"):
+            reference_text = self._get_reference_text(folder)
+            transfers["reference_charge_density.cube"] = "core_density"
+
         codeinfo = CodeInfo()
         codeinfo.cmdline_params = ["charge_density.cube"]
-        if self.inputs.reference_charge_density_folder:
+        if "reference_charge_density.cube" in transfers:
             codeinfo.cmdline_params.extend(["-ref", "reference_charge_density.cube"])
+        if "parameters" in self.inputs:
+            codeinfo.cmdline_params.extend(
+                get_cmdline_params(self.inputs.parameters.get_dict())
+            )
         codeinfo.code_uuid = self.inputs.code.uuid
         calcinfo.codes_info = [codeinfo]
+        calcinfo.prepend_text = self._get_prepend_text(reference_text)
+        calcinfo.append_text = self._get_timing_end_text(transfers)
 
         return calcinfo
+
+    def _get_reference_text(self, folder):
+        """Return the prepend text that writes the reference density in the working
+        directory, from the charge density and the core densities of the pseudos.
+
+        The script runs in a subshell, so that the prepend text of the ``reference_code``
+        does not change the environment of bader.
+        """
+        from aiida_bader.calculations.cube import write_core_density_script
+
+        code = self.inputs.reference_code
+        params = write_core_density_script(
+            folder,
+            self.inputs.structure,
+            self.inputs.reference_pseudos,
+            "charge_density.cube",
+            "reference_charge_density.cube",
+        )
+        if "reference_cutoff" in self.inputs:
+            params.extend(["--cutoff", str(self.inputs.reference_cutoff.value)])
+        command = " ".join(
+            escape_for_bash(str(value)) for value in [code.get_executable(), *params]
+        )
+        lines = ["# build the reference density from the core densities", "("]
+        if code.prepend_text:
+            lines.append(code.prepend_text)
+        lines.extend([command, ")"])
+        return "\n".join(lines)
+
+    def _get_prepend_text(self, reference_text=""):
+        """Return the prepend text that records the start of the job, runs the
+        ``reference_text`` if any, and sets the threads."""
+        start = _TIMING_START_TEXT.format(filename=self._TIMING_FILE)
+        return "\n".join(
+            text for text in (start, reference_text, self._get_threads_text()) if text
+        )
+
+    def _get_timing_end_text(self, transfers):
+        """Return the append text that records the end of the job and the cube sizes.
+
+        :param transfers: mapping of the cube files to how they got to the working
+            directory, e.g. ``symlink`` or ``copy``.
+        """
+        lines = [
+            _TIMING_CUBE_TEXT.format(
+                cube=cube, transfer=transfer, filename=self._TIMING_FILE
+            )
+            for cube, transfer in transfers.items()
+        ]
+        lines.append(_TIMING_END_TEXT.format(filename=self._TIMING_FILE))
+        return "\n".join(lines)
+
+    def _get_threads_text(self):
+        """Return the prepend text that sets the number of OpenMP threads of bader."""
+        options = self.inputs.metadata.options
+        num_cores = options.resources.get("num_cores_per_mpiproc")
+        num_threads = options.get("num_threads", num_cores)
+        if num_threads is None:
+            return _AUTO_THREADS_TEXT.format(
+                points=POINTS_PER_THREAD, cube="charge_density.cube"
+            )
+        if num_cores is not None and num_threads > num_cores:
+            self.report(
+                f"Warning: running {num_threads} threads on {num_cores} cores per process."
+            )
+        return f"export OMP_NUM_THREADS={num_threads}"
@@ -0,0 +1,304 @@
+# -*- coding: utf-8 -*-
+"""CalcJobs that process the cube files on the remote computer with Python"""
+import inspect
+import json
+import os
+
+from aiida.common import CalcInfo, CodeInfo
+from aiida.engine import CalcJob
+from aiida.orm import Dict, List, RemoteData, Str
+import numpy as np
+
+from aiida_bader import core_density, cube, resample
+
+
+class CubeConversionCalculation(CalcJob):
+    """
+    Convert a cube file on the remote computer to a binary density cache.
+
+    The ``aiida_bader.cube`` module is copied to the working directory and run as a
+    script with the ``code``, which should be a Python executable with NumPy. The
+    cache (``density.npy`` and ``density.json``) stays in the remote folder, see
+    ``aiida_bader.cube.load_density_cache``.
+    """
+
+    _SCRIPT_FILE = "convert_cube.py"
+    _INPUT_FILE = "charge_density.cube"
+    _PREFIX = "density"
+
+    @classmethod
+    def define(cls, spec):
+        """
+        Init internal parameters at class load time
+        """
+        super(CubeConversionCalculation, cls).define(spec)
+        spec.input(
+            "parent_folder",
+            valid_type=RemoteData,
+            required=True,
+            help="The remote folder with the cube file",
+        )
+        spec.input(
+            "filename",
+            valid_type=Str,
+            default=lambda: Str("aiida.fileout"),
+            required=False,
+            help="Name of the cube file in the parent folder",
+        )
+        spec.input(
+            "dtype",
+            valid_type=Str,
+            default=lambda: Str("float32"),
+            required=False,
+            validator=lambda value, _: None
+            if value.value in ("float32", "float64")
+            else "`dtype` must be `float32` or `float64`",
+            help="Floating point type of the cache",
+        )
+        spec.inputs["metadata"]["options"]["parser_name"].default = "bader.cube"
+        spec.inputs["metadata"]["options"]["resources"].default = {
+            "num_machines": 1,
+            "num_mpiprocs_per_machine": 1,
+        }
+        spec.inputs["metadata"]["options"]["withmpi"].default = False
+
+        spec.exit_code(
+            300,
+            "ERROR_NO_HEADER_FILE",
+            message="The header of the density cache was not written.",
+        )
+        spec.output(
+            "header",
+            valid_type=Dict,
+            required=True,
+            help="Grid shape, voxel vectors, origin, number of atoms and type of the cache",
+        )
+
+    def prepare_for_submission(self, folder):
+        """Write the conversion script and link the cube file.
+
+        :param folder: an `aiida.common.folders.Folder` to temporarily write files on disk
+        :return: `aiida.common.datastructures.CalcInfo` instance
+        """
+        with folder.open(self._SCRIPT_FILE, "w") as handle:
+            handle.write(inspect.getsource(cube))
+
+        calcinfo = CalcInfo()
+        calcinfo.uuid = self.uuid
+        calcinfo.local_copy_list = []
+        calcinfo.remote_copy_list = []
+        calcinfo.remote_symlink_list = []
+        calcinfo.retrieve_list = [f"{self._PREFIX}.json"]
+
+        parent_folder = self.inputs.parent_folder
+        copy_info = (
+            parent_folder.computer.uuid,
+            os.path.join(parent_folder.get_remote_path(), self.inputs.filename.value),
+            self._INPUT_FILE,
+        )
+        if self.inputs.code.computer.uuid == parent_folder.computer.uuid:
+            calcinfo.remote_symlink_list.append(copy_info)
+        else:
+            calcinfo.remote_copy_list.append(copy_info)
+
+        codeinfo = CodeInfo()
+        codeinfo.cmdline_params = [
+            self._SCRIPT_FILE,
+            self._INPUT_FILE,
+            self._PREFIX,
+            "--dtype",
+            self.inputs.dtype.value,
+        ]
+        codeinfo.code_uuid = self.inputs.code.uuid
+        calcinfo.codes_info = [codeinfo]
+
+        return calcinfo
+
+
+# The files of the ``aiida_bader.core_density`` script, see ``write_core_density_script``.
+CORE_DENSITY_SCRIPT_FILE = "core_density.py"
+CORE_DENSITY_CUBE_MODULE_FILE = "cube.py"
+CORE_DENSITY_CORES_FILE = "core_densities.npz"
+CORE_DENSITY_KINDS_FILE = "kinds.json"
+
+
+def write_core_density_script(folder, structure, pseudos, source, target):
+    """Write the ``aiida_bader.core_density`` script, the ``aiida_bader.cube`` module it
+    imports, the radial core densities of the ``pseudos`` and the kind name of each site
+    of the ``structure`` to ``folder``.
+
+    :param folder: an `aiida.common.folders.Folder` to temporarily write files on disk
+    :param pseudos: the ``UpfData`` of each kind name of the ``structure``.
+    :param source: the valence cube file, relative to the working directory.
+    :param target: the reference cube file to write, relative to the working directory.
+    :return: the command line parameters of the script.
+    """
+    for filename, module in (
+        (CORE_DENSITY_SCRIPT_FILE, core_density),
+        (CORE_DENSITY_CUBE_MODULE_FILE, cube),
+    ):
+        with folder.open(filename, "w") as handle:
+            handle.write(inspect.getsource(module))
+
+    arrays = {}
+    for kind in structure.kinds:
+        profile = core_density.parse_upf_core_density(pseudos[kind.name].get_content())
+        if profile is not None:
+            arrays[f"{kind.name}_r"], arrays[f"{kind.name}_rho"] = profile
+    with folder.open(CORE_DENSITY_CORES_FILE, "wb") as handle:
+        np.savez(handle, **arrays)
+    with folder.open(CORE_DENSITY_KINDS_FILE, "w") as handle:
+        json.dump([site.kind_name for site in structure.sites], handle)
+    return [
+        CORE_DENSITY_SCRIPT_FILE,
+        source,
+        CORE_DENSITY_CORES_FILE,
+        CORE_DENSITY_KINDS_FILE,
+        target,
+    ]
+
+
+def validate_grid_factors(value, _):
+    """Validate the ``grid_factors`` input of the ``CubeResampleCalculation``."""
+    factors = value.get_list()
+    if not factors:
+        return "`grid_factors` must not be empty"
+    if any(
+        isinstance(factor, bool) or not isinstance(factor, (int, float)) or factor <= 0
+        for factor in factors
+    ):
+        return "`grid_factors` must be positive numbers"
+    return None
+
+
+class CubeResampleCalculation(CalcJob):
+    """
+    Write the charge density, and the reference if given, on grids of other resolutions,
+    to check the convergence of the Bader charges with the grid. The charge density is
+    resampled by Fourier interpolation, and the all-electron reference, which is not
+    band-limited, by trilinear interpolation.
+
+    The ``aiida_bader.resample`` and ``aiida_bader.cube`` modules are copied to the
+    working directory and run as a script with the ``code``, which should be a Python
+    executable with NumPy. The cube files of ``grid_factors[i]`` are written to
+    ``grid_<i>/charge_density.cube`` and ``grid_<i>/reference_charge_density.cube`` in
+    the remote folder.
+    """
+
+    _SCRIPT_FILE = "resample.py"
+    _CUBE_MODULE_FILE = "cube.py"
+    _INPUT_FILE = "charge_density.cube"
+    _REFERENCE_FILE = "reference_charge_density.cube"
+    _SUMMARY_FILE = "summary.json"
+
+    @classmethod
+    def define(cls, spec):
+        """
+        Init internal parameters at class load time
+        """
+        super(CubeResampleCalculation, cls).define(spec)
+        spec.input(
+            "charge_density_folder",
+            valid_type=RemoteData,
+            required=True,
+            help="The remote folder with the charge density",
+        )
+        spec.input(
+            "charge_density_filename",
+            valid_type=Str,
+            default=lambda: Str("aiida.fileout"),
+            required=False,
+            help="Name of the charge density file",
+        )
+        spec.input(
+            "reference_charge_density_folder",
+            valid_type=RemoteData,
+            required=False,
+            help="The remote folder with the reference charge density, if any",
+        )
+        spec.input(
+            "reference_charge_density_filename",
+            valid_type=Str,
+            default=lambda: Str("aiida.fileout"),
+            required=False,
+            help="Name of the reference charge density file",
+        )
+        spec.input(
+            "grid_factors",
+            valid_type=List,
+            required=True,
+            validator=validate_grid_factors,
+            help="Factors by which the number of grid points along each axis is scaled, "
+            "rounded up to FFT friendly sizes",
+        )
+        spec.inputs["metadata"]["options"]["parser_name"].default = "bader.resample"
+        spec.inputs["metadata"]["options"]["resources"].default = {
+            "num_machines": 1,
+            "num_mpiprocs_per_machine": 1,
+        }
+        spec.inputs["metadata"]["options"]["withmpi"].default = False
+
+        spec.exit_code(
+            300,
+            "ERROR_NO_SUMMARY_FILE",
+            message="The resampled densities were not written.",
+        )
+        spec.output(
+            "output_parameters",
+            valid_type=Dict,
+            required=True,
+            help="Grid shape of the input, and the factor, the grid shape and the number "
+            "of electrons of each grid",
+        )
+
+    def prepare_for_submission(self, folder):
+        """Write the scripts and link the cube files.
+
+        :param folder: an `aiida.common.folders.Folder` to temporarily write files on disk
+        :return: `aiida.common.datastructures.CalcInfo` instance
+        """
+        for filename, module in (
+            (self._SCRIPT_FILE, resample),
+            (self._CUBE_MODULE_FILE, cube),
+        ):
+            with folder.open(filename, "w") as handle:
+                handle.write(inspect.getsource(module))
+
+        calcinfo = CalcInfo()
+        calcinfo.uuid = self.uuid
+        calcinfo.local_copy_list = []
+        calcinfo.remote_copy_list = []
+        calcinfo.remote_symlink_list = []
+        calcinfo.retrieve_list = [self._SUMMARY_FILE]
+
+        sources = [("charge_density", self._INPUT_FILE)]
+        if "reference_charge_density_folder" in self.inputs:
+            sources.append(("reference_charge_density", self._REFERENCE_FILE))
+        for name, target in sources:
+            remote_folder = self.inputs[f"{name}_folder"]
+            copy_info = (
+                remote_folder.computer.uuid,
+                os.path.join(
+                    remote_folder.get_remote_path(),
+                    self.inputs[f"{name}_filename"].value,
+                ),
+                target,
+            )
+            if self.inputs.code.computer.uuid == remote_folder.computer.uuid:
+                calcinfo.remote_symlink_list.append(copy_info)
+            else:
+                calcinfo.remote_copy_list.append(copy_info)
+
+        codeinfo = CodeInfo()
+        codeinfo.cmdline_params = [self._SCRIPT_FILE, self._INPUT_FILE]
+        if len(sources) > 1:
+            codeinfo.cmdline_params += ["--references", self._REFERENCE_FILE]
+        codeinfo.cmdline_params += (
+            ["--factors"]
+            + [str(factor) for factor in self.inputs.grid_factors.get_list()]
+            + ["--summary", self._SUMMARY_FILE]
+        )
+        codeinfo.code_uuid = self.inputs.code.uuid
+        calcinfo.codes_info = [codeinfo]
+
+        return calcinfo
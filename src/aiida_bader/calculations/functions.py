@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+"""Calculation functions of the AiiDA bader plugin"""
+from aiida.engine import calcfunction
+import numpy as np
+from aiida.orm import Dict, Float, SinglefileData, StructureData
+
+from aiida_bader.cube import read_cube
+from aiida_bader.parsers import get_bader_charge_array
+from aiida_bader.partition import ALGORITHMS, bader_partition
+
+
+def _read_cube_node(node):
+    with node.open(mode="r") as handle:
+        return read_cube(handle)
+
+
+@calcfunction
+def bader_charge_from_cube(
+    charge_density: SinglefileData,
+    reference_charge_density: SinglefileData = None,
+    parameters: Dict = None,
+    structure: StructureData = None,
+):
+    """Compute the Bader charges in process with NumPy, without the bader executable.
+
+    The result is the same ``bader_charge`` output as the one of the ``BaderCalculation``.
+    Only the ``algorithm`` (``ongrid`` or ``neargrid``) and ``vacuum`` keys of the
+    ``BaderCalculation`` parameters are supported.
+    """
+    parameters = {} if parameters is None else parameters.get_dict()
+    unsupported = set(parameters) - {"algorithm", "vacuum"}
+    if unsupported:
+        raise ValueError(f"Unsupported parameters: {sorted(unsupported)}")
+    algorithm = parameters.get("algorithm", "neargrid")
+    if algorithm not in ALGORITHMS:
+        raise ValueError(f"`algorithm` must be one of {ALGORITHMS}")
+
+    header, rho = _read_cube_node(charge_density)
+    reference = None
+    if reference_charge_density is not None:
+        _, reference = _read_cube_node(reference_charge_density)
+        if reference.shape != rho.shape:
+            raise ValueError("The reference charge density is on a different grid.")
+
+    columns, footer = bader_partition(
+        rho,
+        header["voxel"],
+        header["positions"],
+        origin=header["origin"],
+        reference=reference,
+        algorithm=algorithm,
+        vacuum=parameters.get("vacuum", "off"),
+    )
+    return {"bader_charge": get_bader_charge_array(columns, footer, structure)}
+
+
+@calcfunction
+def collect_bader_charges(**bader_charges):
+    """Collect the ``bader_charge`` outputs of several structures into one ``Dict``.
+
+    :param bader_charges: the ``bader_charge`` output of each structure, by label.
+    :return: a ``Dict`` with the charges and the charge summary of each structure.
+    """
+    summary = {}
+    for label, array in bader_charges.items():
+        attributes = array.base.attributes.all
+        summary[label] = {
+            "charges": array.get_array("charge").tolist(),
+            "total_charge": attributes.get("total_charge"),
+            "charge_per_element": attributes.get("charge_per_element"),
+            "vacuum_charge": attributes.get("vacuum_charge"),
+        }
+    return Dict(summary)
+
+
+@calcfunction
+def select_converged_grid(
+    grids: Dict, tolerance: Float, ecutrho: Float = None, **bader_charges
+):
+    """Select the coarsest grid whose Bader charges agree with those of the next finer grid.
+
+    :param grids: the ``output_parameters`` of the ``CubeResampleCalculation``.
+    :param tolerance: the largest difference of the charge of any atom, in electrons.
+    :param ecutrho: optional cutoff of the charge density of the scf calculation in Ry,
+        from which the cutoff of the recommended grid is given.
+    :param bader_charges: the ``bader_charge`` output of each grid, as ``grid_<i>``.
+    :return: a ``Dict`` with the factor, the shape, the charges and the largest
+        difference to the next finer grid of each grid, from coarse to fine, and the
+        recommended grid. If no grid converged, the finest one is recommended and
+        ``converged`` is false.
+    """
+    tolerance = tolerance.value
+    results = []
+    for index, grid in enumerate(grids["grids"]):
+        results.append(
+            {
+                "index": index,
+                "factor": grid["factor"],
+                "shape": grid["shape"],
+                "charges": bader_charges[f"grid_{index}"].get_array("charge").tolist(),
+            }
+        )
+    results.sort(key=lambda grid: np.prod(grid["shape"]))
+    for coarse, fine in zip(results, results[1:]):
+        coarse["max_difference"] = float(
+            np.max(np.abs(np.subtract(coarse["charges"], fine["charges"])))
+        )
+    results[-1]["max_difference"] = None
+
+    converged = [grid for grid in results[:-1] if grid["max_difference"] <= tolerance]
+    recommended = converged[0] if converged else results[-1]
+    summary = {
+        "tolerance": tolerance,
+        "grids": results,
+        "converged": bool(converged),
+        "recommended_grid": recommended["index"],
+        "recommended_factor": recommended["factor"],
+        "recommended_shape": recommended["shape"],
+    }
+    if ecutrho is not None:
+        summary["recommended_ecutrho"] = ecutrho.value * recommended["factor"] ** 2
+    return Dict(summary)
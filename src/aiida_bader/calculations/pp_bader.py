@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+"""CalcJob that runs pp.x twice and bader in a single allocation"""
+import os
+
+from aiida.common import CalcInfo, CodeInfo, CodeRunMode, exceptions
+from aiida.orm import AbstractCode, Dict, RemoteData
+from aiida_quantumespresso.calculations.pp import PpCalculation
+from aiida_quantumespresso.calculations.pp import (
+    validate_parameters as validate_pp_parameters,
+)
+from aiida_quantumespresso.utils.convert import convert_input_to_namelist_entry
+
+from aiida_bader.calculations import BaderCalculation, get_cmdline_params
+
+
+class PpBaderCalculation(BaderCalculation):
+    """
+    Compute the valence and all-electron charge-densities with pp.x and run bader on
+    them, all in one job.
+
+    The ``code`` is the pp.x code and the ``bader_code`` is run after it, so there is
+    a single queue wait instead of three. pp.x follows the ``withmpi`` option, which is
+    ``True`` by default. bader is serial, so it always runs without MPI, whatever the
+    option, and a single process writes its output files. The cube files stay in the
+    remote folder, with the same names as in the ``BaderCalculation``.
+    """
+
+    _VALENCE = "pp_valence"
+    _ALL = "pp_all"
+    _CUBE_FILES = {
+        _VALENCE: "charge_density.cube",
+        _ALL: "reference_charge_density.cube",
+    }
+
+    @classmethod
+    def define(cls, spec):
+        """
+        Init internal parameters at class load time
+        """
+        super(PpBaderCalculation, cls).define(spec)
+        # the charge densities are computed by the job itself
+        for name in (
+            "charge_density_filename",
+            "charge_density_folder",
+            "reference_charge_density_folder",
+            "reference_charge_density_filename",
+            "reference_pseudos",
+            "reference_code",
+            "reference_cutoff",
+        ):
+            spec.inputs.pop(name)
+        spec.input(
+            "parent_folder",
+            valid_type=RemoteData,
+            required=True,
+            help="Output folder of a completed `PwCalculation`",
+        )
+        spec.input(
+            "pp_valence_parameters",
+            valid_type=Dict,
+            required=True,
+            validator=validate_pp_parameters,
+            help="Namelists of the pp.x run of the valence charge-density",
+        )
+        spec.input(
+            "pp_all_parameters",
+            valid_type=Dict,
+            required=True,
+            validator=validate_pp_parameters,
+            help="Namelists of the pp.x run of the all-electron charge-density",
+        )
+        spec.input(
+            "bader_code",
+            valid_type=AbstractCode,
+            required=True,
+            help="The bader code, run after the two pp.x runs",
+        )
+        spec.inputs["metadata"]["options"]["withmpi"].default = True
+
+    def prepare_for_submission(self, folder):
+        """Write the two pp.x input files and chain pp.x, pp.x and bader.
+
+        :param folder: an `aiida.common.folders.Folder` to temporarily write files on disk
+        :return: `aiida.common.datastructures.CalcInfo` instance
+        """
+        calcinfo = CalcInfo()
+        calcinfo.uuid = self.uuid
+        calcinfo.local_copy_list = []
+        calcinfo.remote_copy_list = []
+        calcinfo.remote_symlink_list = []
+        calcinfo.retrieve_list = [
+            self._DEFAULT_OUTPUT_FILE,
+            f"{self._VALENCE}.out",
+            f"{self._ALL}.out",
+        ]
+        calcinfo.retrieve_temporary_list = [self._TIMING_FILE]
+        if self.inputs.retrieve_basins.value:
+            calcinfo.retrieve_temporary_list.extend(
+                [self._BASIN_FILE, self._ATOM_VOLUME_FILE]
+            )
+
+        # pp.x only reads the outputs of pw.x, so they are linked if possible
+        parent_folder = self.inputs.parent_folder
+        for subfolder in (
+            PpCalculation._OUTPUT_SUBFOLDER,
+            PpCalculation._PSEUDO_SUBFOLDER,
+        ):  # pylint: disable=protected-access
+            copy_info = (
+                parent_folder.computer.uuid,
+                os.path.join(parent_folder.get_remote_path(), subfolder),
+                subfolder,
+            )
+            if self.inputs.code.computer.uuid == parent_folder.computer.uuid:
+                calcinfo.remote_symlink_list.append(copy_info)
+            else:
+                calcinfo.remote_copy_list.append(copy_info)
+
+        calcinfo.codes_info = []
+        for name, parameters in (
+            (self._VALENCE, self.inputs.pp_valence_parameters),
+            (self._ALL, self.inputs.pp_all_parameters),
+        ):
+            self._write_pp_input(folder, name, parameters.get_dict())
+            codeinfo = CodeInfo()
+            codeinfo.stdin_name = f"{name}.in"
+            codeinfo.stdout_name = f"{name}.out"
+            codeinfo.code_uuid = self.inputs.code.uuid
+            calcinfo.codes_info.append(codeinfo)
+
+        codeinfo = CodeInfo()
+        codeinfo.cmdline_params = [
+            self._CUBE_FILES[self._VALENCE],
+            "-ref",
+            self._CUBE_FILES[self._ALL],
+        ]
+        if "parameters" in self.inputs:
+            codeinfo.cmdline_params.extend(
+                get_cmdline_params(self.inputs.parameters.get_dict())
+            )
+        codeinfo.code_uuid = self.inputs.bader_code.uuid
+        # bader is serial, each MPI process would partition the same densities
+        codeinfo.withmpi = False
+        calcinfo.codes_info.append(codeinfo)
+        calcinfo.codes_run_mode = CodeRunMode.SERIAL
+        calcinfo.prepend_text = self._get_prepend_text()
+        # the cube files are written by pp.x in the job
+        calcinfo.append_text = self._get_timing_end_text(
+            {cube: "pp.x" for cube in self._CUBE_FILES.values()}
+        )
+
+        return calcinfo
+
+    def _write_pp_input(self, folder, name, parameters):
+        """Write the pp.x input file ``<name>.in`` that plots to a cube file."""
+        for namelist, key, value in (
+            ("INPUTPP", "outdir", PpCalculation._OUTPUT_SUBFOLDER),
+            ("INPUTPP", "prefix", PpCalculation._PREFIX),
+            ("INPUTPP", "filplot", f"{name}.filplot"),
+            ("PLOT", "fileout", self._CUBE_FILES[name]),
+            ("PLOT", "output_format", 6),
+        ):  # pylint: disable=protected-access
+            if key in parameters.get(namelist, {}):
+                raise exceptions.InputValidationError(
+                    f"You cannot specify explicitly the '{key}' key in the '{namelist}' namelist."
+                )
+            parameters.setdefault(namelist, {})[key] = value
+        if parameters["PLOT"].get("iflag") != 3:
+            raise exceptions.InputValidationError(
+                "bader needs a three-dimensional charge-density, `PLOT.iflag` must be 3."
+            )
+
+        with folder.open(f"{name}.in", "w") as infile:
+            for namelist_name in ("INPUTPP", "PLOT"):
+                infile.write(f"&{namelist_name}\n")
+                for key, value in sorted(parameters.pop(namelist_name).items()):
+                    infile.write(convert_input_to_namelist_entry(key, value))
+                infile.write("/\n")
+        if parameters:
+            raise exceptions.InputValidationError(
+                f"Unknown namelists in the pp.x parameters: {', '.join(parameters)}"
+            )
+
+    def _get_threads_text(self):
+        """Return the prepend text that sets the number of OpenMP threads.
+
+        The cube files do not exist yet when the prepend text runs, so the number of
+        threads is only set if it is given by the options or the resources.
+        """
+        options = self.inputs.metadata.options
+        num_cores = options.resources.get("num_cores_per_mpiproc")
+        if options.get("num_threads", num_cores) is None:
+            return ""
+        return super()._get_threads_text()
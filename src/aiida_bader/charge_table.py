@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+"""Table of the Bader charges of a structure, for large structures.
+
+The columns are kept as NumPy arrays, and sorting, filtering, paging and the sums per
+element are done on them, so that only the rows on display are turned into Python
+objects, e.g. for the results panel of the QE app.
+"""
+import numpy as np
+
+COLUMNS = ("site_index", "element", "bader_charge", "charge_diff")
+
+
+class ChargeTable:
+    """The Bader charge of each site, and its difference to the valence of the site.
+
+    :param charges: the Bader charge of each site.
+    :param kinds: the kind name of each site.
+    :param z_valences: optional valence of each kind name. The difference of the sites
+        of other kinds is ``NaN``.
+    """
+
+    def __init__(self, charges, kinds, z_valences=None):
+        self.bader_charge = np.asarray(charges, dtype=float)
+        self.element = np.asarray(kinds, dtype=str)
+        if self.element.shape != self.bader_charge.shape:
+            raise ValueError(
+                f"{len(self.element)} kinds were given for {len(self.bader_charge)} charges"
+            )
+        self.site_index = np.arange(len(self.bader_charge))
+        valence = np.full(len(self.bader_charge), np.nan)
+        for kind, z_valence in (z_valences or {}).items():
+            valence[self.element == kind] = z_valence
+        self.charge_diff = valence - self.bader_charge
+
+    def __len__(self):
+        return len(self.bader_charge)
+
+    @property
+    def elements(self):
+        """The kind names of the sites, sorted."""
+        return np.unique(self.element).tolist()
+
+    def query(
+        self, elements=None, charge_range=None, sort_by="site_index", ascending=True
+    ):
+        """Return the indices of the sites that pass the filters, in order.
+
+        :param elements: optional kind names of the sites to keep.
+        :param charge_range: optional ``(min, max)`` of the Bader charge, either may be
+            ``None``.
+        :param sort_by: one of ``COLUMNS``. Ties are kept in the order of the sites.
+        :param ascending: sort in ascending order, otherwise descending.
+        """
+        if sort_by not in COLUMNS:
+            raise ValueError(f"`sort_by` must be one of {COLUMNS}")
+        mask = np.ones(len(self), dtype=bool)
+        if elements is not None:
+            mask &= np.isin(self.element, list(elements))
+        if charge_range is not None:
+            low, high = charge_range
+            if low is not None:
+                mask &= self.bader_charge >= low
+            if high is not None:
+                mask &= self.bader_charge <= high
+        indices = np.flatnonzero(mask)
+        values = getattr(self, sort_by)[indices]
+        if values.dtype.kind in "US":
+            # the rank of the names, which can be negated
+            values = np.unique(values, return_inverse=True)[1]
+        if not ascending:
+            values = -values
+        # a stable sort keeps ties in the order of the sites, NaN is last
+        return indices[np.argsort(values, kind="stable")]
+
+    def rows(self, indices, decimals=3):
+        """Return the rows of the sites ``indices`` as dictionaries, with an ``id`` that
+        is the site index. A difference that is not known is ``None``."""
+        rows = []
+        for index in np.asarray(indices, dtype=int):
+            diff = self.charge_diff[index]
+            rows.append(
+                {
+                    "id": int(index),
+                    "site_index": int(index),
+                    "element": str(self.element[index]),
+                    "bader_charge": round(float(self.bader_charge[index]), decimals),
+                    "charge_diff": None
+                    if np.isnan(diff)
+                    else round(float(diff), decimals),
+                }
+            )
+        return rows
+
+    @staticmethod
+    def page(indices, page, page_size):
+        """Return the ``page``, counted from 0, of ``indices`` and the number of pages.
+        The page is clipped to the valid range."""
+        num_pages = max(1, -(-len(indices) // page_size))
+        page = min(max(page, 0), num_pages - 1)
+        return indices[page * page_size : (page + 1) * page_size], num_pages
+
+    def aggregate(self, indices=None, decimals=3):
+        """Return one row per element of the sites ``indices``, by default all, with the
+        number of sites and the total, mean, minimum and maximum Bader charge, and the
+        mean difference to the valence."""
+        indices = self.site_index if indices is None else np.asarray(indices, dtype=int)
+        elements, inverse, counts = np.unique(
+            self.element[indices], return_inverse=True, return_counts=True
+        )
+        charges = self.bader_charge[indices]
+        totals = np.bincount(inverse, weights=charges, minlength=len(elements))
+        minimum = np.full(len(elements), np.inf)
+        maximum = np.full(len(elements), -np.inf)
+        np.minimum.at(minimum, inverse, charges)
+        np.maximum.at(maximum, inverse, charges)
+        diffs = np.bincount(
+            inverse, weights=self.charge_diff[indices], minlength=len(elements)
+        )
+        rows = []
+        for i, element in enumerate(elements):
+            mean_diff = diffs[i] / counts[i]
+            rows.append(
+                {
+                    "id": i,
+                    "element": str(element),
+                    "count": int(counts[i]),
+                    "total_charge": round(float(totals[i]), decimals),
+                    "mean_charge": round(float(totals[i] / counts[i]), decimals),
+                    "min_charge": round(float(minimum[i]), decimals),
+                    "max_charge": round(float(maximum[i]), decimals),
+                    "mean_charge_diff": None
+                    if np.isnan(mean_diff)
+                    else round(float(mean_diff), decimals),
+                }
+            )
+        return rows
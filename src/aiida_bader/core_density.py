@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+"""All-electron reference densities built from the core densities of the pseudopotentials
+
+The reference density used by bader to find the basins is the valence density plus
+the core density of every atom. Instead of a second pp.x run, the radial core
+densities of the pseudopotentials (``PP_AE_NLCC`` for PAW, otherwise ``PP_NLCC``)
+are placed on the grid of the valence cube.
+
+Like ``aiida_bader.cube``, this module only depends on NumPy, so that it can be run
+as a script next to the cube files::
+
+    python core_density.py valence.cube core_densities.npz kinds.json reference.cube
+"""
+import argparse
+import json
+import re
+
+import numpy as np
+
+try:
+    from aiida_bader.cube import read_cube, write_cube
+except ImportError:  # run as a script next to cube.py
+    from cube import read_cube, write_cube
+
+# Core density below which the radial profile is cut, in electrons per Bohr^3.
+CORE_THRESHOLD = 1e-8
+
+
+def _upf_block(content, tag):
+    match = re.search(rf"<{tag}(?:\s[^>]*)?>(.*?)</{tag}>", content, re.DOTALL)
+    if match is None:
+        return None
+    return np.array(match.group(1).replace("D", "E").split(), dtype=float)
+
+
+def parse_upf_core_density(content):
+    """Return the radial core density of a UPF pseudopotential.
+
+    :param content: the text of the UPF file.
+    :return: a tuple ``(r, rho_core)`` in Bohr and electrons per Bohr^3, or ``None``
+        if the pseudopotential has no core density.
+    """
+    radial_grid = _upf_block(content, "PP_R")
+    core = _upf_block(content, "PP_AE_NLCC")
+    if core is None:
+        core = _upf_block(content, "PP_NLCC")
+    if radial_grid is None or core is None or not core.any():
+        return None
+    size = min(radial_grid.size, core.size)
+    return radial_grid[:size], core[:size]
+
+
+def add_core_density(rho, voxel, origin, positions, profiles, cutoff=None):
+    """Add the radial core densities of the atoms to ``rho`` in place.
+
+    The grid is periodic: the contributions of all images within the cutoff radius of
+    each atom are added.
+
+    :param rho: the density of the grid shape, in electrons per Bohr^3.
+    :param voxel: the (3, 3) voxel vectors, in Bohr.
+    :param origin: the origin of the grid, in Bohr.
+    :param positions: the (N, 3) Cartesian positions of the atoms, in Bohr.
+    :param profiles: for each atom, a tuple ``(r, rho_core)`` or ``None``.
+    :param cutoff: the radius up to which the core densities are added. By default,
+        where the core density drops below ``CORE_THRESHOLD``.
+    :return: the number of core electrons that were added to the grid.
+    """
+    shape = rho.shape
+    flat = rho.reshape(-1)
+    voxel = np.asarray(voxel, dtype=float)
+    inverse = np.linalg.inv(voxel)
+    volume = abs(np.linalg.det(voxel))
+    added = 0.0
+    for position, profile in zip(positions, profiles):
+        if profile is None:
+            continue
+        radial_grid, core = profile
+        radius = cutoff
+        if radius is None:
+            radius = radial_grid[core > CORE_THRESHOLD].max(initial=0.0)
+        # the box of grid indices around the atom that contains the sphere
+        center = (np.asarray(position) - origin) @ inverse
+        extent = np.ceil(radius * np.linalg.norm(inverse, axis=0)).astype(int)
+        ranges = [
+            np.arange(int(np.floor(c)) - e, int(np.ceil(c)) + e + 1)
+            for c, e in zip(center, extent)
+        ]
+        indices = np.stack(np.meshgrid(*ranges, indexing="ij"), axis=-1).reshape(-1, 3)
+        distance = np.linalg.norm((indices - center) @ voxel, axis=1)
+        inside = distance < radius
+        values = np.interp(distance[inside], radial_grid, core, right=0.0)
+        points = np.ravel_multi_index(tuple(indices[inside].T), shape, mode="wrap")
+        np.add.at(flat, points, values)
+        added += values.sum() * volume
+    return added
+
+
+def build_reference_density(source, cores, kinds, target, cutoff=None):
+    """Write the valence density of ``source`` plus the core densities to ``target``.
+
+    :param source: the path of the valence density cube file.
+    :param cores: the path of a ``.npz`` file with the arrays ``<kind>_r`` and
+        ``<kind>_rho`` of the radial core density of each kind.
+    :param kinds: the kind name of each atom of the cube file.
+    :param target: the path of the cube file to write.
+    :return: a dictionary with the number of valence and core electrons on the grid.
+    """
+    with open(source, "rb") as handle:
+        header, rho = read_cube(handle)
+    if len(kinds) != len(header["positions"]):
+        raise ValueError(
+            f"{len(kinds)} kinds were given for {len(header['positions'])} atoms"
+        )
+    volume = abs(np.linalg.det(header["voxel"]))
+    valence = float(rho.sum() * volume)
+
+    radial = np.load(cores)
+    profiles = [
+        (radial[f"{kind}_r"], radial[f"{kind}_rho"])
+        if f"{kind}_r" in radial.files
+        else None
+        for kind in kinds
+    ]
+    core = add_core_density(
+        rho, header["voxel"], header["origin"], header["positions"], profiles, cutoff
+    )
+    with open(target, "w") as handle:
+        write_cube(handle, header, rho)
+    return {"valence_electrons": valence, "core_electrons": float(core)}
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Add the core densities of the atoms to a valence density."
+    )
+    parser.add_argument("source", help="the path of the valence density cube file")
+    parser.add_argument("cores", help="the .npz file with the radial core densities")
+    parser.add_argument("kinds", help="the JSON file with the kind of each atom")
+    parser.add_argument("target", help="the path of the cube file to write")
+    parser.add_argument("--cutoff", type=float, default=None)
+    parser.add_argument("--summary", default=None, help="JSON file for the summary")
+    args = parser.parse_args()
+
+    with open(args.kinds) as handle:
+        kinds = json.load(handle)
+    summary = build_reference_density(
+        args.source, args.cores, kinds, args.target, args.cutoff
+    )
+    if args.summary:
+        with open(args.summary, "w") as handle:
+            json.dump(summary, handle)
+
+
+if __name__ == "__main__":
+    main()
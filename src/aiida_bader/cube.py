@@ -0,0 +1,242 @@
+# -*- coding: utf-8 -*-
+"""Reading of Gaussian cube files and conversion to a binary density cache
+
+This module only depends on NumPy, so that it can also be run as a script on the
+computer where the cube files are::
+
+    python cube.py aiida.fileout density --dtype float32
+
+which writes ``density.npy`` and ``density.json``, see ``convert_cube``.
+"""
+import argparse
+import json
+import re
+import warnings
+
+import numpy as np
+
+BOHR_TO_ANGSTROM = 0.529177210903
+
+# Number of characters of the volumetric data that are parsed at once.
+CHUNK_SIZE = 2**24
+
+# Fortran drops the ``E`` of exponents with three digits, as in ``1.23456-100``.
+_FORTRAN_EXPONENT = re.compile(r"(\d)([+-]\d{3})")
+
+
+def _readline(handle):
+    line = handle.readline()
+    return line.decode("ascii") if isinstance(line, bytes) else line
+
+
+def read_cube_header(handle):
+    """Read the header of a Gaussian cube file from a text or binary ``handle``.
+
+    Only the header lines are read, so this is cheap also for very large files. The
+    handle is left at the start of the volumetric data.
+
+    Lengths are returned in Bohr. A negative number of grid points in the file means
+    that the voxel vectors are given in Angstrom, in which case they are converted.
+
+    :return: a dictionary with ``comments``, ``origin`` (3,), ``voxel`` (3, 3),
+        ``shape``, ``numbers``, ``nuclear_charges`` and ``positions`` (N, 3).
+    """
+    comments = [_readline(handle).rstrip("\n"), _readline(handle).rstrip("\n")]
+    values = _readline(handle).split()
+    num_atoms = int(values[0])
+    origin = np.array(values[1:4], dtype=float)
+
+    shape = []
+    voxel = np.zeros((3, 3))
+    unit = 1.0
+    for axis in range(3):
+        values = _readline(handle).split()
+        num_points = int(values[0])
+        if num_points < 0:
+            unit = 1.0 / BOHR_TO_ANGSTROM
+        shape.append(abs(num_points))
+        voxel[axis] = np.array(values[1:4], dtype=float)
+
+    numbers = []
+    nuclear_charges = []
+    positions = []
+    for _ in range(abs(num_atoms)):
+        values = _readline(handle).split()
+        numbers.append(int(values[0]))
+        nuclear_charges.append(float(values[1]))
+        positions.append([float(value) for value in values[2:5]])
+    if num_atoms < 0:
+        # the line with the orbital indices written by some codes
+        _readline(handle)
+
+    return {
+        "comments": comments,
+        "origin": origin * unit,
+        "voxel": voxel * unit,
+        "shape": tuple(shape),
+        "numbers": np.array(numbers, dtype=int),
+        "nuclear_charges": np.array(nuclear_charges),
+        "positions": np.array(positions).reshape(-1, 3) * unit,
+    }
+
+
+def read_cube(handle, dtype=np.float64, memmap=None, chunk_size=CHUNK_SIZE):
+    """Read a Gaussian cube file from a text or binary ``handle``.
+
+    The volumetric data is parsed in chunks of ``chunk_size`` characters straight into
+    a preallocated array, so the peak memory is the size of the array plus one chunk.
+
+    :param dtype: the data type of the returned array, ``float64`` or ``float32``.
+    :param memmap: optional path of a file to which the data is written as a
+        ``np.memmap``, so that it does not need to fit in memory.
+    :return: a tuple ``(header, data)``, with the header as returned by
+        ``read_cube_header`` and the volumetric data as an array of the grid shape.
+    :raise ValueError: if the number of values does not match the grid.
+    """
+    header = read_cube_header(handle)
+    shape = header["shape"]
+    if memmap is None:
+        data = np.empty(shape, dtype=dtype)
+    else:
+        data = np.memmap(memmap, dtype=dtype, mode="w+", shape=shape)
+    read_cube_data(handle, data, chunk_size)
+    return header, data
+
+
+def read_cube_data(handle, out, chunk_size=CHUNK_SIZE):
+    """Read the volumetric data of a cube file into the preallocated array ``out``.
+
+    :param handle: a text or binary handle positioned after the header.
+    :param out: the array to fill, of the grid shape.
+    :raise ValueError: if the number of values does not match the grid.
+    """
+    flat = out.reshape(-1)
+
+    filled = 0
+    rest = ""
+    while True:
+        chunk = handle.read(chunk_size)
+        if isinstance(chunk, bytes):
+            chunk = chunk.decode("ascii")
+        if not chunk:
+            break
+        chunk = rest + chunk
+        # do not cut a number in two: parse up to the last whitespace
+        cut = max(chunk.rfind(" "), chunk.rfind("\n"))
+        rest = chunk[cut + 1 :]
+        filled = _parse_into(flat, filled, chunk[: cut + 1])
+    filled = _parse_into(flat, filled, rest)
+
+    if filled != flat.size:
+        raise ValueError(
+            f"Expected {flat.size} values in the cube file, found {filled}"
+        )
+    if isinstance(out, np.memmap):
+        out.flush()
+
+
+def _parse_into(flat, filled, text):
+    """Parse the numbers in ``text`` into ``flat`` from position ``filled`` on."""
+    if not text.strip():
+        return filled
+    try:
+        with warnings.catch_warnings():
+            # NumPy stops at the first number it cannot read, with a warning
+            warnings.simplefilter("error", DeprecationWarning)
+            values = np.fromstring(text, dtype=flat.dtype, sep=" ")
+    except (DeprecationWarning, ValueError):
+        text = _FORTRAN_EXPONENT.sub(r"\1E\2", text)
+        values = np.fromstring(text, dtype=flat.dtype, sep=" ")
+    if filled + values.size > flat.size:
+        raise ValueError("The cube file contains more values than its grid")
+    flat[filled : filled + values.size] = values
+    return filled + values.size
+
+
+def write_cube(handle, header, data):
+    """Write a Gaussian cube file to a text ``handle``, in Bohr.
+
+    :param header: a dictionary as returned by ``read_cube_header``.
+    :param data: the volumetric data, of the grid shape.
+    """
+    shape = data.shape
+    comments = header.get("comments", ["", ""])
+    handle.write(f"{comments[0]}\n{comments[1]}\n")
+    origin = header["origin"]
+    handle.write(
+        f"{len(header['numbers']):5d}{origin[0]:12.6f}{origin[1]:12.6f}{origin[2]:12.6f}\n"
+    )
+    for num_points, vector in zip(shape, header["voxel"]):
+        handle.write(
+            f"{num_points:5d}{vector[0]:12.6f}{vector[1]:12.6f}{vector[2]:12.6f}\n"
+        )
+    for number, charge, position in zip(
+        header["numbers"], header["nuclear_charges"], header["positions"]
+    ):
+        handle.write(
+            f"{number:5d}{charge:12.6f}{position[0]:12.6f}{position[1]:12.6f}{position[2]:12.6f}\n"
+        )
+    # the z values of each (x, y) are written six per line
+    full, rest = divmod(shape[2], 6)
+    row_format = ("%13.5e" * 6 + "\n") * full + ("%13.5e" * rest + "\n" if rest else "")
+    for slab in data:
+        handle.write((row_format * shape[1]) % tuple(slab.ravel().tolist()))
+
+
+def convert_cube(source, prefix, dtype=np.float32, chunk_size=CHUNK_SIZE):
+    """Convert a cube file to a binary density cache.
+
+    The cache is made of ``<prefix>.npy``, a NumPy array of the grid shape that can be
+    memory-mapped, and ``<prefix>.json``, the cube header. The data is streamed into
+    the ``.npy`` file, so the cube does not need to fit in memory.
+
+    :param source: the path of the cube file.
+    :param prefix: the path of the cache without extension.
+    :return: the header, as written to the ``.json`` file.
+    """
+    with open(source, "rb") as handle:
+        header = read_cube_header(handle)
+        out = np.lib.format.open_memmap(
+            f"{prefix}.npy", mode="w+", dtype=dtype, shape=header["shape"]
+        )
+        read_cube_data(handle, out, chunk_size)
+        del out
+
+    header = {
+        key: value.tolist() if isinstance(value, np.ndarray) else value
+        for key, value in header.items()
+    }
+    header["dtype"] = np.dtype(dtype).name
+    with open(f"{prefix}.json", "w") as handle:
+        json.dump(header, handle)
+    return header
+
+
+def load_density_cache(prefix, mmap_mode="r"):
+    """Load a binary density cache written by ``convert_cube``.
+
+    :param prefix: the path of the cache without extension.
+    :param mmap_mode: the memory-map mode of ``np.load``, ``None`` to read into memory.
+    :return: a tuple ``(header, data)`` as returned by ``read_cube``.
+    """
+    with open(f"{prefix}.json") as handle:
+        header = json.load(handle)
+    for key in ("origin", "voxel", "numbers", "nuclear_charges", "positions"):
+        header[key] = np.array(header[key])
+    header["shape"] = tuple(header["shape"])
+    return header, np.load(f"{prefix}.npy", mmap_mode=mmap_mode)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Convert a cube file to a binary cache."
+    )
+    parser.add_argument("source", help="the path of the cube file")
+    parser.add_argument("prefix", help="the path of the cache, without extension")
+    parser.add_argument("--dtype", default="float32", choices=["float32", "float64"])
+    args = parser.parse_args()
+    convert_cube(args.source, args.prefix, dtype=args.dtype)
+
+
+if __name__ == "__main__":
+    main()
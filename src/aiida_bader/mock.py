@@ -0,0 +1,602 @@
+# -*- coding: utf-8 -*-
+"""Stand-ins for the pw.x, pp.x and bader executables.
+
+They let the workflows run end to end on a computer without Quantum ESPRESSO or
+bader, for example to measure the overhead of the workflow engine. Each one is run
+as ``python -m aiida_bader.mock {pw,pp,bader}`` through a small wrapper script, see
+``write_mock_executables``, and writes outputs in the format of the real code:
+
+* ``pw``: the standard output, the XML data file, a charge-density and wavefunction
+  files of the size of the grid in the ``out`` folder.
+* ``pp``: a cube file with a synthetic charge-density, one Gaussian per atom.
+* ``bader``: ``ACF.dat``, ``BCF.dat`` and ``AVF.dat``, computed with
+  ``aiida_bader.partition`` from the cube file.
+
+The grid of the densities has ``AIIDA_BADER_MOCK_GRID`` points along each cell
+vector, 24 by default, or a comma-separated list of three numbers.
+"""
+import os
+import pathlib
+import re
+import stat
+import sys
+import xml.etree.ElementTree as ET
+
+import numpy as np
+
+BOHR_TO_ANGSTROM = 0.529177210903
+
+DEFAULT_GRID = 24
+GRID_VARIABLE = "AIIDA_BADER_MOCK_GRID"
+
+# Name, default ``default_calc_job_plugin`` and input plugin of each code.
+CODES = {
+    "pw": "quantumespresso.pw",
+    "pp": "quantumespresso.pp",
+    "bader": "bader.bader",
+}
+
+_WRAPPER = """\
+#!/bin/sh
+exec {python} -m aiida_bader.mock {name} "$@"
+"""
+
+_XML_SCHEMA = (
+    "http://www.quantum-espresso.org/ns/qes/qes-1.0 "
+    "http://www.quantum-espresso.org/ns/qes/qes_230310.xsd"
+)
+_XML_NAMESPACES = {
+    "xmlns:qes": "http://www.quantum-espresso.org/ns/qes/qes-1.0",
+    "xmlns:xsi": "http://www.w3.org/2001/XMLSchema-instance",
+    "xsi:schemaLocation": _XML_SCHEMA,
+}
+
+
+def get_grid(default=DEFAULT_GRID):
+    """Return the grid shape given by ``AIIDA_BADER_MOCK_GRID``."""
+    values = [
+        int(value) for value in os.environ.get(GRID_VARIABLE, "").split(",") if value
+    ]
+    if not values:
+        values = [default]
+    return tuple(values * 3) if len(values) == 1 else tuple(values)
+
+
+def write_mock_executables(dirpath, python=None):
+    """Write the wrapper scripts ``mock-pw``, ``mock-pp`` and ``mock-bader`` to ``dirpath``.
+
+    :param python: the Python interpreter that runs the mocks, the current one by default.
+    :return: a dictionary with the absolute path of each executable, by code name.
+    """
+    paths = {}
+    for name in CODES:
+        paths[name] = os.path.abspath(os.path.join(dirpath, f"mock-{name}"))
+        _write_wrapper(paths[name], name, python)
+    return paths
+
+
+def _write_wrapper(path, name, python=None):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf8") as handle:
+        handle.write(_WRAPPER.format(python=python or sys.executable, name=name))
+    os.chmod(path, os.stat(path).st_mode | stat.S_IXUSR | stat.S_IXGRP)
+
+
+def setup_mock_computer(label, workdir):
+    """Return the computer ``label`` that runs jobs in ``workdir`` with ``core.direct``.
+
+    The computer is created and configured if it does not exist. Jobs are run without
+    ``mpirun``, and the engine polls the jobs and opens the transport without delay.
+    """
+    from aiida import orm
+    from aiida.common.exceptions import NotExistent
+
+    try:
+        return orm.load_computer(label)
+    except NotExistent:
+        pass
+    computer = orm.Computer(
+        label=label,
+        hostname="localhost",
+        transport_type="core.local",
+        scheduler_type="core.direct",
+        workdir=os.path.abspath(workdir),
+    ).store()
+    computer.set_mpirun_command([])
+    computer.set_default_mpiprocs_per_machine(1)
+    computer.set_minimum_job_poll_interval(0.0)
+    computer.configure(safe_interval=0.0, use_login_shell=False)
+    return computer
+
+
+def setup_mock_codes(computer, dirpath, grid=None, label_prefix="mock"):
+    """Store the mock codes on ``computer``, with executables written to ``dirpath``.
+
+    The codes are reused if they already exist, and their executable is written again
+    if it was removed, for example with the temporary directory of a previous session.
+
+    :param grid: the grid of the densities, see ``AIIDA_BADER_MOCK_GRID``.
+    :return: a dictionary with the ``InstalledCode`` of each code, by code name.
+    """
+    from aiida import orm
+    from aiida.common.exceptions import NotExistent
+
+    paths = write_mock_executables(dirpath)
+    prepend_text = f"export {GRID_VARIABLE}={grid}" if grid else ""
+    codes = {}
+    for name, plugin in CODES.items():
+        label = f"{label_prefix}-{name}"
+        try:
+            codes[name] = orm.load_code(f"{label}@{computer.label}")
+        except NotExistent:
+            pass
+        else:
+            executable = str(codes[name].filepath_executable)
+            if not os.path.isfile(executable):
+                _write_wrapper(executable, name)
+            continue
+        codes[name] = orm.InstalledCode(
+            label=label,
+            computer=computer,
+            filepath_executable=paths[name],
+            default_calc_job_plugin=plugin,
+            prepend_text=prepend_text,
+        ).store()
+    return codes
+
+
+def create_pseudo_family(label, elements, dirpath):
+    """Create a pseudopotential family with cutoffs from synthetic UPF files.
+
+    The family is loaded if it already exists.
+
+    :param elements: the symbols of the elements.
+    :param dirpath: an empty directory, where the UPF files are written.
+    """
+    from aiida import orm
+    from aiida.common.exceptions import NotExistent
+    from aiida_pseudo.data.pseudo import UpfData
+    from aiida_pseudo.groups.family import CutoffsPseudoPotentialFamily
+    from ase.data import atomic_numbers
+
+    from aiida_bader.testing import write_upf
+
+    try:
+        return orm.load_group(label)
+    except NotExistent:
+        pass
+    for element in elements:
+        with open(os.path.join(dirpath, f"{element}.upf"), "w") as handle:
+            write_upf(handle, element, min(atomic_numbers[element], 18))
+    family = CutoffsPseudoPotentialFamily.create_from_folder(
+        pathlib.Path(dirpath), label, pseudo_type=UpfData
+    )
+    cutoffs = {
+        element: {"cutoff_wfc": 30.0, "cutoff_rho": 240.0} for element in elements
+    }
+    family.set_cutoffs(cutoffs, "standard", unit="Ry")
+    return family
+
+
+def read_pw_input(text):
+    """Return the cell, the species and the atoms of a pw.x input, in Angstrom.
+
+    Only the input written by the ``PwCalculation`` is supported: ``CELL_PARAMETERS`` and
+    ``ATOMIC_POSITIONS`` in Angstrom.
+
+    :return: a dictionary with ``cell`` (3, 3), ``species`` as a list of
+        ``(name, mass, pseudo_file)``, ``symbols`` and ``positions`` (N, 3).
+    """
+    lines = [line.split("!")[0].strip() for line in text.splitlines()]
+    lines = [line for line in lines if line]
+    cards = {}
+    current = None
+    for line in lines:
+        keyword = line.split()[0].upper()
+        if keyword in (
+            "CELL_PARAMETERS",
+            "ATOMIC_SPECIES",
+            "ATOMIC_POSITIONS",
+            "K_POINTS",
+        ):
+            current = cards.setdefault(keyword, [])
+        elif line.startswith("&") or line == "/":
+            current = None
+        elif current is not None:
+            current.append(line.split())
+    nat = int(re.search(r"nat\s*=\s*(\d+)", text).group(1))
+    return {
+        "cell": np.array(cards["CELL_PARAMETERS"][:3], dtype=float),
+        "species": [(row[0], float(row[1]), row[2]) for row in cards["ATOMIC_SPECIES"]],
+        "symbols": [row[0] for row in cards["ATOMIC_POSITIONS"][:nat]],
+        "positions": np.array(
+            [row[1:4] for row in cards["ATOMIC_POSITIONS"][:nat]], dtype=float
+        ),
+    }
+
+
+def _add(parent, tag, text=None, **attributes):
+    element = ET.SubElement(parent, tag, {k: str(v) for k, v in attributes.items()})
+    if text is not None:
+        element.text = (
+            text if isinstance(text, str) else " ".join(f"{x:.10e}" for x in text)
+        )
+    return element
+
+
+def _add_structure(parent, system, alat):
+    structure = _add(parent, "atomic_structure", nat=len(system["symbols"]), alat=alat)
+    positions = _add(structure, "atomic_positions")
+    for index, (symbol, position) in enumerate(
+        zip(system["symbols"], system["positions"] / BOHR_TO_ANGSTROM), start=1
+    ):
+        _add(positions, "atom", position, name=symbol, index=index)
+    cell = _add(structure, "cell")
+    for axis, vector in enumerate(system["cell"] / BOHR_TO_ANGSTROM, start=1):
+        _add(cell, f"a{axis}", vector)
+
+
+def _add_species(parent, system):
+    species = _add(parent, "atomic_species", ntyp=len(system["species"]))
+    for name, mass, pseudo_file in system["species"]:
+        specie = _add(species, "species", name=name)
+        _add(specie, "mass", f"{mass:.8e}")
+        _add(specie, "pseudo_file", pseudo_file)
+
+
+def _add_k_points(parent, tag):
+    k_points = _add(parent, tag)
+    _add(k_points, "monkhorst_pack", "", nk1=1, nk2=1, nk3=1, k1=0, k2=0, k3=0)
+
+
+def write_pw_xml(handle, system, grid, num_electrons):
+    """Write the XML data file of a converged scf calculation of ``system``.
+
+    The file is valid against the QE 7.2 schema, so that the ``PwParser`` takes the same
+    path as for a real calculation.
+    """
+    cell_bohr = system["cell"] / BOHR_TO_ANGSTROM
+    alat = float(np.linalg.norm(cell_bohr[0]))
+    num_bands = max(4, int(num_electrons) // 2 + 4)
+    fft = {f"nr{axis}": points for axis, points in enumerate(grid, start=1)}
+
+    root = ET.Element("qes:espresso", _XML_NAMESPACES)
+    general_info = _add(root, "general_info")
+    _add(general_info, "xml_format", "QEXSD_23.03.10", NAME="QEXSD", VERSION="23.03.10")
+    _add(
+        general_info,
+        "creator",
+        "XML file generated by PWSCF",
+        NAME="PWSCF",
+        VERSION="7.2",
+    )
+    _add(general_info, "created", "mock", DATE="1Jan2023", TIME="0: 0: 0")
+    _add(general_info, "job", "")
+
+    inputs = _add(root, "input")
+    control = _add(inputs, "control_variables")
+    for tag, text in (
+        ("title", ""),
+        ("calculation", "scf"),
+        ("restart_mode", "from_scratch"),
+        ("prefix", "aiida"),
+        ("pseudo_dir", "./pseudo/"),
+        ("outdir", "./out/"),
+        ("stress", "false"),
+        ("forces", "false"),
+        ("wf_collect", "true"),
+        ("disk_io", "low"),
+        ("max_seconds", "10000000"),
+        ("etot_conv_thr", "1.0e-5"),
+        ("forc_conv_thr", "1.0e-3"),
+        ("press_conv_thr", "5.0e-1"),
+        ("verbosity", "low"),
+        ("print_every", "100000"),
+        ("fcp", "false"),
+        ("rism", "false"),
+    ):
+        _add(control, tag, text)
+    _add_species(inputs, system)
+    _add_structure(inputs, system, alat)
+    _add(_add(inputs, "dft"), "functional", "PBE")
+    spin = _add(inputs, "spin")
+    for tag in ("lsda", "noncolin", "spinorbit"):
+        _add(spin, tag, "false")
+    _add(_add(inputs, "bands"), "occupations", "fixed")
+    _add(_add(inputs, "basis"), "ecutwfc", "1.5e1")
+    electron_control = _add(inputs, "electron_control")
+    for tag, text in (
+        ("diagonalization", "davidson"),
+        ("mixing_mode", "plain"),
+        ("mixing_beta", "4.0e-1"),
+        ("conv_thr", "1.0e-10"),
+        ("mixing_ndim", "8"),
+        ("max_nstep", "80"),
+        ("tq_smoothing", "false"),
+        ("tbeta_smoothing", "false"),
+        ("diago_thr_init", "0.0"),
+        ("diago_full_acc", "false"),
+    ):
+        _add(electron_control, tag, text)
+    _add_k_points(inputs, "k_points_IBZ")
+    _add(_add(inputs, "ion_control"), "ion_dynamics", "none")
+    cell_control = _add(inputs, "cell_control")
+    _add(cell_control, "cell_dynamics", "none")
+    _add(cell_control, "pressure", "0.0")
+
+    outputs = _add(root, "output")
+    convergence = _add(_add(outputs, "convergence_info"), "scf_conv")
+    _add(convergence, "convergence_achieved", "true")
+    _add(convergence, "n_scf_steps", "8")
+    _add(convergence, "scf_error", "1.0e-10")
+    algorithmic_info = _add(outputs, "algorithmic_info")
+    _add(algorithmic_info, "real_space_q", "false")
+    _add(algorithmic_info, "real_space_beta", "false")
+    _add(algorithmic_info, "uspp", "false")
+    _add(algorithmic_info, "paw", "false")
+    _add_species(outputs, system)
+    _add_structure(outputs, system, alat)
+    symmetries = _add(outputs, "symmetries")
+    _add(symmetries, "nsym", "1")
+    _add(symmetries, "nrot", "1")
+    _add(symmetries, "space_group", "0")
+    symmetry = _add(symmetries, "symmetry")
+    _add(symmetry, "info", "crystal_symmetry", name="identity")
+    _add(symmetry, "rotation", np.eye(3).ravel(), rank=2, dims="3 3", order="F")
+    basis_set = _add(outputs, "basis_set")
+    _add(basis_set, "gamma_only", "false")
+    _add(basis_set, "ecutwfc", "1.5e1")
+    _add(basis_set, "ecutrho", "1.2e2")
+    _add(basis_set, "fft_grid", "", **fft)
+    _add(basis_set, "fft_smooth", "", **fft)
+    _add(basis_set, "ngm", str(int(np.prod(grid)) // 2))
+    _add(basis_set, "ngms", str(int(np.prod(grid)) // 2))
+    _add(basis_set, "npwx", "100")
+    reciprocal = _add(basis_set, "reciprocal_lattice")
+    inverse = np.linalg.inv(cell_bohr).T * alat
+    for axis, vector in enumerate(inverse, start=1):
+        _add(reciprocal, f"b{axis}", vector)
+    _add(_add(outputs, "dft"), "functional", "PBE")
+    energy = _add(outputs, "total_energy")
+    _add(energy, "etot", f"{-10.0 * len(system['symbols']):.10e}")
+    band_structure = _add(outputs, "band_structure")
+    _add(band_structure, "lsda", "false")
+    _add(band_structure, "noncolin", "false")
+    _add(band_structure, "spinorbit", "false")
+    _add(band_structure, "nbnd", str(num_bands))
+    _add(band_structure, "nelec", f"{num_electrons:.10e}")
+    _add(band_structure, "wf_collected", "true")
+    _add(band_structure, "fermi_energy", "2.0e-1")
+    _add_k_points(band_structure, "starting_k_points")
+    _add(band_structure, "nks", "1")
+    _add(band_structure, "occupations_kind", "fixed")
+    ks_energies = _add(band_structure, "ks_energies")
+    _add(ks_energies, "k_point", [0.0, 0.0, 0.0], weight="2.0")
+    _add(ks_energies, "npw", "100")
+    eigenvalues = np.linspace(-0.5, 0.5, num_bands)
+    _add(ks_energies, "eigenvalues", eigenvalues, size=num_bands)
+    _add(ks_energies, "occupations", (eigenvalues < 0.2).astype(float), size=num_bands)
+    _add(root, "exit_status", "0")
+    _add(root, "cputime", "1")
+
+    ET.ElementTree(root).write(handle, encoding="unicode", xml_declaration=True)
+
+
+_PW_STDOUT = """
+     Program PWSCF v.7.2 starts on  1Jan2024 at  0: 0: 0
+
+     bravais-lattice index     =            0
+     lattice parameter (alat)  = {alat:16.4f}  a.u.
+     unit-cell volume          = {volume:16.4f} (a.u.)^3
+     number of atoms/cell      = {nat:12d}
+     number of atomic types    = {ntyp:12d}
+     number of electrons       = {nelec:16.2f}
+     number of Kohn-Sham states= {nbnd:12d}
+
+     Dense  grid: {points:8d} G-vectors     FFT dimensions: ({nr1:4d},{nr2:4d},{nr3:4d})
+
+     number of k points= {nks:5d}
+
+     total cpu time spent up to now is        0.1 secs
+
+     convergence has been achieved in   8 iterations
+
+!    total energy              = {energy:17.8f} Ry
+
+     PWSCF        :      0.20s CPU      0.20s WALL
+
+
+   JOB DONE.
+"""
+
+
+def run_pw(args):
+    """Run the mock pw.x: ``mock-pw -in aiida.in``."""
+    input_file = args[args.index("-in") + 1]
+    with open(input_file, encoding="utf8") as handle:
+        system = read_pw_input(handle.read())
+    grid = get_grid()
+    valences = {name: 4.0 for name, _, _ in system["species"]}
+    num_electrons = sum(valences[symbol] for symbol in system["symbols"])
+
+    outdir = os.path.join("out", "aiida.save")
+    os.makedirs(outdir, exist_ok=True)
+    with open(os.path.join(outdir, "data-file-schema.xml"), "w") as handle:
+        write_pw_xml(handle, system, grid, num_electrons)
+    # the charge-density and the wavefunctions, with their real sizes
+    num_points = int(np.prod(grid))
+    with open(os.path.join(outdir, "charge-density.dat"), "wb") as handle:
+        handle.truncate(16 * num_points)
+    for index in (1, 2):
+        with open(os.path.join("out", f"aiida.wfc{index}"), "wb") as handle:
+            handle.truncate(16 * num_points)
+
+    cell_bohr = system["cell"] / BOHR_TO_ANGSTROM
+    sys.stdout.write(
+        _PW_STDOUT.format(
+            alat=np.linalg.norm(cell_bohr[0]),
+            volume=abs(np.linalg.det(cell_bohr)),
+            nat=len(system["symbols"]),
+            ntyp=len(system["species"]),
+            nelec=num_electrons,
+            nbnd=max(4, int(num_electrons) // 2 + 4),
+            points=num_points,
+            nr1=grid[0],
+            nr2=grid[1],
+            nr3=grid[2],
+            nks=1,
+            energy=-20.0 * len(system["symbols"]),
+        )
+    )
+
+
+def _read_namelists(text):
+    """Return the values of the ``key = value`` lines of a namelist input."""
+    values = {}
+    for match in re.finditer(r"(\w+)\s*=\s*([^,\n]+)", text):
+        values[match.group(1).lower()] = match.group(2).strip().strip("'\"")
+    return values
+
+
+def _read_pw_xml(path):
+    """Return the cell, the atomic numbers and the positions in Bohr of the XML data file."""
+    from ase.data import atomic_numbers
+
+    root = ET.parse(path).getroot()
+    structure = root.find("output/atomic_structure")
+    cell = np.array(
+        [
+            [float(x) for x in structure.find(f"cell/a{axis}").text.split()]
+            for axis in (1, 2, 3)
+        ]
+    )
+    atoms = structure.findall("atomic_positions/atom")
+    symbols = [re.sub(r"\d+$", "", atom.get("name")) for atom in atoms]
+    positions = np.array([[float(x) for x in atom.text.split()] for atom in atoms])
+    return cell, [atomic_numbers[symbol] for symbol in symbols], positions
+
+
+_PP_STDOUT = """
+     Program POST-PROC v.7.2 starts on  1Jan2024 at  0: 0: 0
+
+     Reading xml data from directory:
+
+     ./out/aiida.save/
+
+     Calling punch_plot, plot_num =  {plot_num}
+     Writing data to be plotted to file {filplot}
+
+     Min, Max, imaginary charge: {minimum:13.6f} {maximum:13.6f}     0.000000
+
+     Plot Type: 3D                     Output format: Gaussian cube
+
+     PP           :      0.10s CPU      0.10s WALL
+
+
+   JOB DONE.
+"""
+
+
+def run_pp():
+    """Run the mock pp.x, which reads its input from the standard input."""
+    from aiida_bader.testing import synthetic_density, write_cube
+
+    values = _read_namelists(sys.stdin.read())
+    outdir = values.get("outdir", "./out/")
+    prefix = values.get("prefix", "aiida")
+    cell, numbers, positions = _read_pw_xml(
+        os.path.join(outdir, f"{prefix}.save", "data-file-schema.xml")
+    )
+    density = synthetic_density(get_grid(), positions, cell)
+    # normalise to the valence of the pseudos of the mock pw.x, or to all electrons
+    num_electrons = 4.0 * len(numbers)
+    if values.get("plot_num") == "21":
+        num_electrons = float(sum(numbers))
+    volume = abs(np.linalg.det(cell)) / density.size
+    density *= num_electrons / (density.sum() * volume)
+
+    filplot = values.get("filplot", "aiida.filplot")
+    with open(filplot, "wb") as handle:
+        handle.truncate(8 * density.size)
+    with open(values.get("fileout", "aiida.fileout"), "w") as handle:
+        write_cube(handle, density, positions, numbers, cell)
+    sys.stdout.write(
+        _PP_STDOUT.format(
+            plot_num=values.get("plot_num", 0),
+            filplot=filplot,
+            minimum=density.min(),
+            maximum=density.max(),
+        )
+    )
+
+
+def write_acf(handle, columns, footer):
+    """Write the ``columns`` and ``footer`` of ``partition.bader_partition`` as ACF.dat."""
+    from aiida_bader.testing import ACF_HEADER, ACF_SEPARATOR
+
+    table = np.column_stack(
+        [
+            np.arange(1, len(columns["charge"]) + 1),
+            columns["coordinates"],
+            columns["charge"],
+            columns["min_dist"],
+            columns["atomic_volume"],
+        ]
+    )
+    handle.write(ACF_HEADER)
+    handle.write(ACF_SEPARATOR)
+    np.savetxt(handle, table, fmt="%5d" + " %11.4f" * 6)
+    handle.write(ACF_SEPARATOR)
+    handle.write(f"    VACUUM CHARGE:{footer['vacuum_charge']:21.4f}\n")
+    handle.write(f"    VACUUM VOLUME:{footer['vacuum_volume']:21.4f}\n")
+    handle.write(f"    NUMBER OF ELECTRONS:{footer['number_of_electrons']:15.4f}\n")
+
+
+def run_bader(args):
+    """Run the mock bader: ``mock-bader density.cube [-ref reference.cube] [-b algorithm]``."""
+    from aiida_bader import cube
+    from aiida_bader.partition import bader_partition
+
+    if not args or not os.path.isfile(args[0]):
+        sys.stdout.write(f"  {args[0] if args else ''} does not exist\n")
+        sys.exit(1)
+    options = dict(zip(args[1::2], args[2::2]))
+    with open(args[0], "rb") as handle:
+        header, rho = cube.read_cube(handle)
+    reference = None
+    if "-ref" in options:
+        with open(options["-ref"], "rb") as handle:
+            _, reference = cube.read_cube(handle)
+    algorithm = options.get("-b", "neargrid")
+    columns, footer = bader_partition(
+        rho,
+        header["voxel"],
+        header["positions"],
+        origin=header["origin"],
+        reference=reference,
+        algorithm="ongrid" if algorithm == "ongrid" else "neargrid",
+        vacuum=options.get("-vac", "off"),
+    )
+    with open("ACF.dat", "w") as handle:
+        write_acf(handle, columns, footer)
+    for filename in ("BCF.dat", "AVF.dat"):
+        with open(filename, "w") as handle:
+            handle.write(f"    #  {filename} of the mock bader\n")
+    sys.stdout.write("  GRID BASED BADER ANALYSIS  (Version 1.05 mock)\n")
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    name, args = argv[0], argv[1:]
+    if name == "pw":
+        run_pw(args)
+    elif name == "pp":
+        run_pp()
+    elif name == "bader":
+        run_bader(args)
+    else:
+        raise SystemExit(f"unknown code `{name}`, expected one of {', '.join(CODES)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,22 +2,251 @@
 """AiiDA bader plugin parser"""
 from __future__ import absolute_import
 
+import datetime
+import io
+import itertools
+import json
 import os
+import time
 
 from aiida.common import NotExistent, OutputParsingError
 from aiida.engine import ExitCode
 from aiida.parsers.parser import Parser
-from aiida.orm import ArrayData
+from aiida.orm import ArrayData, Dict
 import numpy as np
 
+from aiida_bader.timing import TIMING_EXTRA
+
+# Number of bytes read from the end of ACF.dat to check the footer.
+_FOOTER_BYTES = 1024
+
+# Keys of the ACF.dat footer and the attribute names they are stored under.
+ACF_FOOTER_KEYS = {
+    "VACUUM CHARGE": "vacuum_charge",
+    "VACUUM VOLUME": "vacuum_volume",
+    "NUMBER OF ELECTRONS": "number_of_electrons",
+}
+
+
+# Messages of bader and of the Fortran runtime about the input cube files.
+CUBE_MISSING_MESSAGES = ("does not exist", "No such file or directory")
+CUBE_TRUNCATED_MESSAGES = ("End of file", "end of file")
+
+
+def _stream_table(handle, usecols, dtype=float):
+    """Stream the table between the first two separator lines of a bader output file.
+
+    :param handle: a binary, seekable file handle.
+    :param usecols: the columns of the table to read.
+    :param dtype: the data type of the returned array.
+    :return: a two-dimensional array with one row per table line.
+    :raise OutputParsingError: if the table cannot be parsed.
+    """
+    handle.seek(0)
+    text = io.TextIOWrapper(handle, encoding="ascii")
+    try:
+        # skip the column header and the first separator line
+        next(text)
+        next(text)
+        rows = itertools.takewhile(lambda line: not line.lstrip().startswith("-"), text)
+        return np.loadtxt(rows, usecols=usecols, dtype=dtype, ndmin=2)
+    except (StopIteration, ValueError) as exc:
+        raise OutputParsingError(f"Could not parse the table: {exc}") from exc
+    finally:
+        # do not let the wrapper close the handle owned by the caller
+        text.detach()
+
+
+def parse_acf(handle):
+    """Parse an ``ACF.dat`` file written by bader in a single streaming pass.
+
+    The footer is checked first by seeking to the end of the file, so that a truncated
+    file is rejected before the atom table is read. The atom table is then streamed
+    line by line into NumPy, without keeping the text in memory.
+
+    :param handle: a binary, seekable file handle of ``ACF.dat``.
+    :return: a tuple ``(columns, footer)``. ``columns`` maps ``coordinates`` (N, 3),
+        ``charge``, ``min_dist`` and ``atomic_volume`` to arrays, ``footer`` maps the
+        values of ``ACF_FOOTER_KEYS`` to floats.
+    :raise OutputParsingError: if the footer is missing or the table cannot be parsed.
+    """
+    handle.seek(0, os.SEEK_END)
+    size = handle.tell()
+    handle.seek(max(size - _FOOTER_BYTES, 0))
+    tail = handle.read().decode("ascii", errors="replace")
+
+    footer = {}
+    for line in tail.splitlines():
+        key, _, value = line.partition(":")
+        if key.strip() in ACF_FOOTER_KEYS:
+            footer[ACF_FOOTER_KEYS[key.strip()]] = float(value)
+    if "number_of_electrons" not in footer:
+        raise OutputParsingError("Calculation did not finish correctly")
+
+    table = _stream_table(handle, usecols=(1, 2, 3, 4, 5, 6))
+
+    columns = {
+        "coordinates": np.ascontiguousarray(table[:, 0:3]),
+        "charge": np.ascontiguousarray(table[:, 3]),
+        "min_dist": np.ascontiguousarray(table[:, 4]),
+        "atomic_volume": np.ascontiguousarray(table[:, 5]),
+    }
+    return columns, footer
+
+
+def parse_bcf(handle):
+    """Parse a ``BCF.dat`` file written by bader into compact typed arrays.
+
+    Each row of ``BCF.dat`` describes one Bader basin (one charge-density maximum).
+    Note that bader does not write the volume of the individual basins to this file.
+
+    :param handle: a binary, seekable file handle of ``BCF.dat``.
+    :return: a dictionary mapping ``basin_coordinates`` (float32, (M, 3)),
+        ``basin_charge`` (float32), ``basin_atom`` (int32, the 1-based index of the atom
+        that the basin is assigned to, as written by bader) and ``basin_distance``
+        (float32) to arrays.
+    """
+    table = _stream_table(handle, usecols=(1, 2, 3, 4, 5, 6))
+    return {
+        "basin_coordinates": table[:, 0:3].astype(np.float32),
+        "basin_charge": table[:, 3].astype(np.float32),
+        "basin_atom": table[:, 4].astype(np.int32),
+        "basin_distance": table[:, 5].astype(np.float32),
+    }
+
+
+def parse_avf(handle):
+    """Parse an ``AVF.dat`` file written by bader, which lists the basins of each atom.
+
+    The ragged table is stored in compressed sparse row form: the (1-based) basins of
+    atom ``i`` are ``atom_basins[atom_basin_offsets[i]:atom_basin_offsets[i + 1]]``.
+
+    :param handle: a binary, seekable file handle of ``AVF.dat``.
+    :return: a dictionary mapping ``atom_basins`` and ``atom_basin_offsets`` (int32) to
+        arrays.
+    """
+    handle.seek(0)
+    basins = []
+    offsets = [0]
+    in_table = False
+    for line in handle.read().decode("ascii").splitlines():
+        if line.lstrip().startswith("-"):
+            if in_table:
+                break
+            in_table = True
+            continue
+        if in_table and line.strip():
+            # the first column is the atom index, the others are its basins
+            values = line.split()[1:]
+            basins.extend(int(value) for value in values)
+            offsets.append(len(basins))
+    return {
+        "atom_basins": np.array(basins, dtype=np.int32),
+        "atom_basin_offsets": np.array(offsets, dtype=np.int32),
+    }
+
+
+def parse_timing(handle):
+    """Parse the timing file written by the job script of a ``BaderCalculation``.
+
+    Each line is ``start <epoch>``, ``end <epoch>`` or ``cube <name> <transfer> <size>``,
+    where the size is missing if the cube file did not exist. The epochs have
+    nanoseconds, except where ``date`` does not support ``%N`` and writes ``<seconds>.N``.
+
+    :param handle: a text file handle.
+    :return: a dictionary with ``job``, the ``start`` and ``end`` of the job as ISO 8601
+        strings and its duration in ``seconds``, if both were recorded, and ``cubes``,
+        mapping each cube file to its ``transfer`` and its ``size`` in bytes.
+    """
+    times = {}
+    cubes = {}
+    for line in handle:
+        fields = line.split()
+        if len(fields) == 2 and fields[0] in ("start", "end"):
+            seconds, _, nanoseconds = fields[1].partition(".")
+            times[fields[0]] = float(
+                f"{seconds}.{nanoseconds}" if nanoseconds.isdigit() else seconds
+            )
+        elif len(fields) >= 3 and fields[0] == "cube":
+            size = int(fields[3]) if len(fields) > 3 else None
+            cubes[fields[1]] = {"transfer": fields[2], "size": size}
+    timing = {"cubes": cubes}
+    if "start" in times and "end" in times:
+        timing["job"] = {
+            key: datetime.datetime.fromtimestamp(
+                times[key], datetime.timezone.utc
+            ).isoformat()
+            for key in ("start", "end")
+        }
+        timing["job"]["seconds"] = times["end"] - times["start"]
+    return timing
+
+
+def get_charge_summary(charges, symbols=None):
+    """Return scalar summaries of the Bader charges, to be stored as node attributes.
+
+    :param charges: the array of Bader charges.
+    :param symbols: optional list with the chemical symbol of each atom.
+    :return: a dictionary of JSON-serializable values.
+    """
+    summary = {"num_atoms": int(charges.size)}
+    if charges.size:
+        summary.update(
+            {
+                "total_charge": float(charges.sum()),
+                "min_charge": float(charges.min()),
+                "max_charge": float(charges.max()),
+                "mean_charge": float(charges.mean()),
+            }
+        )
+    if symbols is not None and len(symbols) == charges.size:
+        symbols = np.asarray(symbols)
+        summary["charge_per_element"] = {
+            str(symbol): float(charges[symbols == symbol].sum())
+            for symbol in np.unique(symbols)
+        }
+    return summary
+
+
+def get_bader_charge_array(columns, footer, structure=None):
+    """Return the ``bader_charge`` output from the parsed ACF.dat columns and footer.
+
+    The footer and the summary of the charges are stored as attributes, so that they
+    can be queried without reading the arrays.
+
+    :param structure: optional ``StructureData``, to sum the charges per element.
+    """
+    array = ArrayData()
+    for name, values in columns.items():
+        array.set_array(name, values)
+    symbols = None
+    if structure is not None:
+        kind_symbols = {kind.name: kind.symbol for kind in structure.kinds}
+        symbols = [kind_symbols[site.kind_name] for site in structure.sites]
+    for name, value in footer.items():
+        array.base.attributes.set(name, value)
+    for name, value in get_charge_summary(columns["charge"], symbols).items():
+        array.base.attributes.set(name, value)
+    return array
+
 
 class BaderParser(Parser):
     """
     Parser class for parsing output of bader charge analysis.
     """
 
-    # pylint: disable=protected-access
     def parse(self, **kwargs):
+        """Parse output structure and charge, and record the timing of the job."""
+        start = time.perf_counter()
+        try:
+            return self._parse(**kwargs)
+        finally:
+            self._record_timing(
+                kwargs.get("retrieved_temporary_folder"), time.perf_counter() - start
+            )
+
+    # pylint: disable=protected-access
+    def _parse(self, **kwargs):
         """Parse output structure and charge."""
 
         # Check that the retrieved folder is there
@@ -36,23 +265,132 @@ class BaderParser(Parser):
 
         # We need at least the output file name as defined in calcs.py
         if output_file not in list_of_files:
-            return self.exit_codes.ERROR_NO_OUTPUT_FILE
+            return self._get_failure_exit_code(self.exit_codes.ERROR_NO_OUTPUT_FILE)
+
+        with out_folder.base.repository.open(output_file, "rb") as handle:
+            try:
+                columns, footer = parse_acf(handle)
+            except OutputParsingError:
+                return self._get_failure_exit_code(
+                    self.exit_codes.ERROR_OUTPUT_TRUNCATED
+                )
+
+        structure = (
+            self.node.inputs.structure if "structure" in self.node.inputs else None
+        )
+        self.out("bader_charge", get_bader_charge_array(columns, footer, structure))
+
+        retrieved_temporary_folder = kwargs.get("retrieved_temporary_folder")
+        if (
+            retrieved_temporary_folder is not None
+            and self.node.inputs.retrieve_basins.value
+        ):
+            basins = self._parse_basins(retrieved_temporary_folder)
+            if basins is not None:
+                self.out("bader_basins", basins)
+
+        return ExitCode(0)
+
+    def _record_timing(self, retrieved_temporary_folder, parse_seconds):
+        """Store the timing file of the job and the parse duration in the node extras."""
+        timing = {"parse_seconds": parse_seconds}
+        if retrieved_temporary_folder is not None:
+            filepath = os.path.join(
+                retrieved_temporary_folder, self.node.process_class._TIMING_FILE
+            )  # pylint: disable=protected-access
+            if os.path.isfile(filepath):
+                with open(filepath, encoding="utf8") as handle:
+                    timing.update(parse_timing(handle))
+        self.node.base.extras.set(TIMING_EXTRA, timing)
+
+    def _get_failure_exit_code(self, default):
+        """Return the exit code of a run that did not write a complete ACF.dat.
+
+        Errors about the input cube files in the output of bader come first, then the
+        error reported by the scheduler, if any, and ``default`` otherwise.
+        """
+        output = ""
+        for option in ("scheduler_stdout", "scheduler_stderr"):
+            filename = self.node.get_option(option)
+            try:
+                output += self.retrieved.base.repository.get_object_content(filename)
+            except (FileNotFoundError, OSError, TypeError):
+                continue
+        if any(message in output for message in CUBE_MISSING_MESSAGES):
+            return self.exit_codes.ERROR_INPUT_CUBE_MISSING
+        if any(message in output for message in CUBE_TRUNCATED_MESSAGES):
+            return self.exit_codes.ERROR_INPUT_CUBE_TRUNCATED
+        if self.node.exit_status:
+            return ExitCode(self.node.exit_status, self.node.exit_message)
+        return default
 
-        finished = False
-        with out_folder.open(output_file) as file:
-            for line in file.readlines():
-                if "NUMBER OF ELECTRONS" in line:
-                    finished = True
+    def _parse_basins(self, retrieved_temporary_folder):
+        """Parse BCF.dat and AVF.dat from the temporary retrieved folder, if present."""
+        process_class = self.node.process_class
+        arrays = {}
+        for filename, parse in (
+            (process_class._BASIN_FILE, parse_bcf),
+            (process_class._ATOM_VOLUME_FILE, parse_avf),
+        ):
+            filepath = os.path.join(retrieved_temporary_folder, filename)
+            if not os.path.isfile(filepath):
+                self.logger.warning(f"{filename} was not retrieved, skipping it.")
+                continue
+            with open(filepath, "rb") as handle:
+                arrays.update(parse(handle))
 
-        if not finished:
-            raise OutputParsingError("Calculation did not finish correctly")
+        if not arrays:
+            return None
+        basins = ArrayData()
+        for name, values in arrays.items():
+            basins.set_array(name, values)
+        return basins
 
-        # Create CifData object from the following the file path returned by xyz2cif
-        with out_folder.open(output_file) as f:
-            lines = f.readlines()
-            charges = [float(line.split()[4]) for line in lines[2:-4]]
-        array = ArrayData()
-        array.set_array("charge", np.array(charges))
-        self.out("bader_charge", array)
 
+class CubeConversionParser(Parser):
+    """
+    Parser class for the conversion of a cube file to a binary density cache.
+    """
+
+    # pylint: disable=protected-access
+    def parse(self, **kwargs):
+        """Store the header of the density cache, without the per-atom lists."""
+        header_file = f"{self.node.process_class._PREFIX}.json"
+        try:
+            with self.retrieved.base.repository.open(header_file, "r") as handle:
+                header = json.load(handle)
+        except (FileNotFoundError, ValueError):
+            return self.exit_codes.ERROR_NO_HEADER_FILE
+
+        self.out(
+            "header",
+            Dict(
+                {
+                    "shape": header["shape"],
+                    "voxel": header["voxel"],
+                    "origin": header["origin"],
+                    "num_atoms": len(header["numbers"]),
+                    "dtype": header["dtype"],
+                }
+            ),
+        )
+        return ExitCode(0)
+
+
+class CubeResampleParser(Parser):
+    """
+    Parser class for the resampling of the cube files to other grids.
+    """
+
+    # pylint: disable=protected-access
+    def parse(self, **kwargs):
+        """Store the grids and the number of electrons of the resampled densities."""
+        summary_file = self.node.process_class._SUMMARY_FILE
+        try:
+            with self.retrieved.base.repository.open(summary_file, "r") as handle:
+                summary = json.load(handle)
+        except (FileNotFoundError, ValueError):
+            return self.exit_codes.ERROR_NO_SUMMARY_FILE
+
+        self.out("output_parameters", Dict(summary))
         return ExitCode(0)
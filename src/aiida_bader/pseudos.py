@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+"""Install the pseudopotential groups of the plugin from their AiiDA archives.
+
+The archives are imported with the Python API of AiiDA, in the running process. An
+archive is taken from the local archive directory if it is there, e.g. on clusters
+without internet access, and downloaded from ``BASE_URL`` otherwise. Concurrent
+requests for the same group share a single ``InstallJob``, and the jobs run one after
+the other in a background thread, so that only one import writes to the storage.
+"""
+import os
+import pathlib
+import shutil
+import tempfile
+import threading
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+BASE_URL = "https://github.com/superstar54/aiida-bader/raw/main/data/"
+
+PSEUDO_GROUPS = ("psl_kjpaw_pbe", "psl_kjpaw_pbesol")
+
+# The environment variable of the local archive directory.
+ARCHIVE_DIR_ENV = "AIIDA_BADER_PSEUDO_DIR"
+
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+
+
+def get_archive_dir():
+    """Return the local archive directory of ``ARCHIVE_DIR_ENV``, or ``None``."""
+    archive_dir = os.environ.get(ARCHIVE_DIR_ENV)
+    return pathlib.Path(archive_dir).expanduser() if archive_dir else None
+
+
+def get_archive_source(group_label, archive_dir=None):
+    """Return the path of the archive of the group in the local archive directory if
+    it exists, and its URL otherwise.
+
+    :param archive_dir: the local archive directory, by default ``get_archive_dir()``.
+    """
+    archive_dir = archive_dir or get_archive_dir()
+    if archive_dir is not None:
+        path = pathlib.Path(archive_dir) / f"{group_label}.aiida"
+        if path.is_file():
+            return path
+    return BASE_URL + group_label + ".aiida"
+
+
+class InstallJob:
+    """The installation of a pseudopotential group, see ``PseudoInstaller``.
+
+    The ``status`` is one of ``STATUSES``, and ``progress`` is the fraction of the
+    archive that was downloaded, or ``None`` if its size is not known. The callbacks
+    are called with the job whenever these change, from the thread of the job.
+    """
+
+    STATUSES = ("queued", "downloading", "importing", "finished", "failed")
+
+    def __init__(self, group_label, source):
+        self.group_label = group_label
+        self.source = source
+        self.status = "queued"
+        self.progress = None
+        self.exception = None
+        self.future = None
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    def add_callback(self, callback):
+        """Add a callback, which is called at once with the current state."""
+        with self._lock:
+            self._callbacks.append(callback)
+        callback(self)
+
+    def _update(self, status, progress=None):
+        self.status = status
+        self.progress = progress
+        with self._lock:
+            callbacks = list(self._callbacks)
+        for callback in callbacks:
+            callback(self)
+
+    def wait(self, timeout=None):
+        """Wait for the job, and raise its exception if it failed."""
+        self.future.result(timeout)
+
+    def _download(self, url, path):
+        with urllib.request.urlopen(url) as response, open(path, "wb") as handle:
+            size = int(response.headers.get("Content-Length") or 0)
+            downloaded = 0
+            self._update("downloading", 0.0 if size else None)
+            while chunk := response.read(DOWNLOAD_CHUNK_SIZE):
+                handle.write(chunk)
+                downloaded += len(chunk)
+                if size:
+                    self._update("downloading", min(downloaded / size, 1.0))
+
+    def run(self):
+        """Download the archive if needed and import it, without an import group."""
+        from aiida.tools.archive import import_archive
+
+        try:
+            if isinstance(self.source, pathlib.Path):
+                self._update("importing")
+                import_archive(self.source, create_group=False)
+            else:
+                directory = tempfile.mkdtemp()
+                try:
+                    path = os.path.join(directory, f"{self.group_label}.aiida")
+                    self._download(self.source, path)
+                    self._update("importing")
+                    import_archive(path, create_group=False)
+                finally:
+                    shutil.rmtree(directory, ignore_errors=True)
+        except Exception as exception:
+            self.exception = exception
+            self._update("failed")
+            raise
+        self._update("finished", 1.0)
+
+
+class PseudoInstaller:
+    """Install the pseudopotential groups in a background thread.
+
+    :param archive_dir: the local archive directory, by default ``get_archive_dir()``.
+    """
+
+    def __init__(self, archive_dir=None):
+        self.archive_dir = archive_dir
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="aiida-bader-pseudos"
+        )
+
+    def install(self, group_label, callback=None):
+        """Return the ``InstallJob`` of the group, which is submitted unless a job of
+        the group is already queued or running.
+
+        :param callback: optional function called with the job when its state changes.
+        """
+        with self._lock:
+            job = self._jobs.get(group_label)
+            if job is None:
+                source = get_archive_source(group_label, self.archive_dir)
+                job = InstallJob(group_label, source)
+                job.future = self._executor.submit(self._run, job)
+                self._jobs[group_label] = job
+        if callback is not None:
+            job.add_callback(callback)
+        return job
+
+    def _run(self, job):
+        try:
+            job.run()
+        finally:
+            with self._lock:
+                self._jobs.pop(job.group_label, None)
+
+
+_INSTALLER = None
+_INSTALLER_LOCK = threading.Lock()
+
+
+def get_installer():
+    """Return the ``PseudoInstaller`` shared by the process."""
+    global _INSTALLER
+    with _INSTALLER_LOCK:
+        if _INSTALLER is None:
+            _INSTALLER = PseudoInstaller()
+        return _INSTALLER
@@ -3,6 +3,8 @@ from aiidalab_qe.common.mixins import HasInputStructure
 from aiidalab_qe.common.panel import ConfigurationSettingsModel
 from aiida.orm import QueryBuilder, Group
 
+from aiida_bader.pseudos import PSEUDO_GROUPS
+
 
 class ConfigurationSettingsModel(ConfigurationSettingsModel, HasInputStructure):
     title = "Bader charge"
@@ -19,10 +21,7 @@ class ConfigurationSettingsModel(ConfigurationSettingsModel, HasInputStructure):
     functional = tl.Unicode(allow_none=True)
     pseudo_group_options = tl.List(
         trait=tl.Unicode(),
-        default_value=[
-            "psl_kjpaw_pbe",
-            "psl_kjpaw_pbesol",
-        ],
+        default_value=list(PSEUDO_GROUPS),
     )
     pseudo_group = tl.Unicode("psl_kjpaw_pbesol")
 
@@ -2,9 +2,11 @@
 BaderResultsModel: Handles fetching and storing Bader charge results.
 """
 from aiidalab_qe.common.panel import ResultsModel
+import numpy as np
 import traitlets as tl
 from aiida import orm
-import time
+
+from aiida_bader.charge_table import ChargeTable
 
 
 class BaderResultsModel(ResultsModel):
@@ -13,7 +15,7 @@ class BaderResultsModel(ResultsModel):
     identifier = "bader"
 
     structure = tl.Instance(orm.StructureData, allow_none=True)
-    bader_charges = tl.List(allow_none=True)
+    bader_charges = tl.Instance(np.ndarray, allow_none=True)
     z_valencces = tl.Dict(allow_none=True)
 
     _this_process_label = "QeBaderWorkChain"
@@ -26,10 +28,18 @@ class BaderResultsModel(ResultsModel):
         root = self.fetch_process_node()
 
         self.structure = root.inputs.bader.structure
+        z_valences = {}
         for key, pseudo in root.inputs.bader.scf.pw.pseudos.items():
             if getattr(pseudo, "z_valence", False):
-                self.z_valencces[key] = getattr(pseudo, "z_valence")
+                z_valences[key] = getattr(pseudo, "z_valence")
+        self.z_valencces = z_valences
         bader_outputs = self._get_child_outputs()
-        bader_charge_array = bader_outputs.bader.bader_charge.get_array("charge")
-
-        self.bader_charges = [round(c, 2) for c in bader_charge_array]
+        self.bader_charges = bader_outputs.bader.bader_charge.get_array("charge")
+
+    def get_charge_table(self):
+        """Return the ``ChargeTable`` of the charges, which are kept as NumPy arrays."""
+        return ChargeTable(
+            self.bader_charges,
+            self.structure.get_site_kindnames(),
+            self.z_valencces,
+        )
@@ -2,6 +2,7 @@
 BaderResultsPanel: Renders the Bader Charge results using the BaderResultsModel.
 """
 import ipywidgets as ipw
+import numpy as np
 from aiidalab_qe.common.panel import ResultsPanel
 from weas_widget import WeasWidget
 from .model import BaderResultsModel
@@ -9,14 +10,55 @@ from table_widget import TableWidget  # Your custom TableWidget
 from aiidalab_qe.common.infobox import InAppGuide
 
 
+# Sites per page of the table, only the rows of one page are sent to the browser.
+PAGE_SIZES = (25, 50, 100)
+# Step of the charge filter, in electrons.
+CHARGE_STEP = 0.001
+# Atoms above which the viewer shows no atom labels.
+LABEL_MAX_ATOMS = 1000
+
+COLUMNS = [
+    {"field": "site_index", "headerName": "Site Index"},
+    {"field": "element", "headerName": "Element"},
+    {"field": "bader_charge", "headerName": "Bader Charge"},
+    {"field": "charge_diff", "headerName": "Bader charge difference", "width": 200},
+]
+AGGREGATE_COLUMNS = [
+    {"field": "element", "headerName": "Element"},
+    {"field": "count", "headerName": "Sites"},
+    {"field": "total_charge", "headerName": "Total charge"},
+    {"field": "mean_charge", "headerName": "Mean charge"},
+    {"field": "min_charge", "headerName": "Min charge"},
+    {"field": "max_charge", "headerName": "Max charge"},
+    {"field": "mean_charge_diff", "headerName": "Mean difference", "width": 150},
+]
+SORT_OPTIONS = [
+    ("Site index", "site_index"),
+    ("Element", "element"),
+    ("Bader charge", "bader_charge"),
+    ("Charge difference", "charge_diff"),
+]
+
+
+def _columns(columns):
+    # the rows are sorted on the server, sorting in the browser would only sort a page
+    return [{"editable": False, "sortable": False, **column} for column in columns]
+
+
 class BaderResultsPanel(ResultsPanel[BaderResultsModel]):
     """Panel (View + Controller) for displaying the Bader charge results."""
 
     def _render(self):
         """"""
         self._model.fetch_result()
-        self.result_table = TableWidget()
-        self._populate_table()
+        self._table = self._model.get_charge_table()
+        self._indices = self._table.site_index
+        self._page = 0
+
+        self.result_table = TableWidget(config={"pageSize": PAGE_SIZES[1]})
+        self.aggregate_table = TableWidget()
+        self._setup_controls()
+        self._update_query()
 
         gui_config = {
             "components": {"enabled": True, "atomsControl": True, "buttons": True},
@@ -40,43 +82,91 @@ class BaderResultsPanel(ResultsPanel[BaderResultsModel]):
         ]
         self.results_container.children = children
 
-    def _populate_table(self):
-        columns = [
-            {"field": "site_index", "headerName": "Site Index", "editable": False},
-            {"field": "element", "headerName": "Element", "editable": False},
-            {"field": "bader_charge", "headerName": "Bader Charge", "editable": False},
-            {
-                "field": "charge_diff",
-                "headerName": "Bader charge difference",
-                "editable": False,
-                "width": 200,
-            },
-        ]
-        data = []
-
-        for i, site in enumerate(self._model.structure.sites):
-            charge = self._model.bader_charges[i]
-            kind_name = site.kind_name
-            if kind_name in self._model.z_valencces:
-                z_valence = self._model.z_valencces[kind_name]
-                charge_diff = z_valence - charge
-            else:
-                charge_diff = None
-            data.append(
-                {
-                    "site_index": i,
-                    "element": kind_name,
-                    "bader_charge": round(charge, 3),
-                    "charge_diff": round(charge_diff, 3)
-                    if charge_diff is not None
-                    else None,
-                }
-            )
+    def _setup_controls(self):
+        """Create the widgets that filter, sort and page the table."""
+        # the ends are rounded outwards, so that no site is cut off by the step
+        charges = self._table.bader_charge
+        low = np.floor(charges.min() / CHARGE_STEP) * CHARGE_STEP
+        high = np.ceil(charges.max() / CHARGE_STEP) * CHARGE_STEP
+        self.element_filter = ipw.SelectMultiple(
+            options=self._table.elements,
+            value=self._table.elements,
+            description="Elements",
+            rows=min(len(self._table.elements), 5),
+        )
+        self.charge_filter = ipw.FloatRangeSlider(
+            value=(low, high),
+            min=low,
+            max=high,
+            step=CHARGE_STEP,
+            readout_format=".3f",
+            description="Charge",
+            continuous_update=False,
+        )
+        self.sort_by = ipw.Dropdown(options=SORT_OPTIONS, description="Sort by")
+        self.descending = ipw.ToggleButton(
+            description="Descending", icon="sort-amount-desc"
+        )
+        for widget in (
+            self.element_filter,
+            self.charge_filter,
+            self.sort_by,
+            self.descending,
+        ):
+            widget.observe(self._update_query, "value")
+
+        self.page_size = ipw.Dropdown(
+            options=PAGE_SIZES,
+            value=PAGE_SIZES[1],
+            description="Rows",
+            layout={"width": "150px"},
+        )
+        self.page_size.observe(self._on_page_size_change, "value")
+        self.previous_page = ipw.Button(icon="chevron-left", layout={"width": "40px"})
+        self.next_page = ipw.Button(icon="chevron-right", layout={"width": "40px"})
+        self.previous_page.on_click(lambda _: self._set_page(self._page - 1))
+        self.next_page.on_click(lambda _: self._set_page(self._page + 1))
+        self.page_label = ipw.Label()
+
+    def _update_query(self, _=None):
+        """Filter and sort the sites, and show the first page and the element sums."""
+        # a slider at its ends does not filter, whatever the rounding of its values
+        low, high = self.charge_filter.value
+        charge_range = (
+            None if low <= self.charge_filter.min else low,
+            None if high >= self.charge_filter.max else high,
+        )
+        self._indices = self._table.query(
+            elements=self.element_filter.value,
+            charge_range=charge_range,
+            sort_by=self.sort_by.value,
+            ascending=not self.descending.value,
+        )
+        self.aggregate_table.from_data(
+            self._table.aggregate(self._indices), columns=_columns(AGGREGATE_COLUMNS)
+        )
+        self._set_page(0)
+
+    def _on_page_size_change(self, change):
+        self.result_table.config = {
+            **self.result_table.config,
+            "pageSize": change["new"],
+        }
+        self._set_page(0)
 
+    def _set_page(self, page):
+        """Send the rows of ``page`` of the filtered sites to the table."""
+        indices, num_pages = self._table.page(self._indices, page, self.page_size.value)
+        self._page = min(max(page, 0), num_pages - 1)
         self.result_table.from_data(
-            data,
-            columns=columns,
+            self._table.rows(indices), columns=_columns(COLUMNS)
         )
+        self.page_label.value = (
+            f"Page {self._page + 1} of {num_pages}, {len(self._indices)} of "
+            f"{len(self._table)} sites"
+        )
+        self.previous_page.disabled = self._page == 0
+        self.next_page.disabled = self._page == num_pages - 1
 
     def _setup_structure_view(self):
         if self._model.structure:
@@ -84,14 +174,13 @@ class BaderResultsPanel(ResultsPanel[BaderResultsModel]):
             self.structure_view.from_ase(ase_atoms)
             self.structure_view.avr.model_style = 1
             self.structure_view.avr.color_type = "VESTA"
-            self.structure_view.avr.atom_label_type = "Index"
+            if len(ase_atoms) <= LABEL_MAX_ATOMS:
+                self.structure_view.avr.atom_label_type = "Index"
 
     def _on_row_index_change(self, change):
-        if change["new"] is not None:
-            row_index = int(change["new"])
-            # The first row is the header, so we do +1 offset.
-            site_idx = self.result_table.data[row_index]["site_index"]
-            self.structure_view.avr.selected_atoms_indices = [site_idx]
+        # the id of a row is its site index, only the selection is sent to the viewer
+        if change["new"] is not None and change["new"] >= 0:
+            self.structure_view.avr.selected_atoms_indices = [int(change["new"])]
 
     def _create_layout(self):
         structure_help = ipw.HTML(
@@ -120,10 +209,38 @@ class BaderResultsPanel(ResultsPanel[BaderResultsModel]):
             layout=ipw.Layout(margin="0 0 20px 0"),
         )
 
+        controls = ipw.VBox(
+            [
+                ipw.HBox([self.element_filter, self.charge_filter]),
+                ipw.HBox([self.sort_by, self.descending]),
+            ]
+        )
+        pages = ipw.HBox(
+            [self.previous_page, self.page_label, self.next_page, self.page_size],
+            layout=ipw.Layout(align_items="center"),
+        )
+        aggregate_help = ipw.HTML(
+            """
+            <div style='margin: 10px 0;'>
+                <h4 style='margin-bottom: 5px; color: #3178C6;'>Per element</h4>
+                <p style='margin: 5px 0; font-size: 14px;'>
+                    The sums and means over the sites that pass the filters.
+                </p>
+            </div>
+            """
+        )
+
         return ipw.HBox(
             children=[
                 ipw.VBox(
-                    [table_help, self.result_table],
+                    [
+                        table_help,
+                        controls,
+                        self.result_table,
+                        pages,
+                        aggregate_help,
+                        self.aggregate_table,
+                    ],
                     layout=ipw.Layout(width="50%", margin="0 10px 0 0"),
                 ),
                 ipw.VBox(
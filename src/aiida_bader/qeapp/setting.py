@@ -1,11 +1,10 @@
 """Panel for bader plugin."""
-import threading
-import time
 import ipywidgets as ipw
 from aiidalab_qe.common.panel import ConfigurationSettingsPanel
 from .model import ConfigurationSettingsModel
 from aiidalab_qe.common.infobox import InAppGuide
-from aiida_bader.utils import pseudo_group_exists, install_pseudos
+from aiida_bader.pseudos import get_installer
+from aiida_bader.utils import pseudo_group_exists
 
 PSEUDO_PSL_URL = "https://pseudopotentials.quantum-espresso.org/legacy_tables"
 
@@ -26,22 +25,24 @@ class ConfigurationSettingPanel(ConfigurationSettingsPanel[ConfigurationSettings
         if not pseudo_group_exists(group_label):
             self.pseudo_status.value = (
                 f'<div style="color: red;"><strong>Warning:</strong> '
-                f'Pseudopotential group "{group_label}" is missing. Downloading now...</div>'
+                f'Pseudopotential group "{group_label}" is missing. Installing now...</div>'
             )
-            thread = threading.Thread(
-                target=self._install_pseudo_in_background, args=(group_label,)
-            )
-            thread.start()
+            get_installer().install(group_label, callback=self._on_install_progress)
         else:
             self.pseudo_status.value = f'<div style="color: green;">Pseudopotential group "{group_label}" is available.</div>'
 
-    def _install_pseudo_in_background(self, group_label):
-        """Downloads and installs the missing pseudopotential group in a background thread."""
-        install_pseudos(group_label)
-
-        if pseudo_group_exists(group_label):
+    def _on_install_progress(self, job):
+        """Show the state of the installation of the pseudo group, from its thread."""
+        group_label = job.group_label
+        if group_label != self._model.pseudo_group:
+            return
+        if job.status == "downloading" and job.progress is not None:
+            self.pseudo_status.value = f'<div style="color: red;">Downloading pseudopotential group "{group_label}": {job.progress:.0%}</div>'
+        elif job.status == "importing":
+            self.pseudo_status.value = f'<div style="color: red;">Importing pseudopotential group "{group_label}"...</div>'
+        elif job.status == "finished" and pseudo_group_exists(group_label):
             self.pseudo_status.value = f'<div style="color: green;">Pseudopotential group "{group_label}" successfully installed.</div>'
-        else:
+        elif job.status in ("finished", "failed"):
             self.pseudo_status.value = (
                 f'<div style="color: red;"><strong>Error:</strong> Failed to install "{group_label}". '
                 f"Please check your internet connection and try again.</div>"
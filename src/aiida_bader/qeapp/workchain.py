@@ -2,7 +2,7 @@ from aiida_quantumespresso.common.types import ElectronicType, SpinType
 from aiida import orm
 from aiidalab_qe.utils import set_component_resources
 from aiida_bader.workchains.qe_bader import QeBaderWorkChain
-from aiida_bader.utils import load_pseudos
+from aiida_bader.utils import find_scf_remote_folder, get_scf_kpoints, load_pseudos
 
 
 def check_codes(pw_code, pp_code, bader_code):
@@ -106,8 +106,21 @@ def get_builder(codes, structure, parameters, **kwargs):
 
 
 def update_inputs(inputs, ctx):
-    """Update the inputs using context."""
+    """Update the inputs using context.
+
+    If an scf calculation of the structure with the same parameters, pseudos and
+    k-points has already been run, e.g. by the relax step, its charge-density is used
+    instead of running a new scf calculation.
+    """
     inputs.structure = ctx.current_structure
+    parent_folder = find_scf_remote_folder(
+        ctx.current_structure,
+        inputs.scf.pw.parameters.get_dict(),
+        inputs.scf.pw.pseudos,
+        get_scf_kpoints(ctx.current_structure, inputs.scf),
+    )
+    if parent_folder is not None:
+        inputs.parent_folder = parent_folder
 
 
 workchain_and_builder = {
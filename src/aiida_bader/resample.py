@@ -0,0 +1,229 @@
+# -*- coding: utf-8 -*-
+"""Fourier interpolation of charge densities to other grids
+
+The charge density of pp.x is periodic and band-limited, so it can be moved to a
+coarser or a finer grid by truncating or zero-padding its Fourier coefficients, without
+running pw.x again. This is used to check how the Bader charges converge with the grid.
+The all-electron reference density of bader has cusps at the nuclei and is not
+band-limited, so it is interpolated in real space instead, see ``interpolate_density``.
+
+Like ``aiida_bader.cube``, this module only depends on NumPy, so that it can be run as a
+script next to the cube files::
+
+    python resample.py valence.cube --references reference.cube --factors 0.5 0.75 1 \
+        --summary grids.json
+
+which writes ``grid_0/valence.cube``, ``grid_0/reference.cube``, ``grid_1/...``, one
+folder per factor, see ``resample_cubes``.
+"""
+import argparse
+import functools
+import json
+import os
+
+import numpy as np
+
+try:
+    from aiida_bader.cube import read_cube, write_cube
+except ImportError:  # run as a script next to cube.py
+    from cube import read_cube, write_cube
+
+
+def good_fft_order(num_points):
+    """Return the smallest number not below ``num_points`` with no prime factors but 2, 3
+    and 5, as used for the FFT grids of Quantum ESPRESSO."""
+    num_points = max(int(num_points), 1)
+    while True:
+        rest = num_points
+        for prime in (2, 3, 5):
+            while rest % prime == 0:
+                rest //= prime
+        if rest == 1:
+            return num_points
+        num_points += 1
+
+
+def get_grid_shape(shape, factor):
+    """Return the grid ``shape`` scaled by ``factor`` along each axis, rounded up to FFT
+    friendly sizes. A factor of 1 returns the same shape."""
+    if factor == 1:
+        return tuple(shape)
+    return tuple(good_fft_order(round(num_points * factor)) for num_points in shape)
+
+
+def _index(axis, index):
+    """Return the index of ``index`` along ``axis`` of a 3D array."""
+    key = [slice(None)] * 3
+    key[axis] = index
+    return tuple(key)
+
+
+def _resize_axis(spectrum, axis, num_points):
+    """Return ``spectrum`` of a complex FFT along ``axis`` resized to ``num_points``.
+
+    The frequencies in common are copied. The Nyquist frequency of an even grid
+    stands for both signs, so it is split between them on a finer grid, and the two
+    are added on a coarser grid where they become its Nyquist frequency.
+    """
+    old = spectrum.shape[axis]
+    if num_points == old:
+        return spectrum
+    shape = list(spectrum.shape)
+    shape[axis] = num_points
+    out = np.zeros(shape, dtype=spectrum.dtype)
+    common = min(old, num_points)
+    positive = (common + 1) // 2
+    negative = common // 2
+    # with the Nyquist frequency of an even grid handled separately
+    if common % 2 == 0:
+        negative -= 1
+    out[_index(axis, slice(0, positive))] = spectrum[_index(axis, slice(0, positive))]
+    if negative:
+        out[_index(axis, slice(-negative, None))] = spectrum[
+            _index(axis, slice(-negative, None))
+        ]
+    if common % 2 == 0:
+        nyquist = common // 2
+        if num_points > old:
+            half = spectrum[_index(axis, nyquist)] / 2
+            out[_index(axis, nyquist)] = half
+            out[_index(axis, -nyquist)] = half
+        else:
+            out[_index(axis, nyquist)] = (
+                spectrum[_index(axis, nyquist)] + spectrum[_index(axis, -nyquist)]
+            )
+    return out
+
+
+def _resize_last_axis(spectrum, old, num_points):
+    """Return ``spectrum`` of a real FFT of ``old`` points along the last axis resized
+    to ``num_points``, as for ``_resize_axis`` with the negative frequencies implied."""
+    if num_points == old:
+        return spectrum
+    length = min(old, num_points) // 2 + 1
+    out = np.zeros(spectrum.shape[:2] + (num_points // 2 + 1,), dtype=spectrum.dtype)
+    out[:, :, :length] = spectrum[:, :, :length]
+    if old % 2 == 0 and num_points > old:
+        out[:, :, old // 2] /= 2
+    elif num_points % 2 == 0 and num_points < old:
+        out[:, :, num_points // 2] *= 2
+    return out
+
+
+def resample_spectrum(spectrum, old_shape, shape):
+    """Return the density of shape ``shape`` from ``spectrum = np.fft.rfftn(rho)``, where
+    ``rho`` has shape ``old_shape``.
+
+    The values are those of the same continuous density, so the number of electrons,
+    the sum of the values times the volume of a voxel, is unchanged.
+    """
+    spectrum = _resize_last_axis(spectrum, old_shape[2], shape[2])
+    for axis in (0, 1):
+        spectrum = _resize_axis(spectrum, axis, shape[axis])
+    scale = np.prod(shape) / np.prod(old_shape)
+    return np.fft.irfftn(spectrum, s=shape) * scale
+
+
+def resample_density(rho, shape):
+    """Return the periodic density ``rho`` on a grid of ``shape`` by Fourier interpolation."""
+    return resample_spectrum(np.fft.rfftn(rho), rho.shape, tuple(shape))
+
+
+def interpolate_density(rho, shape):
+    """Return the periodic density ``rho`` on a grid of ``shape`` by trilinear
+    interpolation.
+
+    Unlike ``resample_density``, this does not ring around the cusps of an all-electron
+    density, so the values stay positive and no spurious maxima appear. The number of
+    electrons is only approximately kept, which does not matter for a reference density.
+    """
+    for axis, num_points in enumerate(shape):
+        old = rho.shape[axis]
+        if num_points == old:
+            continue
+        position = np.arange(num_points) * old / num_points
+        lower = np.floor(position).astype(int)
+        weight = (position - lower).reshape([-1 if i == axis else 1 for i in range(3)])
+        below = np.take(rho, lower % old, axis=axis)
+        above = np.take(rho, (lower + 1) % old, axis=axis)
+        rho = below * (1 - weight) + above * weight
+    return rho
+
+
+def resample_cubes(sources, factors, directory=".", references=()):
+    """Write the cube files ``sources`` on the grids scaled by each of ``factors``.
+
+    The ``sources`` are resampled by Fourier interpolation, and the ``references``, the
+    reference densities of bader, by trilinear interpolation. The cube files of factor
+    ``factors[i]`` are written to ``grid_<i>/`` in ``directory`` with the same names as
+    the sources. Where the grid does not change, a symbolic link to the source is
+    written instead.
+
+    :return: a dictionary with the ``shape`` of the sources, and the ``grids``: the
+        ``factor``, the ``shape`` and the number of ``electrons`` of each file.
+    """
+    grids = [{"factor": factor, "electrons": {}} for factor in factors]
+    for index in range(len(factors)):
+        os.makedirs(os.path.join(directory, f"grid_{index}"), exist_ok=True)
+
+    old_shape = None
+    paths = list(sources) + list(references)
+    for source in paths:
+        name = os.path.basename(source)
+        with open(source, "rb") as handle:
+            header, rho = read_cube(handle)
+        if old_shape is not None and rho.shape != old_shape:
+            raise ValueError(f"{source} is on a different grid than {paths[0]}.")
+        old_shape = rho.shape
+        if source in references:
+            resample = functools.partial(interpolate_density, rho)
+        else:
+            resample = functools.partial(
+                resample_spectrum, np.fft.rfftn(rho), old_shape
+            )
+        del rho
+
+        for index, grid in enumerate(grids):
+            shape = get_grid_shape(old_shape, grid["factor"])
+            grid["shape"] = list(shape)
+            voxel = header["voxel"] * (np.array(old_shape) / np.array(shape))[:, None]
+            target = os.path.join(directory, f"grid_{index}", name)
+            if shape == old_shape:
+                if os.path.lexists(target):
+                    os.remove(target)
+                os.symlink(
+                    os.path.join("..", os.path.relpath(source, directory)), target
+                )
+                data = resample(old_shape)
+            else:
+                data = resample(shape)
+                with open(target, "w") as handle:
+                    write_cube(handle, dict(header, voxel=voxel), data)
+            grid["electrons"][name] = float(data.sum() * abs(np.linalg.det(voxel)))
+            del data
+    return {"shape": list(old_shape), "grids": grids}
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Write cube files on grids scaled by the given factors."
+    )
+    parser.add_argument("sources", nargs="+", help="the paths of the cube files")
+    parser.add_argument(
+        "--references",
+        nargs="+",
+        default=[],
+        help="the paths of the reference cube files, interpolated in real space",
+    )
+    parser.add_argument("--factors", type=float, nargs="+", required=True)
+    parser.add_argument("--summary", default=None, help="JSON file for the summary")
+    args = parser.parse_args()
+
+    summary = resample_cubes(args.sources, args.factors, references=args.references)
+    if args.summary:
+        with open(args.summary, "w") as handle:
+            json.dump(summary, handle)
+
+
+if __name__ == "__main__":
+    main()
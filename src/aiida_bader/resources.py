@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+"""Estimate the resources of a bader job from the header of its cube file.
+
+The memory and the runtime of bader scale with the number of grid points, so they
+are estimated from the six header lines of the cube file, which are read on the
+remote computer. The coefficients are conservative fits of bader 1.04 runs.
+"""
+import math
+import os
+import shlex
+
+from aiida_bader.calculations import POINTS_PER_THREAD
+
+# Bytes per grid point of the work arrays of each algorithm, besides the densities.
+BYTES_PER_POINT = {"ongrid": 24, "neargrid": 32, "weight": 96}
+# Bytes per grid point of each density held in memory.
+DENSITY_BYTES_PER_POINT = 8
+MEMORY_OVERHEAD_KB = 256 * 1024
+MEMORY_SAFETY_FACTOR = 1.5
+
+# Seconds per grid point of the partitioning, and of reading one cube file.
+SECONDS_PER_POINT = {"ongrid": 1e-6, "neargrid": 2e-6, "weight": 1e-5}
+READ_SECONDS_PER_POINT = 5e-7
+SECONDS_PER_ATOM = 0.01
+WALLTIME_SAFETY_FACTOR = 3.0
+MIN_WALLTIME = 600
+
+
+def read_remote_cube_header(remote_folder, filename):
+    """Return the grid shape and the number of atoms of a cube file in ``remote_folder``.
+
+    Only the first six lines of the file are transferred.
+
+    :return: a dictionary with ``shape`` and ``num_atoms``.
+    :raise OSError: if the header could not be read.
+    """
+    path = os.path.join(remote_folder.get_remote_path(), filename)
+    with remote_folder.get_authinfo().get_transport() as transport:
+        retval, stdout, stderr = transport.exec_command_wait(
+            f"head -n 6 {shlex.quote(path)}"
+        )
+    lines = stdout.splitlines()
+    if retval != 0 or len(lines) < 6:
+        raise OSError(f"Could not read the header of {path}: {stderr}")
+    try:
+        num_atoms = abs(int(lines[2].split()[0]))
+        shape = tuple(abs(int(line.split()[0])) for line in lines[3:6])
+    except (IndexError, ValueError) as exc:
+        raise OSError(f"Invalid cube header in {path}: {exc}") from exc
+    return {"shape": shape, "num_atoms": num_atoms}
+
+
+def estimate_bader_resources(
+    shape, num_atoms, algorithm="neargrid", num_densities=2, max_threads=None
+):
+    """Return the memory, walltime and threads of a bader run on a grid of ``shape``.
+
+    :param num_densities: 2 if a reference charge density is given, otherwise 1.
+    :param max_threads: the maximum number of OpenMP threads, if any.
+    :return: a dictionary with ``max_memory_kb``, ``max_wallclock_seconds`` and
+        ``num_threads``, one thread per ``POINTS_PER_THREAD`` grid points.
+    """
+    points = math.prod(shape)
+    memory = points * (
+        BYTES_PER_POINT[algorithm] + num_densities * DENSITY_BYTES_PER_POINT
+    )
+    memory_kb = MEMORY_OVERHEAD_KB + math.ceil(memory * MEMORY_SAFETY_FACTOR / 1024)
+
+    seconds = (
+        points * (SECONDS_PER_POINT[algorithm] + num_densities * READ_SECONDS_PER_POINT)
+        + num_atoms * SECONDS_PER_ATOM
+    )
+    walltime = max(MIN_WALLTIME, seconds * WALLTIME_SAFETY_FACTOR)
+    # whole minutes, as most schedulers round to them anyway
+    walltime = 60 * math.ceil(walltime / 60)
+
+    num_threads = max(1, math.ceil(points / POINTS_PER_THREAD))
+    if max_threads is not None:
+        num_threads = min(num_threads, max_threads)
+    return {
+        "max_memory_kb": memory_kb,
+        "max_wallclock_seconds": walltime,
+        "num_threads": num_threads,
+    }
@@ -0,0 +1,296 @@
+# -*- coding: utf-8 -*-
+"""Statistics of the ``QeBaderWorkChain`` runs in the database.
+
+All values are read with ``QueryBuilder`` projections, without loading the nodes, so
+that campaigns of many thousands of workflows can be summarised. The stage of a
+process is given by the label of the link through which the work chain called it,
+and calculation jobs are found up to one level down, e.g. the ``PwCalculation`` of the
+``PwBaseWorkChain`` of the ``pw`` stage.
+"""
+import csv
+import datetime
+
+import numpy as np
+from aiida import orm
+from aiida.schedulers.datastructures import JobInfo
+
+# Stage of the processes called by the work chain, by call link label.
+STAGES = {
+    "call_pw_scf": "pw",
+    "call_pp_valence_calc": "pp_valence",
+    "call_pp_all_calc": "pp_all",
+    "call_resample_calc": "resample",
+    "call_pp_valence_cache": "cache",
+    "call_pp_all_cache": "cache",
+    "call_bader_base": "bader",
+    "call_bader_calc": "bader",
+    "call_pp_bader_calc": "pp_bader",
+}
+PERCENTILES = (50, 90, 95, 100)
+
+
+def _state(process_state, exit_status):
+    """Return the exit status of a process, or its state if it did not finish."""
+    if process_state == "finished":
+        return str(exit_status)
+    return process_state or "created"
+
+
+def _seconds(start, end):
+    return (end - start).total_seconds()
+
+
+def _parse_time(value):
+    return None if value is None else datetime.datetime.fromisoformat(value)
+
+
+def get_percentiles(values):
+    """Return the count and the ``PERCENTILES`` of ``values``, e.g. ``p50``."""
+    summary = {"count": len(values)}
+    if values:
+        for percentile, value in zip(PERCENTILES, np.percentile(values, PERCENTILES)):
+            summary[f"p{percentile}"] = float(value)
+    return summary
+
+
+def query_workflows(group=None, since=None, until=None):
+    """Return a ``QueryBuilder`` of the ``QeBaderWorkChain`` nodes, tagged ``workflow``.
+
+    :param group: optional label of a group with the work chains.
+    :param since: optional ``datetime``, only work chains created at or after it.
+    :param until: optional ``datetime``, only work chains created before it.
+    """
+    filters = {"attributes.process_label": "QeBaderWorkChain"}
+    ctime = {}
+    if since is not None:
+        ctime[">="] = since
+    if until is not None:
+        ctime["<"] = until
+    if ctime:
+        filters["ctime"] = {"and": [{key: value} for key, value in ctime.items()]}
+    query = orm.QueryBuilder()
+    if group is not None:
+        query.append(orm.Group, filters={"label": group}, tag="group")
+        query.append(
+            orm.WorkflowNode, with_group="group", filters=filters, tag="workflow"
+        )
+    else:
+        query.append(orm.WorkflowNode, filters=filters, tag="workflow")
+    return query
+
+
+_PROCESS_PROJECTIONS = [
+    "id",
+    "ctime",
+    "mtime",
+    "attributes.process_label",
+    "attributes.process_state",
+    "attributes.exit_status",
+]
+_CALCJOB_PROJECTIONS = _PROCESS_PROJECTIONS + [
+    "attributes.last_job_info.submission_time",
+    "attributes.last_job_info.dispatch_time",
+    "extras.timing.job.start",
+]
+
+
+def _query_stages(group, since, until):
+    """Yield the stage and the projections of the processes called by the work chains."""
+    query = query_workflows(group, since, until)
+    query.append(
+        orm.ProcessNode,
+        with_incoming="workflow",
+        edge_tag="call",
+        edge_project="label",
+        project=_PROCESS_PROJECTIONS,
+        tag="process",
+    )
+    for row in query.iterdict():
+        if row["call"]["label"] in STAGES:
+            yield STAGES[row["call"]["label"]], row["process"]
+
+
+def _query_calcjobs(group, since, until):
+    """Yield the stage and the projections of the calculation jobs run by the work
+    chains, directly or by the work chains they called, and whether they are nested."""
+    direct = query_workflows(group, since, until)
+    direct.append(
+        orm.CalcJobNode,
+        with_incoming="workflow",
+        edge_tag="call",
+        edge_project="label",
+        project=_CALCJOB_PROJECTIONS,
+        tag="process",
+    )
+    nested = query_workflows(group, since, until)
+    nested.append(
+        orm.WorkflowNode,
+        with_incoming="workflow",
+        edge_tag="call",
+        edge_project="label",
+        tag="child",
+    )
+    nested.append(
+        orm.CalcJobNode,
+        with_incoming="child",
+        project=_CALCJOB_PROJECTIONS,
+        tag="process",
+    )
+    for query, is_nested in ((direct, False), (nested, True)):
+        for row in query.iterdict():
+            if row["call"]["label"] in STAGES:
+                yield STAGES[row["call"]["label"]], row["process"], is_nested
+
+
+def get_queue_seconds(process):
+    """Return the queue time of a calculation job from the projections of its node.
+
+    It is the time between submission to the scheduler and dispatch, if the scheduler
+    reported both, otherwise from the creation of the node to the start of the job
+    recorded by the job script, and ``None`` if neither is known.
+    """
+    submission = process["attributes.last_job_info.submission_time"]
+    dispatch = process["attributes.last_job_info.dispatch_time"]
+    start = process["extras.timing.job.start"]
+    if submission is not None and dispatch is not None:
+        return _seconds(
+            JobInfo.deserialize_field(submission, "date"),
+            JobInfo.deserialize_field(dispatch, "date"),
+        )
+    if start is not None:
+        return max(0.0, _seconds(process["ctime"], _parse_time(start)))
+    return None
+
+
+def get_stats(group=None, since=None, until=None):
+    """Return the statistics of the ``QeBaderWorkChain`` runs.
+
+    :param group: optional label of a group with the work chains.
+    :param since: optional ``datetime``, only work chains created at or after it.
+    :param until: optional ``datetime``, only work chains created before it.
+    :return: a dictionary with:
+
+        * ``workflows``: the number of work chains.
+        * ``exit_status``: the number of work chains by exit status, or by process state
+          for those that did not finish.
+        * ``wall_time``: the percentiles of the wall time in seconds of the work chains
+          that finished successfully, under ``total``, and of each stage.
+        * ``queue_time``: the percentiles of the queue time in seconds of the calculation
+          jobs of each stage.
+        * ``failures``: the failed processes by stage, process and exit status, most
+          frequent first.
+        * ``throughput``: the number of work chains that terminated and finished
+          successfully each day.
+    """
+    query = query_workflows(group, since, until)
+    query.add_projection("workflow", _PROCESS_PROJECTIONS)
+
+    exit_status = {}
+    wall_time = {"total": []}
+    days = {}
+    rows = query.all()
+    for _, ctime, mtime, _, state, status in rows:
+        key = _state(state, status)
+        exit_status[key] = exit_status.get(key, 0) + 1
+        if state in ("finished", "excepted", "killed"):
+            day = days.setdefault(mtime.date().isoformat(), {"terminated": 0, "ok": 0})
+            day["terminated"] += 1
+            if key == "0":
+                day["ok"] += 1
+                wall_time["total"].append(_seconds(ctime, mtime))
+
+    failures = {}
+
+    def add_failure(stage, process, state):
+        if state not in ("0", "running", "waiting", "created"):
+            key = (stage, process["attributes.process_label"], state)
+            failures[key] = failures.get(key, 0) + 1
+
+    for stage, process in _query_stages(group, since, until):
+        key = _state(
+            process["attributes.process_state"], process["attributes.exit_status"]
+        )
+        if key == "0":
+            wall_time.setdefault(stage, []).append(
+                _seconds(process["ctime"], process["mtime"])
+            )
+        add_failure(stage, process, key)
+
+    queue_time = {}
+    for stage, process, is_nested in _query_calcjobs(group, since, until):
+        seconds = get_queue_seconds(process)
+        if seconds is not None:
+            queue_time.setdefault(stage, []).append(seconds)
+        key = _state(
+            process["attributes.process_state"], process["attributes.exit_status"]
+        )
+        # the failures of the calculations called directly are counted already
+        if is_nested:
+            add_failure(stage, process, key)
+
+    return {
+        "workflows": len(rows),
+        "exit_status": dict(sorted(exit_status.items())),
+        "wall_time": {key: get_percentiles(value) for key, value in wall_time.items()},
+        "queue_time": {
+            key: get_percentiles(value) for key, value in queue_time.items()
+        },
+        "failures": [
+            {
+                "stage": stage,
+                "process_label": process_label,
+                "exit_status": state,
+                "count": count,
+            }
+            for (stage, process_label, state), count in sorted(
+                failures.items(), key=lambda item: -item[1]
+            )
+        ],
+        "throughput": [{"day": day, **counts} for day, counts in sorted(days.items())],
+    }
+
+
+def get_stats_rows(stats):
+    """Return the ``stats`` as rows of ``(section, name, metric, value)``, e.g. for CSV."""
+    rows = [("workflows", "", "count", stats["workflows"])]
+    for status, count in stats["exit_status"].items():
+        rows.append(("exit_status", status, "count", count))
+    for section in ("wall_time", "queue_time"):
+        for stage, summary in stats[section].items():
+            for metric, value in summary.items():
+                rows.append((section, stage, metric, value))
+    for failure in stats["failures"]:
+        name = f"{failure['stage']}/{failure['process_label']}/{failure['exit_status']}"
+        rows.append(("failures", name, "count", failure["count"]))
+    for day in stats["throughput"]:
+        rows.append(("throughput", day["day"], "terminated", day["terminated"]))
+        rows.append(("throughput", day["day"], "ok", day["ok"]))
+    return rows
+
+
+def format_stats(stats):
+    """Return the ``stats`` as plain-text tables."""
+    from tabulate import tabulate
+
+    percentiles = ["count"] + [f"p{percentile}" for percentile in PERCENTILES]
+    sections = [
+        f"QeBaderWorkChain: {stats['workflows']}",
+        tabulate(stats["exit_status"].items(), headers=["exit status", "count"]),
+    ]
+    for section, title in (("wall_time", "wall time [s]"), ("queue_time", "queue [s]")):
+        rows = [
+            [stage] + [summary.get(key) for key in percentiles]
+            for stage, summary in stats[section].items()
+        ]
+        sections.append(tabulate(rows, headers=[title] + percentiles, floatfmt=".1f"))
+    if stats["failures"]:
+        sections.append(tabulate(stats["failures"], headers="keys"))
+    sections.append(tabulate(stats["throughput"], headers="keys"))
+    return "\n\n".join(sections)
+
+
+def write_stats_csv(stats, handle):
+    """Write the rows of ``get_stats_rows`` to ``handle`` as CSV, with a header."""
+    writer = csv.writer(handle)
+    writer.writerow(("section", "name", "metric", "value"))
+    writer.writerows(get_stats_rows(stats))
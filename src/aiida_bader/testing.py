@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+"""Synthetic bader outputs used by the tests and the benchmarks."""
+import numpy as np
+
+from aiida_bader import cube
+
+ACF_HEADER = (
+    "    #         X           Y           Z       CHARGE      MIN DIST    ATOMIC VOL\n"
+)
+ACF_SEPARATOR = " " + "-" * 80 + "\n"
+
+
+def write_acf(handle, num_atoms, vacuum_charge=0.0, vacuum_volume=0.0, seed=0):
+    """Write a synthetic ``ACF.dat`` with ``num_atoms`` rows to a text ``handle``.
+
+    :return: the array of charges that was written.
+    """
+    rng = np.random.default_rng(seed)
+    table = np.column_stack(
+        [
+            np.arange(1, num_atoms + 1),
+            rng.random((num_atoms, 3)) * 50.0,
+            rng.random(num_atoms) * 8.0,
+            rng.random(num_atoms) * 2.0,
+            rng.random(num_atoms) * 20.0,
+        ]
+    )
+    # bader prints four decimals, so return what a parser can read back
+    charges = np.round(table[:, 4], 4)
+    handle.write(ACF_HEADER)
+    handle.write(ACF_SEPARATOR)
+    np.savetxt(handle, table, fmt="%5d" + " %11.4f" * 6)
+    handle.write(ACF_SEPARATOR)
+    handle.write(f"    VACUUM CHARGE:{vacuum_charge:21.4f}\n")
+    handle.write(f"    VACUUM VOLUME:{vacuum_volume:21.4f}\n")
+    handle.write(f"    NUMBER OF ELECTRONS:{charges.sum() + vacuum_charge:15.4f}\n")
+    return charges
+
+
+def synthetic_density(shape, positions, cell, width=1.0, dtype=np.float64):
+    """Return a periodic density made of one Gaussian per atom on a grid of ``shape``.
+
+    :param shape: the number of grid points along each cell vector.
+    :param positions: the (N, 3) Cartesian positions of the atoms, in Bohr.
+    :param cell: the (3, 3) cell vectors, in Bohr.
+    :param width: the standard deviation of the Gaussians, in Bohr.
+    """
+    cell = np.asarray(cell, dtype=float)
+    fractions = np.linalg.solve(cell.T, np.asarray(positions, dtype=float).T).T
+    density = np.zeros(shape, dtype=dtype)
+    axes = [np.arange(n) / n for n in shape]
+    for fraction in fractions:
+        # minimum-image distance along each axis, assuming an orthorhombic cell
+        deltas = []
+        for axis, (grid, center) in enumerate(zip(axes, fraction)):
+            delta = grid - center
+            delta -= np.round(delta)
+            deltas.append(delta * np.linalg.norm(cell[axis]))
+        gaussians = [np.exp(-(delta**2) / (2 * width**2)) for delta in deltas]
+        density += np.einsum("i,j,k->ijk", *gaussians).astype(dtype)
+    return density
+
+
+def write_cube(handle, density, positions, numbers, cell):
+    """Write ``density`` as a Gaussian cube file to a text ``handle``.
+
+    :param density: the three-dimensional array of the density.
+    :param positions: the (N, 3) Cartesian positions of the atoms, in Bohr.
+    :param numbers: the atomic numbers of the atoms.
+    :param cell: the (3, 3) cell vectors, in Bohr.
+    """
+    header = {
+        "comments": ["Synthetic charge density", "written by aiida_bader.testing"],
+        "origin": np.zeros(3),
+        "voxel": np.asarray(cell, dtype=float) / np.array(density.shape)[:, None],
+        "numbers": list(numbers),
+        "nuclear_charges": [float(number) for number in numbers],
+        "positions": np.asarray(positions, dtype=float),
+    }
+    cube.write_cube(handle, header, density)
+
+
+def write_upf(handle, element, z_valence):
+    """Write a minimal UPF v2 pseudopotential of ``element`` to a text ``handle``.
+
+    Only the header is written, which is enough for ``aiida_pseudo.data.pseudo.UpfData``
+    to parse the element and the valence charge.
+    """
+    handle.write('<UPF version="2.0.1">\n')
+    handle.write(
+        f'  <PP_HEADER element="{element}" z_valence="{float(z_valence)}" '
+        'pseudo_type="PAW" functional="PBESOL" core_correction="true"/>\n'
+    )
+    handle.write("</UPF>\n")
@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+"""Timing of the stages of the bader workflows.
+
+Each ``BaderCalculation`` records in its ``timing`` extra when bader started and ended
+on the computer, the size of the cube files it read and how they were transferred, and
+how long the parser took. When a ``QeBaderWorkChain`` terminates, it collects in its
+own ``timing`` extra one record per called process, with the times of submission,
+start and end. ``get_trace`` turns such a record into a JSON trace in the Trace Event
+Format, which can be opened with Perfetto or ``chrome://tracing``.
+"""
+import datetime
+
+from aiida import orm
+
+TIMING_EXTRA = "timing"
+
+
+def _isoformat(value):
+    return None if value is None else value.isoformat()
+
+
+def _seconds(start, end):
+    if start is None or end is None:
+        return None
+    return (end - start).total_seconds()
+
+
+def get_process_timing(node):
+    """Return the timing record of the process ``node``.
+
+    ``submit`` is the creation of the node and ``end`` its last modification. For a
+    calculation job, ``start`` is the start of the job as recorded by the job script,
+    or as reported by the scheduler. ``queue_seconds`` is the time between submission
+    to the scheduler and dispatch if the scheduler reports both, otherwise the time
+    from ``submit`` to ``start``, which includes the upload of the input files.
+    The ``timing`` extra of the node, if any, is included as well.
+
+    :return: a JSON-serializable dictionary, with times as ISO 8601 strings.
+    """
+    submit, end = node.ctime, node.mtime
+    start = queue_seconds = None
+    record = dict(node.base.extras.get(TIMING_EXTRA, {}))
+    if isinstance(node, orm.CalcJobNode):
+        job_info = node.get_last_job_info()
+        if job_info is not None:
+            start = job_info.get("dispatch_time")
+            queue_seconds = _seconds(
+                job_info.get("submission_time"), job_info.get("dispatch_time")
+            )
+        if "job" in record:
+            start = datetime.datetime.fromisoformat(record["job"]["start"])
+        if queue_seconds is None and start is not None:
+            # the clocks of the computer and of the database may differ slightly
+            queue_seconds = max(0.0, _seconds(submit, start))
+    record.update(
+        {
+            "pk": node.pk,
+            "process_label": node.process_label,
+            "caller": None if node.caller is None else node.caller.pk,
+            "exit_status": node.exit_status,
+            "submit": _isoformat(submit),
+            "start": _isoformat(start),
+            "end": _isoformat(end),
+            "seconds": _seconds(submit, end),
+            "queue_seconds": queue_seconds,
+        }
+    )
+    return record
+
+
+def get_workflow_timing(node, end=None):
+    """Return the timing record of the workflow ``node`` and of all the processes it called.
+
+    :param end: the end of the workflow, if it is not the last modification of its node,
+        e.g. while it is terminating.
+    :return: the record of ``get_process_timing`` with the records of the called processes,
+        in order of submission, under ``stages``.
+    """
+    record = get_process_timing(node)
+    if end is not None:
+        record["end"] = _isoformat(end)
+        record["seconds"] = _seconds(node.ctime, end)
+    descendants = sorted(node.called_descendants, key=lambda child: child.ctime)
+    record["stages"] = [get_process_timing(child) for child in descendants]
+    return record
+
+
+def _microseconds(value):
+    return int(datetime.datetime.fromisoformat(value).timestamp() * 1e6)
+
+
+def _event(name, record, start, end, args=None):
+    return {
+        "name": name,
+        "cat": record["process_label"],
+        "ph": "X",
+        "ts": _microseconds(start),
+        "dur": _microseconds(end) - _microseconds(start),
+        "pid": 1,
+        "tid": record["pk"],
+        "args": args or {},
+    }
+
+
+def get_trace(timing):
+    """Return the timing record of a workflow as a trace in the Trace Event Format.
+
+    Each process is a complete event on its own thread, from submission to its end, and
+    calculation jobs have nested events for the queueing, the job and the parsing. The
+    parsing is placed at the end of the process, since only its duration is recorded.
+
+    :param timing: a record of ``get_workflow_timing``.
+    :return: a JSON-serializable dictionary.
+    """
+    events = []
+    for record in [timing] + timing.get("stages", []):
+        args = {
+            key: record[key]
+            for key in ("caller", "exit_status", "queue_seconds", "cubes")
+            if record.get(key) is not None
+        }
+        events.append(
+            _event(
+                f"{record['process_label']}<{record['pk']}>",
+                record,
+                record["submit"],
+                record["end"],
+                args,
+            )
+        )
+        if record["start"] is not None:
+            events.append(_event("queue", record, record["submit"], record["start"]))
+        if "job" in record:
+            events.append(
+                _event("job", record, record["job"]["start"], record["job"]["end"])
+            )
+        if "parse_seconds" in record:
+            end = datetime.datetime.fromisoformat(record["end"])
+            start = end - datetime.timedelta(seconds=record["parse_seconds"])
+            events.append(_event("parse", record, start.isoformat(), record["end"]))
+    return {"traceEvents": events, "displayTimeUnit": "ms"}
@@ -1,22 +1,194 @@
-from aiida.orm import QueryBuilder, Group
+from aiida.common.exceptions import NotExistent
+from aiida.orm import Group, Node, QueryBuilder
 import shutil
 import subprocess
 
 
-BASE_URL = "https://github.com/superstar54/aiida-bader/raw/main/data/"
+# The uuid of each pseudopotential label of a group, by group label, with the number of
+# nodes of the group when it was queried, which invalidates the entry when it changes.
+_PSEUDO_UUIDS = {}
+
+
+def _query_group_nodes(group_label, **kwargs):
+    """Return a ``QueryBuilder`` of the nodes of the group, tagged ``node``."""
+    query = QueryBuilder().append(Group, filters={"label": group_label}, tag="group")
+    query.append(Node, with_group="group", tag="node", **kwargs)
+    return query
+
+
+def _get_pseudo_uuids(group_label, labels):
+    """Return the uuid of the nodes of the group with the given labels, by label.
+
+    Only the labels that are not cached already are queried. If the group has several
+    nodes with the same label, the oldest one is taken.
+    """
+    count = _query_group_nodes(group_label).count()
+    cached_count, uuids = _PSEUDO_UUIDS.get(group_label, (None, {}))
+    if cached_count != count:
+        uuids = {}
+    missing = set(labels) - set(uuids)
+    if missing:
+        query = _query_group_nodes(
+            group_label,
+            filters={"label": {"in": sorted(missing)}},
+            project=["label", "uuid"],
+        )
+        query.order_by({"node": {"id": "asc"}})
+        for label, uuid in query.iterall():
+            uuids.setdefault(label, uuid)
+        _PSEUDO_UUIDS[group_label] = (count, uuids)
+    return uuids
 
 
 def load_pseudos(structure, pseudo_group="psl_kjpaw_pbesol"):
-    """Load the pseudos for the given structure and pseudo group."""
-    pseudo_group = (
-        QueryBuilder().append(Group, filters={"label": pseudo_group}).one()[0]
-    )
-    pseudos = {}
-    for kind in structure.kinds:
-        pseudos[kind.symbol] = next(
-            pseudo for pseudo in pseudo_group.nodes if pseudo.label == kind.name
+    """Load the pseudos for the given structure and pseudo group.
+
+    The pseudopotential of each kind is the node of the group labelled with the kind
+    name. The uuids are cached by group, so that only the number of nodes of the group
+    is queried again, and the nodes are loaded with a single query.
+
+    :return: a dictionary of the pseudopotentials by element.
+    :raise NotExistent: if the group has no pseudopotential for some kinds.
+    """
+    labels = {kind.name for kind in structure.kinds}
+    uuids = _get_pseudo_uuids(pseudo_group, labels)
+    missing = labels - set(uuids)
+    if missing:
+        raise NotExistent(
+            f"No pseudopotentials for {sorted(missing)} in the group '{pseudo_group}'."
         )
-    return pseudos
+    nodes = {
+        node.uuid: node
+        for node in QueryBuilder()
+        .append(Node, filters={"uuid": {"in": [uuids[label] for label in labels]}})
+        .all(flat=True)
+    }
+    if len(nodes) < len(labels):
+        # a node was replaced since it was cached
+        _PSEUDO_UUIDS.pop(pseudo_group, None)
+        return load_pseudos(structure, pseudo_group)
+    return {kind.symbol: nodes[uuids[kind.name]] for kind in structure.kinds}
+
+
+def get_scf_kpoints(structure, scf_inputs):
+    """Return the k-points of the inputs of a ``PwBaseWorkChain`` for ``structure``.
+
+    If they are given by ``kpoints_distance``, the mesh is generated as the work chain
+    does, without storing any provenance.
+
+    :param scf_inputs: the inputs of the ``PwBaseWorkChain``, as a mapping.
+    :return: the ``KpointsData``, or ``None`` if neither input is given.
+    """
+    from aiida.orm import Bool
+    from aiida_quantumespresso.calculations.functions.create_kpoints_from_distance import (
+        create_kpoints_from_distance,
+    )
+
+    if "kpoints" in scf_inputs:
+        return scf_inputs["kpoints"]
+    if "kpoints_distance" not in scf_inputs:
+        return None
+    return create_kpoints_from_distance(
+        structure,
+        scf_inputs["kpoints_distance"],
+        scf_inputs.get("kpoints_force_parity", Bool(False)),
+        metadata={"store_provenance": False},
+    )
+
+
+def _get_kpoints_key(kpoints):
+    """Return the mesh and offset of ``kpoints``, or its k-points if it has no mesh."""
+    try:
+        mesh, offset = kpoints.get_kpoints_mesh()
+    except AttributeError:
+        points = kpoints.get_kpoints()
+        return ("list", [[round(value, 8) for value in point] for point in points])
+    return ("mesh", list(mesh), [float(value) for value in offset])
+
+
+# The default ``conv_thr`` of pw.x, and the ``ELECTRONS`` flags, off by default, that
+# change the converged charge-density.
+_DEFAULT_CONV_THR = 1e-6
+_DENSITY_ELECTRONS_FLAGS = ("tqr", "real_space")
+
+
+def _is_converged_density(electrons, requested):
+    """Return whether the ``ELECTRONS`` namelist gives the density of ``requested``: the
+    same flags, and a ``conv_thr`` at least as tight."""
+    if electrons.get("conv_thr", _DEFAULT_CONV_THR) > requested.get(
+        "conv_thr", _DEFAULT_CONV_THR
+    ):
+        return False
+    return all(
+        electrons.get(flag, False) == requested.get(flag, False)
+        for flag in _DENSITY_ELECTRONS_FLAGS
+    )
+
+
+def find_scf_remote_folder(structure, parameters=None, pseudos=None, kpoints=None):
+    """Return the remote folder of the latest successful scf ``PwCalculation`` of ``structure``.
+
+    Only calculations with the same ``SYSTEM`` namelist as ``parameters``, which is what
+    determines the charge-density, with the same ``tqr`` and ``real_space`` and at least
+    as tight a ``conv_thr`` in the ``ELECTRONS`` namelist, and with the same ``pseudos``
+    and ``kpoints`` are considered, and remote folders that have been cleaned are
+    skipped.
+
+    :param parameters: the pw.x parameters, as a dictionary.
+    :param pseudos: optional mapping of the kind names to the pseudopotentials.
+    :param kpoints: optional ``KpointsData``, whose mesh and offset, or k-points if it
+        has no mesh, must be the same.
+    :return: the ``RemoteData``, or ``None`` if there is no such calculation.
+    """
+    from aiida.orm import RemoteData, StructureData
+    from aiida.plugins import CalculationFactory
+
+    if not structure.is_stored:
+        return None
+    system = (parameters or {}).get("SYSTEM", {})
+    electrons = (parameters or {}).get("ELECTRONS", {})
+    pseudos = None if pseudos is None else {k: v.uuid for k, v in pseudos.items()}
+    kpoints = None if kpoints is None else _get_kpoints_key(kpoints)
+
+    query = QueryBuilder()
+    query.append(StructureData, filters={"id": structure.pk}, tag="structure")
+    query.append(
+        CalculationFactory("quantumespresso.pw"),
+        with_incoming="structure",
+        filters={"attributes.exit_status": 0},
+        tag="calculation",
+        project="*",
+    )
+    query.append(
+        RemoteData,
+        with_incoming="calculation",
+        edge_filters={"label": "remote_folder"},
+        project="*",
+    )
+    query.order_by({"calculation": {"ctime": "desc"}})
+    for calculation, remote_folder in query.iterall():
+        calculation_parameters = calculation.inputs.parameters.get_dict()
+        if calculation_parameters.get("CONTROL", {}).get("calculation", "scf") != "scf":
+            continue
+        if calculation_parameters.get("SYSTEM", {}) != system:
+            continue
+        if not _is_converged_density(
+            calculation_parameters.get("ELECTRONS", {}), electrons
+        ):
+            continue
+        if pseudos is not None and pseudos != {
+            k: v.uuid for k, v in calculation.inputs.pseudos.items()
+        }:
+            continue
+        if kpoints is not None and (
+            "kpoints" not in calculation.inputs
+            or kpoints != _get_kpoints_key(calculation.inputs.kpoints)
+        ):
+            continue
+        if remote_folder.is_empty:
+            continue
+        return remote_folder
+    return None
 
 
 def create_bader_env():
@@ -53,15 +225,8 @@ def create_bader_env():
 
 
 def pseudo_group_exists(group_label):
-    groups = (
-        QueryBuilder()
-        .append(
-            Group,
-            filters={"label": group_label},
-        )
-        .all(flat=True)
-    )
-    return len(groups) > 0 and len(groups[0].nodes) > 0
+    """Return whether the group exists and has nodes, with a count query."""
+    return _query_group_nodes(group_label).count() > 0
 
 
 def conda_env_exists(env_name):
@@ -92,33 +257,36 @@ def get_bader_executable():
         raise RuntimeError("Failed to determine the path of the bader executable.")
 
 
-def install_pseudos():
-    import os
-    from pathlib import Path
-    from aiida_bader.qeapp.model import ConfigurationSettingsModel
+def install_pseudos(group_labels=None, archive_dir=None):
+    """Install the missing pseudopotential groups, and wait for them.
 
-    config_instance = ConfigurationSettingsModel()
-    for group_label in config_instance.pseudo_group_options:
+    The archives are imported in this process, see ``aiida_bader.pseudos``.
 
-        if not pseudo_group_exists(group_label):
-            print(f"Downloading pseudopotential group '{group_label}'...")
-            url = BASE_URL + group_label + ".aiida"
-            env = os.environ.copy()
-            env["PATH"] = f"{env['PATH']}:{Path.home().joinpath('.local', 'bin')}"
+    :param group_labels: the labels of the groups, by default ``PSEUDO_GROUPS``.
+    :param archive_dir: the local archive directory, which is looked at before the
+        archives are downloaded.
+    """
+    from aiida_bader.pseudos import PSEUDO_GROUPS, PseudoInstaller, get_installer
 
-            def run_(*args, **kwargs):
-                return subprocess.run(
-                    *args, env=env, capture_output=True, check=True, **kwargs
-                )
-
-            run_(["verdi", "archive", "import", url, "--no-import-group"])
+    if isinstance(group_labels, str):
+        group_labels = [group_labels]
+    installer = get_installer() if archive_dir is None else PseudoInstaller(archive_dir)
+    jobs = []
+    for group_label in group_labels or PSEUDO_GROUPS:
+        if not pseudo_group_exists(group_label):
+            job = installer.install(group_label)
+            print(
+                f"Installing pseudopotential group '{group_label}' from {job.source}..."
+            )
+            jobs.append(job)
         else:
             print(f"Pseudopotential group '{group_label}' already exists.")
+    for job in jobs:
+        job.wait()
 
 
 def setup_bader_code():
     from aiida.orm import load_code, load_computer
-    from aiida.common.exceptions import NotExistent
 
     try:
         computer = load_computer("localhost")
@@ -134,7 +302,8 @@ def setup_bader_code():
         create_bader_env()
         bader_path = get_bader_executable()
 
-        prepend_text = f'eval "$(conda shell.posix hook)"\nconda activate bader\nexport OMP_NUM_THREADS=1'
+        # OMP_NUM_THREADS is set by the BaderCalculation itself
+        prepend_text = 'eval "$(conda shell.posix hook)"\nconda activate bader'
         command = [
             "verdi",
             "code",
@@ -155,3 +324,40 @@ def setup_bader_code():
 
         subprocess.run(command, check=True)
         print(f"Code bader@{computer_label} successfully set up.")
+
+
+CLEANUP_POLICIES = ("none", "on_success", "always", "keep_density")
+
+# Wavefunction and mixing files of pw.x, relative to the folder of a pw.x or pp.x job.
+WAVEFUNCTION_PATTERNS = ("out/*.wfc*", "out/*.save/wfc*", "out/*.mix*")
+
+
+def remove_wavefunctions(remote_folder):
+    """Remove the wavefunction files from ``remote_folder``, keeping the densities."""
+    import os
+
+    with remote_folder.get_authinfo().get_transport() as transport:
+        for pattern in WAVEFUNCTION_PATTERNS:
+            path = os.path.join(remote_folder.get_remote_path(), pattern)
+            for filepath in transport.glob(path):
+                transport.remove(filepath)
+
+
+def clean_remote_folders(remote_folders, keep_density=False):
+    """Delete the content of the given ``RemoteData`` folders.
+
+    :param keep_density: only remove the wavefunction files, see ``WAVEFUNCTION_PATTERNS``,
+        and keep the charge-density and the cube files.
+    :return: the folders that were cleaned. Folders that cannot be reached are skipped.
+    """
+    cleaned = []
+    for remote_folder in remote_folders:
+        try:
+            if keep_density:
+                remove_wavefunctions(remote_folder)
+            else:
+                remote_folder._clean()  # pylint: disable=protected-access
+        except OSError:
+            continue
+        cleaned.append(remote_folder)
+    return cleaned
@@ -2,3 +2,5 @@
 """AiiDA-Bader workchains"""
 
 from .qe_bader import QeBaderWorkChain
+from .bader_base import BaderBaseWorkChain
+from .batch import QeBaderBatchWorkChain
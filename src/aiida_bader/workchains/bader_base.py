@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+"""BaderBaseWorkChain workchain of the AiiDA bader plugin"""
+
+from aiida import orm
+from aiida.common import AttributeDict
+from aiida.engine import (
+    BaseRestartWorkChain,
+    ProcessHandlerReport,
+    process_handler,
+    while_,
+)
+
+from aiida_bader.calculations import BaderCalculation
+
+
+class BaderBaseWorkChain(BaseRestartWorkChain):
+    """Workchain to run a ``BaderCalculation`` and restart it on known errors.
+
+    * Out of walltime: the ``max_wallclock_seconds`` are multiplied by
+      ``walltime_factor``.
+    * Out of memory, or a truncated ACF.dat: the ``max_memory_kb`` are multiplied by
+      ``memory_factor`` if they are set. If they are not set, or if they have already
+      been increased once, the ``weight`` algorithm, which needs the most memory, falls
+      back to ``neargrid`` instead.
+    * Missing or truncated input cube: the workchain stops, since restarting does
+      not help.
+
+    Any other failure stops the workchain as well.
+    """
+
+    _process_class = BaderCalculation
+
+    @classmethod
+    def define(cls, spec):
+        """Define workflow specification."""
+        super().define(spec)
+
+        spec.expose_inputs(BaderCalculation, namespace="bader")
+        spec.input(
+            "walltime_factor",
+            valid_type=orm.Float,
+            default=lambda: orm.Float(2.0),
+            help="Factor by which the walltime is increased after running out of it.",
+        )
+        spec.input(
+            "memory_factor",
+            valid_type=orm.Float,
+            default=lambda: orm.Float(2.0),
+            help="Factor by which `max_memory_kb` is increased after running out of memory.",
+        )
+
+        spec.outline(
+            cls.setup,
+            while_(cls.should_run_process)(
+                cls.run_process,
+                cls.inspect_process,
+            ),
+            cls.results,
+        )
+
+        spec.expose_outputs(BaderCalculation)
+
+        spec.exit_code(
+            300,
+            "ERROR_UNRECOVERABLE_FAILURE",
+            message="The calculation failed with an unrecoverable error.",
+        )
+        spec.exit_code(
+            310,
+            "ERROR_INPUT_CUBE",
+            message="A charge density cube file is missing or truncated.",
+        )
+
+    def setup(self):
+        """Set up the inputs of the ``BaderCalculation`` in the context."""
+        super().setup()
+        self.ctx.inputs = AttributeDict(self.exposed_inputs(BaderCalculation, "bader"))
+        self.ctx.memory_increased = False
+
+    def report_error_handled(self, calculation, action):
+        """Report an action taken for a calculation that has failed.
+
+        :param calculation: the failed calculation node
+        :param action: a string message with the action taken
+        """
+        self.report(
+            f"{calculation.process_label}<{calculation.pk}> failed with exit status "
+            f"{calculation.exit_status}: {calculation.exit_message}"
+        )
+        self.report(f"Action taken: {action}")
+
+    @process_handler(priority=100)
+    def handle_unrecoverable_failure(self, calculation):
+        """Stop on failures that are not handled by the other handlers."""
+        if calculation.is_failed:
+            self.report_error_handled(calculation, "unrecoverable error, aborting...")
+            return ProcessHandlerReport(
+                True, self.exit_codes.ERROR_UNRECOVERABLE_FAILURE
+            )
+        return None
+
+    @process_handler(
+        priority=580,
+        exit_codes=[
+            BaderCalculation.exit_codes.ERROR_INPUT_CUBE_MISSING,
+            BaderCalculation.exit_codes.ERROR_INPUT_CUBE_TRUNCATED,
+        ],
+    )
+    def handle_input_cube(self, calculation):
+        """Stop, because the charge density has to be computed again."""
+        self.report_error_handled(
+            calculation, "the input cube cannot be used, aborting"
+        )
+        return ProcessHandlerReport(True, self.exit_codes.ERROR_INPUT_CUBE)
+
+    @process_handler(
+        priority=570,
+        exit_codes=[BaderCalculation.exit_codes.ERROR_SCHEDULER_OUT_OF_WALLTIME],
+    )
+    def handle_out_of_walltime(self, calculation):
+        """Restart with a longer walltime."""
+        options = self.ctx.inputs.metadata.options
+        walltime = int(
+            options.get("max_wallclock_seconds", 3600)
+            * self.inputs.walltime_factor.value
+        )
+        options["max_wallclock_seconds"] = walltime
+        self.report_error_handled(
+            calculation, f"restarting with a walltime of {walltime} s"
+        )
+        return ProcessHandlerReport(True)
+
+    @process_handler(
+        priority=560,
+        exit_codes=[
+            BaderCalculation.exit_codes.ERROR_SCHEDULER_OUT_OF_MEMORY,
+            BaderCalculation.exit_codes.ERROR_OUTPUT_TRUNCATED,
+        ],
+    )
+    def handle_out_of_memory(self, calculation):
+        """Restart with more memory, or with the ``neargrid`` algorithm."""
+        options = self.ctx.inputs.metadata.options
+        parameters = self.ctx.inputs.get("parameters")
+        parameters = {} if parameters is None else parameters.get_dict()
+        weight = parameters.get("algorithm") == "weight"
+
+        if options.get("max_memory_kb") is not None and not (
+            weight and self.ctx.memory_increased
+        ):
+            memory = int(options["max_memory_kb"] * self.inputs.memory_factor.value)
+            options["max_memory_kb"] = memory
+            self.ctx.memory_increased = True
+            self.report_error_handled(calculation, f"restarting with {memory} kB")
+            return ProcessHandlerReport(True)
+
+        if weight:
+            parameters["algorithm"] = "neargrid"
+            self.ctx.inputs.parameters = orm.Dict(parameters)
+            self.report_error_handled(
+                calculation, "restarting with the `neargrid` algorithm"
+            )
+            return ProcessHandlerReport(True)
+
+        self.report_error_handled(
+            calculation, "no memory limit to increase and no fallback, aborting"
+        )
+        return ProcessHandlerReport(True, self.exit_codes.ERROR_UNRECOVERABLE_FAILURE)
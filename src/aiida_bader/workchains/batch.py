@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+"""QeBaderBatchWorkChain workchain of the AiiDA bader plugin"""
+
+from aiida import orm
+from aiida.engine import ToContext, WorkChain, while_
+
+from aiida_bader.calculations.functions import collect_bader_charges
+from aiida_bader.workchains.qe_bader import QeBaderWorkChain
+
+
+def validate_inputs(inputs, _):
+    """Validate the top-level inputs of the ``QeBaderBatchWorkChain``."""
+    if not inputs.get("structures") and "structure_group" not in inputs:
+        return "Either `structures` or `structure_group` has to be given."
+    if inputs["max_concurrent"].value < 1:
+        return "`max_concurrent` must be at least 1."
+    return None
+
+
+class QeBaderBatchWorkChain(WorkChain):
+    """A workchain that runs the ``QeBaderWorkChain`` for many structures.
+
+    The inputs of each member are generated with
+    ``QeBaderWorkChain.get_builder_from_protocol`` from one shared set of codes,
+    protocol, overrides and options, so that the pseudopotentials and k-points match
+    each structure. At most ``max_concurrent`` members run at the same time: the work
+    chain waits for the oldest running member, then records all the members that have
+    terminated in the meantime and refills their slots, in the order of the structures.
+    The slot of a member that terminates before an older one is only refilled once the
+    older one has terminated.
+
+    The state of the members is kept by pk in the context, so after a daemon restart
+    the members that were already submitted are not submitted again.
+    """
+
+    @classmethod
+    def define(cls, spec):
+        """Define workflow specification."""
+        super().define(spec)
+
+        spec.input_namespace(
+            "structures",
+            valid_type=orm.StructureData,
+            dynamic=True,
+            required=False,
+            help="The structures, by label.",
+        )
+        spec.input(
+            "structure_group",
+            valid_type=orm.Str,
+            required=False,
+            help="Label of a group of structures. They are labelled `structure_<pk>`.",
+        )
+        spec.input("pw_code", valid_type=orm.AbstractCode, help="The pw.x code.")
+        spec.input("pp_code", valid_type=orm.AbstractCode, help="The pp.x code.")
+        spec.input("bader_code", valid_type=orm.AbstractCode, help="The bader code.")
+        spec.input(
+            "protocol",
+            valid_type=orm.Str,
+            required=False,
+            help="The protocol of the `QeBaderWorkChain`.",
+        )
+        spec.input(
+            "overrides",
+            valid_type=orm.Dict,
+            required=False,
+            help="Overrides of the protocol inputs, shared by all structures.",
+        )
+        spec.input(
+            "options",
+            valid_type=orm.Dict,
+            required=False,
+            help="Scheduler options of all the calculations.",
+        )
+        spec.input(
+            "max_concurrent",
+            valid_type=orm.Int,
+            default=lambda: orm.Int(10),
+            help="Maximum number of `QeBaderWorkChain`s running at the same time.",
+        )
+        spec.inputs.validator = validate_inputs
+
+        spec.outline(
+            cls.setup,
+            while_(cls.should_submit)(cls.submit_members),
+            cls.results,
+        )
+
+        spec.output_namespace(
+            "bader_charge",
+            valid_type=orm.ArrayData,
+            dynamic=True,
+            help="The bader charges of each structure, by label.",
+        )
+        spec.output(
+            "summary",
+            valid_type=orm.Dict,
+            required=False,
+            help="The charges and the charge summary of all structures, by label.",
+        )
+
+        spec.exit_code(
+            401,
+            "ERROR_SUB_PROCESS_FAILED",
+            message="The `QeBaderWorkChain` of {count} structures failed: {labels}.",
+        )
+
+    def setup(self):
+        """Collect the structures and initialise the queue."""
+        structures = dict(self.inputs.get("structures", {}))
+        if "structure_group" in self.inputs:
+            group = orm.load_group(self.inputs.structure_group.value)
+            for node in group.nodes:
+                if isinstance(node, orm.StructureData):
+                    structures[f"structure_{node.pk}"] = node
+        # lists of ``[label, pk]`` in submission order
+        self.ctx.pending = [[label, node.pk] for label, node in structures.items()]
+        self.ctx.running = []
+        self.ctx.finished = []
+        self.report(f"Running the bader analysis of {len(structures)} structures.")
+
+    def should_submit(self):
+        """Return whether there are members left to submit or to wait for."""
+        return bool(self.ctx.pending or self.ctx.running)
+
+    def submit_members(self):
+        """Record the finished members, fill the free slots and wait for the oldest."""
+        running = []
+        for label, pk in self.ctx.running:
+            if orm.load_node(pk).is_terminated:
+                self.ctx.finished.append([label, pk])
+            else:
+                running.append([label, pk])
+
+        max_concurrent = self.inputs.max_concurrent.value
+        while self.ctx.pending and len(running) < max_concurrent:
+            label, pk = self.ctx.pending.pop(0)
+            builder = self._get_member_builder(orm.load_node(pk))
+            builder.metadata.call_link_label = f"member_{label}"
+            node = self.submit(builder)
+            running.append([label, node.pk])
+            self.report(f"Submitted QeBaderWorkChain<{node.pk}> for `{label}`.")
+        self.ctx.running = running
+
+        if not running:
+            return None
+        _, pk = running[0]
+        return ToContext(**{f"member_{pk}": orm.load_node(pk)})
+
+    def _get_member_builder(self, structure):
+        """Return the builder of the ``QeBaderWorkChain`` of ``structure``."""
+        kwargs = {}
+        for name in ("protocol", "overrides", "options"):
+            if name in self.inputs:
+                value = self.inputs[name]
+                kwargs[name] = value.value if name == "protocol" else value.get_dict()
+        return QeBaderWorkChain.get_builder_from_protocol(
+            self.inputs.pw_code,
+            self.inputs.pp_code,
+            self.inputs.bader_code,
+            structure,
+            **kwargs,
+        )
+
+    def results(self):
+        """Expose the charges of the members and collect them in the summary."""
+        charges = {}
+        failed = []
+        for label, pk in self.ctx.finished:
+            node = orm.load_node(pk)
+            if not node.is_finished_ok:
+                failed.append(label)
+                continue
+            charges[label] = node.outputs.bader.bader_charge
+            self.out(f"bader_charge.{label}", charges[label])
+
+        if charges:
+            self.out("summary", collect_bader_charges(**charges))
+        if failed:
+            return self.exit_codes.ERROR_SUB_PROCESS_FAILED.format(
+                count=len(failed), labels=", ".join(failed)
+            )
+        return None
@@ -3,17 +3,79 @@
 
 from __future__ import absolute_import
 
-from aiida.common import AttributeDict
-from aiida.engine import ToContext, WorkChain
+from aiida.common import AttributeDict, timezone
+from aiida.common.links import LinkType
+from aiida.engine import ToContext, WorkChain, if_
 from aiida.plugins import CalculationFactory, WorkflowFactory
 from aiida_quantumespresso.common.types import ElectronicType, RestartType, SpinType
 from aiida import orm
+import numpy as np
 from aiida_quantumespresso.workflows.protocols.utils import ProtocolMixin
 from aiida_quantumespresso.workflows.pw.base import PwBaseWorkChain
 from aiida_bader.calculations import BaderCalculation
+from aiida_bader.calculations.cube import (
+    CubeConversionCalculation,
+    CubeResampleCalculation,
+    validate_grid_factors,
+)
+from aiida_bader.calculations.functions import select_converged_grid
+from aiida_bader.calculations.pp_bader import PpBaderCalculation
+from aiida_bader.resources import estimate_bader_resources, read_remote_cube_header
+from aiida_bader.timing import TIMING_EXTRA, get_workflow_timing
+from aiida_bader.utils import CLEANUP_POLICIES, clean_remote_folders
+from aiida_bader.workchains.bader_base import BaderBaseWorkChain
 
 PpCalculation = CalculationFactory("quantumespresso.pp")  # pylint: disable=invalid-name
 
+REFERENCE_DENSITIES = ("pp", "core")
+
+# The calculations whose remote folders are cleaned, see the ``cleanup`` input: those
+# with the wavefunctions and the cube files of pw.x and pp.x, and their output
+# namespaces. The folder of a fused run is the ``bader`` output, so it is kept.
+CLEANUP_PROCESS_TYPES = (
+    "aiida.calculations:quantumespresso.pw",
+    "aiida.calculations:quantumespresso.pp",
+)
+CLEANUP_NAMESPACES = ("scf", "pp_valence", "pp_all")
+
+
+def validate_inputs(inputs, _):
+    """Validate the top-level inputs of the ``QeBaderWorkChain``."""
+    reference_density = (
+        inputs["reference_density"].value if "reference_density" in inputs else "pp"
+    )
+    if "parent_folder" not in inputs and "pw" not in inputs.get("scf", {}):
+        return "Either the `scf` inputs or a `parent_folder` has to be given."
+    if reference_density not in REFERENCE_DENSITIES:
+        return f"`reference_density` must be one of {REFERENCE_DENSITIES}"
+    if reference_density == "pp" and "code" not in inputs.get("pp_all", {}):
+        return "The `pp_all` inputs are required when `reference_density` is `pp`."
+    if reference_density == "core" and "cube_code" not in inputs:
+        return "The `cube_code` input is required when `reference_density` is `core`."
+    if reference_density == "core" and not isinstance(
+        inputs["cube_code"], orm.InstalledCode
+    ):
+        return "The `cube_code` must be an `InstalledCode` when `reference_density` is `core`."
+    if "cleanup" in inputs and inputs["cleanup"].value not in CLEANUP_POLICIES:
+        return f"`cleanup` must be one of {CLEANUP_POLICIES}"
+    cache_densities = "cache_densities" in inputs and inputs["cache_densities"].value
+    if cache_densities and "cube_code" not in inputs:
+        return "The `cube_code` input is required when `cache_densities` is set."
+    if "fused" in inputs and inputs["fused"].value:
+        if reference_density != "pp":
+            return "A fused run needs `reference_density` to be `pp`."
+        if cache_densities:
+            return "The cube files of a fused run cannot be cached."
+    if "grid_factors" in inputs:
+        message = validate_grid_factors(inputs["grid_factors"], None)
+        if message is not None:
+            return message
+        if len(inputs["grid_factors"]) < 2:
+            return "At least two `grid_factors` are needed to check the convergence."
+        if "cube_code" not in inputs:
+            return "The `cube_code` input is required when `grid_factors` are given."
+    return None
+
 
 class QeBaderWorkChain(ProtocolMixin, WorkChain):
     """A workchain that computes bader charges using QE and Bader code."""
@@ -36,27 +98,167 @@ class QeBaderWorkChain(ProtocolMixin, WorkChain):
                 "populate_defaults": False,
             },
         )
+        spec.input(
+            "parent_folder",
+            valid_type=orm.RemoteData,
+            required=False,
+            help="The remote folder of a finished `PwCalculation` of the `structure`, e.g. "
+            "`calculation.outputs.remote_folder`. If given, the scf step is skipped and the "
+            "charge-densities are computed from this calculation.",
+        )
         spec.expose_inputs(
             PpCalculation, namespace="pp_valence", exclude=["parent_folder"]
         )
-        spec.expose_inputs(PpCalculation, namespace="pp_all", exclude=["parent_folder"])
+        spec.expose_inputs(
+            PpCalculation,
+            namespace="pp_all",
+            exclude=["parent_folder"],
+            namespace_options={
+                "help": "Inputs for the `PpCalculation` of the all-electron charge-density, "
+                "used when `reference_density` is `pp`.",
+                "required": False,
+                "populate_defaults": False,
+            },
+        )
         spec.expose_inputs(
             BaderCalculation,
             namespace="bader",
-            exclude=["charge_density_folder", "reference_charge_density_folder"],
+            exclude=[
+                "charge_density_folder",
+                "reference_charge_density_folder",
+                "reference_pseudos",
+                "reference_code",
+                "structure",
+            ],
+        )
+
+        spec.input(
+            "cube_code",
+            valid_type=orm.AbstractCode,
+            required=False,
+            help="Python code with NumPy, used to convert the cube files to binary density "
+            "caches, to build the reference density from the core densities and to "
+            "resample the densities to other grids. The reference density is built in the "
+            "prepend text of the bader job, so the code must then be an `InstalledCode`.",
+        )
+        spec.input(
+            "cache_densities",
+            valid_type=orm.Bool,
+            default=lambda: orm.Bool(False),
+            help="Convert the cube files of pp.x to binary density caches with the "
+            "`cube_code`, see the `density_cache` outputs. The conversions run alongside "
+            "bader, which does not wait for them.",
+        )
+        spec.input(
+            "reference_density",
+            valid_type=orm.Str,
+            default=lambda: orm.Str("pp"),
+            help="How the all-electron reference density is computed: `pp` runs pp.x a second "
+            "time, `core` adds the core densities of the `scf.pw.pseudos` to the valence "
+            "density with the `cube_code`, in the bader job right before bader runs.",
+        )
+        spec.input(
+            "fused",
+            valid_type=orm.Bool,
+            default=lambda: orm.Bool(False),
+            help="Run the two pp.x calculations and bader in a single job with the "
+            "`PpBaderCalculation`, with the code and options of `pp_valence`. This saves "
+            "two queue waits when the queueing time dominates.",
+        )
+        spec.input(
+            "restart_bader",
+            valid_type=orm.Bool,
+            default=lambda: orm.Bool(True),
+            help="Run bader with the `BaderBaseWorkChain`, which restarts it when it runs "
+            "out of walltime or memory, instead of a single `BaderCalculation`.",
+        )
+        spec.input(
+            "auto_resources",
+            valid_type=orm.Bool,
+            default=lambda: orm.Bool(True),
+            help="Set the memory, walltime and OpenMP threads of bader from the grid size "
+            "in the header of the valence cube file. Only the `max_memory_kb`, "
+            "`max_wallclock_seconds` and `num_threads` that are not given in "
+            "`bader.metadata.options` are set.",
+        )
+        spec.input(
+            "cleanup",
+            valid_type=orm.Str,
+            default=lambda: orm.Str("none"),
+            help="What to delete from the remote folders of the pw.x and pp.x calculations "
+            "once the work chain terminates, see `CLEANUP_PROCESS_TYPES`; the folders "
+            "returned for reuse, as the `density_cache`, are always kept: `none`; "
+            "`on_success` deletes everything if the work chain "
+            "finished successfully; `always` does so also if it failed; `keep_density` only "
+            "deletes the wavefunction files, and keeps the charge-density and the cube files, "
+            "if the work chain finished successfully.",
+        )
+        spec.input(
+            "grid_factors",
+            valid_type=orm.List,
+            required=False,
+            help="Check the convergence of the bader charges with the grid: the valence "
+            "density of pp.x is resampled by Fourier interpolation with the `cube_code` to "
+            "grids with the number of points along each axis scaled by these factors, and "
+            "bader runs on all of them concurrently. The all-electron reference of pp.x is "
+            "interpolated in real space, and with `core` it is built on each grid. The scf "
+            "calculation runs only once.",
+        )
+        spec.input(
+            "grid_tolerance",
+            valid_type=orm.Float,
+            default=lambda: orm.Float(0.01),
+            help="The largest difference in electrons of the charge of any atom between a "
+            "grid and the next finer one for the coarser grid to be converged.",
         )
+        spec.inputs.validator = validate_inputs
 
         spec.outline(
-            cls.run_pw,
-            cls.run_pp,
-            cls.run_bader,
+            if_(cls.should_run_pw)(cls.run_pw),
+            if_(cls.should_fuse)(cls.run_pp_bader).else_(
+                cls.run_pp,
+                if_(cls.should_estimate_resources)(cls.estimate_resources),
+                if_(cls.should_converge_grid)(
+                    cls.run_resample,
+                    cls.run_bader_grids,
+                    cls.inspect_grids,
+                ).else_(cls.run_bader),
+            ),
             cls.return_results,
         )
 
-        spec.expose_outputs(PwBaseWorkChain, namespace="scf")
-        spec.expose_outputs(PpCalculation, namespace="pp_valence")
-        spec.expose_outputs(PpCalculation, namespace="pp_all")
+        spec.expose_outputs(
+            PwBaseWorkChain,
+            namespace="scf",
+            namespace_options={"required": False},
+        )
+        spec.expose_outputs(
+            PpCalculation,
+            namespace="pp_valence",
+            namespace_options={"required": False},
+        )
+        spec.expose_outputs(
+            PpCalculation,
+            namespace="pp_all",
+            namespace_options={"required": False},
+        )
         spec.expose_outputs(BaderCalculation, namespace="bader")
+        spec.output(
+            "grid_convergence",
+            valid_type=orm.Dict,
+            required=False,
+            help="The bader charges on each of the `grid_factors` and the recommended grid, "
+            "the coarsest one that is converged. The `bader` outputs are those of the "
+            "finest grid.",
+        )
+        spec.output_namespace(
+            "density_cache",
+            valid_type=orm.RemoteData,
+            required=False,
+            dynamic=True,
+            help="Remote folders with the binary density caches of the `pp_valence` and "
+            "`pp_all` cube files, see `aiida_bader.cube.load_density_cache`.",
+        )
 
         spec.exit_code(903, "ERROR_PARSING_PW_OUTPUT", "Error while parsing PW output")
         spec.exit_code(
@@ -70,6 +272,11 @@ class QeBaderWorkChain(ProtocolMixin, WorkChain):
         spec.exit_code(
             906, "ERROR_PARSING_BADER_OUTPUT", "Error while parsing bader output"
         )
+        spec.exit_code(
+            907,
+            "ERROR_RESAMPLING_FAILED",
+            "The charge-densities could not be resampled to the other grids",
+        )
 
     @classmethod
     def get_protocol_filepath(cls):
@@ -137,6 +344,7 @@ class QeBaderWorkChain(ProtocolMixin, WorkChain):
 
         builder = cls.get_builder()
         builder.structure = structure
+        builder.cleanup = orm.Str(inputs.get("cleanup", "none"))
         builder.scf = scf
         builder.pp_valence.code = pp_code  # pylint: disable=no-member
         builder.pp_valence.parameters = orm.Dict(
@@ -157,6 +365,22 @@ class QeBaderWorkChain(ProtocolMixin, WorkChain):
 
         return builder
 
+    def should_run_pw(self):
+        """Return whether the scf calculation has to be run."""
+        return "parent_folder" not in self.inputs
+
+    def _get_scf_folder(self):
+        """Return the remote folder of the scf calculation."""
+        if "parent_folder" in self.inputs:
+            return self.inputs.parent_folder
+        return self.ctx.pw_calc.outputs.remote_folder
+
+    def _get_pseudos(self):
+        """Return the pseudopotentials of the scf calculation."""
+        if "pw" in self.inputs.get("scf", {}) and "pseudos" in self.inputs.scf.pw:
+            return self.inputs.scf.pw.pseudos
+        return self.inputs.parent_folder.creator.inputs.pseudos
+
     def run_pw(self):
         """Run PW."""
         scf_inputs = AttributeDict(self.exposed_inputs(PwBaseWorkChain, "scf"))
@@ -175,77 +399,414 @@ class QeBaderWorkChain(ProtocolMixin, WorkChain):
             pp_valence_inputs = AttributeDict(
                 self.exposed_inputs(PpCalculation, "pp_valence")
             )
-            pp_valence_inputs["parent_folder"] = self.ctx.pw_calc.outputs.remote_folder
-            pp_all_inputs = AttributeDict(self.exposed_inputs(PpCalculation, "pp_all"))
-            pp_all_inputs["parent_folder"] = self.ctx.pw_calc.outputs.remote_folder
+            pp_valence_inputs["parent_folder"] = self._get_scf_folder()
+            if self.inputs.reference_density.value == "pp":
+                pp_all_inputs = AttributeDict(
+                    self.exposed_inputs(PpCalculation, "pp_all")
+                )
+                pp_all_inputs["parent_folder"] = self._get_scf_folder()
         except Exception as exc:  # pylint: disable=broad-except
             self.report(f'Encountered exception "{str(exc)}" while parsing PW output')
             return self.exit_codes.ERROR_PARSING_PW_OUTPUT  # pylint: disable=no-member
 
         pp_valence_inputs["metadata"]["call_link_label"] = "call_pp_valence_calc"
-        pp_all_inputs["metadata"]["call_link_label"] = "call_pp_all_calc"
 
         # Create the calculation process and launch it
         pp_valence_running = self.submit(PpCalculation, **pp_valence_inputs)
-        pp_all_running = self.submit(PpCalculation, **pp_all_inputs)
         self.report(
             f"Running PpCalculation<{pp_valence_running.pk}> to compute the valence charge-density"
         )
+        if self.inputs.reference_density.value != "pp":
+            return ToContext(pp_valence_calc=pp_valence_running)
+
+        pp_all_inputs["metadata"]["call_link_label"] = "call_pp_all_calc"
+        pp_all_running = self.submit(PpCalculation, **pp_all_inputs)
         self.report(
             f"Running PpCalculation<{pp_all_running.pk}> to compute the all-electron charge-density"
         )
         return ToContext(pp_valence_calc=pp_valence_running, pp_all_calc=pp_all_running)
 
+    def should_fuse(self):
+        """Return whether pp.x and bader are run in a single job."""
+        return self.inputs.fused.value
+
+    def run_pp_bader(self):
+        """Run both pp.x calculations and bader in a single job."""
+        pp_valence_inputs = self.exposed_inputs(PpCalculation, "pp_valence")
+        pp_all_inputs = self.exposed_inputs(PpCalculation, "pp_all")
+        bader_inputs = self.exposed_inputs(BaderCalculation, "bader")
+        inputs = {
+            "code": pp_valence_inputs["code"],
+            "bader_code": bader_inputs["code"],
+            "parent_folder": self._get_scf_folder(),
+            "pp_valence_parameters": pp_valence_inputs["parameters"],
+            "pp_all_parameters": pp_all_inputs["parameters"],
+            "structure": self.inputs.structure,
+            "retrieve_basins": bader_inputs["retrieve_basins"],
+            "metadata": {"call_link_label": "call_pp_bader_calc"},
+        }
+        # the scheduler options of pp_valence, but not those specific to its plugin
+        options = PpBaderCalculation.spec().inputs["metadata"]["options"]
+        inputs["metadata"]["options"] = {
+            key: value
+            for key, value in pp_valence_inputs["metadata"].get("options", {}).items()
+            if key in options and key not in ("parser_name", "withmpi")
+        }
+        num_threads = bader_inputs["metadata"].get("options", {}).get("num_threads")
+        if num_threads is not None:
+            inputs["metadata"]["options"]["num_threads"] = num_threads
+        if "parameters" in bader_inputs:
+            inputs["parameters"] = bader_inputs["parameters"]
+
+        running = self.submit(PpBaderCalculation, **inputs)
+        self.report(
+            f"Running PpBaderCalculation<{running.pk}> to compute the charge-densities "
+            "and the bader charges in a single job"
+        )
+        return ToContext(bader_calc=running)
+
+    def _submit_cache_densities(self):
+        """Convert the cube files of the PP calculations to binary density caches, if
+        ``cache_densities`` is set, and return the running processes by context key.
+
+        They are submitted with bader and awaited with it, so bader does not wait for
+        them.
+        """
+        running = {}
+        if not self.inputs.cache_densities.value:
+            return running
+        for name in ("pp_valence", "pp_all"):
+            if f"{name}_calc" not in self.ctx:
+                continue
+            inputs = {
+                "code": self.inputs.cube_code,
+                "parent_folder": self.ctx[f"{name}_calc"].outputs.remote_folder,
+                "metadata": {"call_link_label": f"call_{name}_cache"},
+            }
+            running[f"{name}_cache"] = self.submit(CubeConversionCalculation, **inputs)
+            self.report(
+                f"Running CubeConversionCalculation<{running[f'{name}_cache'].pk}> "
+                f"to cache the {name} charge-density"
+            )
+        return running
+
+    def should_estimate_resources(self):
+        """Return whether the resources of bader should be estimated from the cube file."""
+        return self.inputs.auto_resources.value
+
+    def estimate_resources(self):
+        """Estimate the resources of bader from the header of the valence cube file."""
+        try:
+            header = read_remote_cube_header(
+                self.ctx.pp_valence_calc.outputs.remote_folder,
+                self.inputs.bader.charge_density_filename.value,
+            )
+        except OSError as exc:
+            self.report(f"Warning: keeping the given resources of bader, {exc}")
+            return
+        self.ctx.num_atoms = header["num_atoms"]
+        self.ctx.bader_resources = self._estimate_bader_resources(header["shape"])
+        self.report(
+            f"Estimated the resources of bader for a grid of {header['shape']} points: "
+            f"{self.ctx.bader_resources}"
+        )
+
+    def _estimate_bader_resources(self, shape):
+        """Return the estimated resources of bader for a grid of ``shape``."""
+        bader_inputs = self.inputs.bader
+        parameters = bader_inputs.get("parameters")
+        parameters = {} if parameters is None else parameters.get_dict()
+        # the threads of all the processes on a machine share its cores
+        max_cores = bader_inputs.code.computer.get_default_mpiprocs_per_machine()
+        num_procs = bader_inputs.metadata.options.resources.get(
+            "num_mpiprocs_per_machine", max_cores
+        )
+        max_threads = max(1, max_cores // num_procs) if max_cores else None
+        return estimate_bader_resources(
+            shape,
+            self.ctx.num_atoms,
+            algorithm=parameters.get("algorithm", "neargrid"),
+            max_threads=max_threads,
+        )
+
+    def _set_bader_resources(self, options, resources=None):
+        """Set the scheduler ``options`` of bader that are not given to the estimated
+        ``resources``, by default those of the valence cube file."""
+        resources = resources or self.ctx.bader_resources
+        for key in ("max_memory_kb", "max_wallclock_seconds"):
+            if options.get(key) is None:
+                options[key] = resources[key]
+        if options.get("num_threads") is not None:
+            return
+        options["num_threads"] = resources["num_threads"]
+        # reserve the cores of the threads, if the scheduler has a setting for them
+        scheduler = self.inputs.bader.code.computer.get_scheduler()
+        valid_keys = scheduler.job_resource_class.get_valid_keys()
+        if "num_cores_per_mpiproc" in valid_keys:
+            options["resources"] = dict(options.get("resources", {}))
+            options["resources"].setdefault(
+                "num_cores_per_mpiproc", resources["num_threads"]
+            )
+
+    def _get_bader_inputs(self, charge_density_folder, reference_folder=None):
+        """Return the inputs of bader for the charge-densities in the given folders.
+
+        If ``reference_density`` is ``core``, the reference density is built in the bader
+        job from the pseudopotentials instead, and ``reference_folder`` is ignored.
+        """
+        bader_inputs = AttributeDict(self.exposed_inputs(BaderCalculation, "bader"))
+        bader_inputs["charge_density_folder"] = charge_density_folder
+        if self.inputs.reference_density.value == "core":
+            bader_inputs["reference_code"] = self.inputs.cube_code
+            bader_inputs["reference_pseudos"] = self._get_pseudos()
+        else:
+            bader_inputs["reference_charge_density_folder"] = reference_folder
+        bader_inputs["structure"] = self.inputs.structure
+        bader_inputs["metadata"]["options"] = dict(bader_inputs["metadata"]["options"])
+        return bader_inputs
+
+    def _get_reference_folder(self):
+        """Return the remote folder of the all-electron reference charge-density of
+        pp.x, or ``None`` if it is built in the bader job."""
+        if "pp_all_calc" not in self.ctx:
+            return None
+        return self.ctx.pp_all_calc.outputs.remote_folder
+
+    def _submit_bader(self, bader_inputs):
+        """Submit bader with the ``BaderBaseWorkChain`` or as a single calculation."""
+        if self.inputs.restart_bader.value:
+            return self.submit(
+                BaderBaseWorkChain,
+                bader=bader_inputs,
+                metadata={
+                    "call_link_label": "call_bader_base",
+                    "label": bader_inputs["metadata"].get("label", ""),
+                },
+            )
+        bader_inputs["metadata"]["call_link_label"] = "call_bader_calc"
+        return self.submit(BaderCalculation, **bader_inputs)
+
     def run_bader(self):
         """Parse the PP ouputs cube file, and submit bader calculation."""
         try:
-            bader_inputs = AttributeDict(self.exposed_inputs(BaderCalculation, "bader"))
-            bader_inputs[
-                "charge_density_folder"
-            ] = self.ctx.pp_valence_calc.outputs.remote_folder
-            bader_inputs[
-                "reference_charge_density_folder"
-            ] = self.ctx.pp_all_calc.outputs.remote_folder
+            bader_inputs = self._get_bader_inputs(
+                self.ctx.pp_valence_calc.outputs.remote_folder,
+                self._get_reference_folder(),
+            )
         except Exception as exc:  # pylint: disable=broad-except
             self.report(f'Encountered exception "{str(exc)}" while parsing PP output')
-            return self.exit_codes.ERROR_PARSING_PP_OUTPUT  # pylint: disable=no-member
-
-        bader_inputs["metadata"]["call_link_label"] = "call_bader_calc"
+            return (
+                self.exit_codes.ERROR_PARSING_PP_VALENCE_OUTPUT
+            )  # pylint: disable=no-member
+        if "bader_resources" in self.ctx:
+            self._set_bader_resources(bader_inputs["metadata"]["options"])
 
-        # Create the calculation process and launch it
-        running = self.submit(BaderCalculation, **bader_inputs)
+        running = self._submit_bader(bader_inputs)
         self.report(
-            f"Running BaderCalculation<{running.pk}> to compute point charges from the charge-density"
+            f"Running {running.process_label}<{running.pk}> to compute point charges from the charge-density"
         )
-        return ToContext(bader_calc=running)
+        return ToContext(bader_calc=running, **self._submit_cache_densities())
+
+    def should_converge_grid(self):
+        """Return whether the convergence of the charges with the grid is checked."""
+        return "grid_factors" in self.inputs
+
+    def run_resample(self):
+        """Resample the charge-densities to the grids of the ``grid_factors``."""
+        bader_inputs = self.inputs.bader
+        inputs = {
+            "code": self.inputs.cube_code,
+            "charge_density_folder": self.ctx.pp_valence_calc.outputs.remote_folder,
+            "charge_density_filename": bader_inputs.charge_density_filename,
+            "grid_factors": self.inputs.grid_factors,
+            "metadata": {"call_link_label": "call_resample_calc"},
+        }
+        reference_folder = self._get_reference_folder()
+        if reference_folder is not None:
+            inputs["reference_charge_density_folder"] = reference_folder
+            inputs[
+                "reference_charge_density_filename"
+            ] = bader_inputs.reference_charge_density_filename
+        running = self.submit(CubeResampleCalculation, **inputs)
+        self.report(
+            f"Running CubeResampleCalculation<{running.pk}> to resample the "
+            f"charge-densities with the grid factors {self.inputs.grid_factors.get_list()}"
+        )
+        return ToContext(resample_calc=running)
 
-    def return_results(self):
-        """Return exposed outputs and print the pk of the ArrayData w/bader"""
-        try:
-            self.out_many(
-                self.exposed_outputs(self.ctx.pw_calc, PwBaseWorkChain, namespace="scf")
+    def run_bader_grids(self):
+        """Run bader on the charge-densities of all the grids concurrently."""
+        resample_calc = self.ctx.resample_calc
+        if not resample_calc.is_finished_ok:
+            self.report(
+                f"CubeResampleCalculation<{resample_calc.pk}> failed with exit status "
+                f"{resample_calc.exit_status}"
             )
-            self.out_many(
-                self.exposed_outputs(
-                    self.ctx.pp_valence_calc, PpCalculation, namespace="pp_valence"
+            return self.exit_codes.ERROR_RESAMPLING_FAILED  # pylint: disable=no-member
+
+        remote_folder = resample_calc.outputs.remote_folder
+        grids = resample_calc.outputs.output_parameters["grids"]
+        running = {}
+        for index, grid in enumerate(grids):
+            bader_inputs = self._get_bader_inputs(remote_folder, remote_folder)
+            bader_inputs["charge_density_filename"] = orm.Str(
+                f"grid_{index}/charge_density.cube"
+            )
+            # with `core`, the core densities are added on the grid itself in the job
+            if "reference_charge_density_folder" in bader_inputs:
+                bader_inputs["reference_charge_density_filename"] = orm.Str(
+                    f"grid_{index}/reference_charge_density.cube"
+                )
+            bader_inputs["metadata"]["label"] = f"bader_grid_{index}"
+            if "bader_resources" in self.ctx:
+                self._set_bader_resources(
+                    bader_inputs["metadata"]["options"],
+                    self._estimate_bader_resources(grid["shape"]),
                 )
+            process = self._submit_bader(bader_inputs)
+            self.report(
+                f"Running {process.process_label}<{process.pk}> to compute the point "
+                f"charges on the grid {grid['shape']}"
             )
-            self.out_many(
-                self.exposed_outputs(
-                    self.ctx.pp_all_calc, PpCalculation, namespace="pp_all"
+            running[f"bader_grid_{index}"] = process
+        return ToContext(**running, **self._submit_cache_densities())
+
+    def _get_ecutrho(self):
+        """Return the cutoff of the charge-density of the scf calculation, if known."""
+        if "pw" in self.inputs.get("scf", {}):
+            parameters = self.inputs.scf.pw.parameters.get_dict()
+        else:
+            parameters = self.inputs.parent_folder.creator.inputs.parameters.get_dict()
+        system = parameters.get("SYSTEM", {})
+        if "ecutrho" in system:
+            return system["ecutrho"]
+        if "ecutwfc" in system:
+            return 4 * system["ecutwfc"]
+        return None
+
+    def inspect_grids(self):
+        """Select the coarsest grid on which the bader charges are converged."""
+        grids = self.ctx.resample_calc.outputs.output_parameters["grids"]
+        bader_charges = {}
+        for index in range(len(grids)):
+            running = self.ctx[f"bader_grid_{index}"]
+            if not running.is_finished_ok:
+                self.report(
+                    f"{running.process_label}<{running.pk}> on the grid "
+                    f"{grids[index]['shape']} failed"
                 )
+                return (
+                    self.exit_codes.ERROR_PARSING_BADER_OUTPUT
+                )  # pylint: disable=no-member
+            bader_charges[f"grid_{index}"] = running.outputs.bader_charge
+
+        inputs = {
+            "grids": self.ctx.resample_calc.outputs.output_parameters,
+            "tolerance": self.inputs.grid_tolerance,
+            "metadata": {"call_link_label": "select_converged_grid"},
+        }
+        ecutrho = self._get_ecutrho()
+        if ecutrho is not None:
+            inputs["ecutrho"] = orm.Float(ecutrho)
+        self.ctx.grid_convergence = select_converged_grid(**inputs, **bader_charges)
+
+        # the outputs of bader are those of the finest grid
+        finest = max(
+            range(len(grids)), key=lambda index: np.prod(grids[index]["shape"])
+        )
+        self.ctx.bader_calc = self.ctx[f"bader_grid_{finest}"]
+        summary = self.ctx.grid_convergence.get_dict()
+        if summary["converged"]:
+            self.report(
+                f"The bader charges are converged on the grid {summary['recommended_shape']} "
+                f"of the grid factor {summary['recommended_factor']}"
             )
+        else:
+            self.report(
+                "The bader charges are not converged within "
+                f"{summary['tolerance']} electrons on any grid"
+            )
+
+    def return_results(self):
+        """Return exposed outputs and print the pk of the ArrayData w/bader"""
+        try:
+            if "pw_calc" in self.ctx:
+                self.out_many(
+                    self.exposed_outputs(
+                        self.ctx.pw_calc, PwBaseWorkChain, namespace="scf"
+                    )
+                )
+            if "pp_valence_calc" in self.ctx:
+                self.out_many(
+                    self.exposed_outputs(
+                        self.ctx.pp_valence_calc, PpCalculation, namespace="pp_valence"
+                    )
+                )
+            if "pp_all_calc" in self.ctx:
+                self.out_many(
+                    self.exposed_outputs(
+                        self.ctx.pp_all_calc, PpCalculation, namespace="pp_all"
+                    )
+                )
             self.out_many(
                 self.exposed_outputs(
                     self.ctx.bader_calc, BaderCalculation, namespace="bader"
                 )
             )
+            if "grid_convergence" in self.ctx:
+                self.out("grid_convergence", self.ctx.grid_convergence)
             self.report(
                 f"bader charges computed: ArrayData<{self.outputs['bader']['bader_charge'].pk}>"
             )
+            for name in ("pp_valence", "pp_all"):
+                cache = self.ctx.get(f"{name}_cache")
+                if cache is None:
+                    continue
+                if cache.is_finished_ok:
+                    self.out(f"density_cache.{name}", cache.outputs.remote_folder)
+                else:
+                    self.report(f"The {name} charge-density could not be cached.")
         except KeyError:
             return (
                 self.exit_codes.ERROR_PARSING_BADER_OUTPUT
             )  # pylint: disable=no-member
 
         return 0
+
+    def on_terminated(self):
+        """Record the timing of the stages in the ``timing`` extra, and clean the remote
+        folders of the child calculations according to ``cleanup``."""
+        super().on_terminated()
+
+        self.node.base.extras.set(
+            TIMING_EXTRA, get_workflow_timing(self.node, end=timezone.now())
+        )
+
+        policy = self.inputs.cleanup.value
+        if policy == "none":
+            return
+        if policy != "always" and not self.node.is_finished_ok:
+            self.report("remote folders are kept because the work chain failed")
+            return
+
+        # the remote folders returned for reuse, as the ``density_cache``, are kept
+        kept = {
+            link.node.uuid
+            for link in self.node.base.links.get_outgoing(link_type=LinkType.RETURN)
+            if link.link_label.split("__")[0] not in CLEANUP_NAMESPACES
+        }
+        remote_folders = [
+            node.outputs.remote_folder
+            for node in self.node.called_descendants
+            if node.process_type in CLEANUP_PROCESS_TYPES
+            and "remote_folder" in node.outputs
+            and node.outputs.remote_folder.uuid not in kept
+        ]
+        cleaned = clean_remote_folders(
+            remote_folders, keep_density=policy == "keep_density"
+        )
+        if cleaned:
+            self.report(
+                f"cleaned ({policy}) remote folders: "
+                + " ".join(str(folder.pk) for folder in cleaned)
+            )
@@ -1,18 +1,153 @@
 # -*- coding: utf-8 -*-
 """Cp2kBaderWorkGraph of the AiiDA bader plugin"""
+import copy
 
-from aiida_workgraph import WorkGraph
+from aiida import orm
+from aiida_workgraph import WorkGraph, task
 
+# The electron density cube written by CP2K for the ``aiida`` project of aiida-cp2k.
+DENSITY_CUBE_FILENAME = "aiida-ELECTRON_DENSITY-1_0.cube"
 
-def Cp2kBaderWorkGraph():
+REFERENCE_DENSITIES = ("none", "core")
+
+# The run types of CP2K with a single scf, for which the density is written once.
+SINGLE_POINT_RUN_TYPES = ("ENERGY", "ENERGY_FORCE")
+
+
+def _section(parent, name):
+    """Return the section ``name`` of the CP2K ``parent`` section, which is created if
+    needed. The names of CP2K sections are case insensitive."""
+    for key, value in parent.items():
+        if key.upper() == name:
+            return value
+    parent[name] = {}
+    return parent[name]
+
+
+def _format_stride(stride):
+    """Return the ``STRIDE`` keyword of CP2K, from one or three positive integers."""
+    values = list(stride) if isinstance(stride, (list, tuple)) else [stride]
+    if len(values) not in (1, 3) or any(
+        isinstance(value, bool) or not isinstance(value, int) or value < 1
+        for value in values
+    ):
+        raise ValueError(f"`stride` must be one or three positive integers: {stride}")
+    return " ".join(str(value) for value in values)
+
+
+def add_density_cube(parameters, stride=2):
+    """Return a copy of the CP2K ``parameters`` that prints the electron density cube.
+
+    The ``FORCE_EVAL/DFT/PRINT/E_DENSITY_CUBE`` section is added with its ``STRIDE``,
+    so that CP2K writes the density to ``DENSITY_CUBE_FILENAME``. A stride of ``n``
+    writes every ``n``-th point of the grid along each axis, which divides the size of
+    the cube file and the runtime of bader by about ``n**3``.
+
+    The run type is set to ``ENERGY`` if it is not given. Other run types than those of
+    ``SINGLE_POINT_RUN_TYPES`` are rejected: they write a density at each step, and not
+    for the input structure, which is the one bader assigns the charges to.
+
+    :param parameters: the CP2K input, as a dictionary.
+    :param stride: one or three positive integers, see the ``STRIDE`` keyword of CP2K.
+    :raise ValueError: if the stride or the run type is not valid.
+    """
+    parameters = copy.deepcopy(parameters)
+    global_section = _section(parameters, "GLOBAL")
+    run_types = [key for key in global_section if key.upper() == "RUN_TYPE"]
+    if not run_types:
+        global_section["RUN_TYPE"] = "ENERGY"
+    elif str(global_section[run_types[0]]).upper() not in SINGLE_POINT_RUN_TYPES:
+        raise ValueError(
+            f"The run type must be one of {SINGLE_POINT_RUN_TYPES} to write the density "
+            f"of the structure: {global_section[run_types[0]]}"
+        )
+    force_evals = _section(parameters, "FORCE_EVAL")
+    if not isinstance(force_evals, list):
+        force_evals = [force_evals]
+    for force_eval in force_evals:
+        cube = _section(
+            _section(_section(force_eval, "DFT"), "PRINT"), "E_DENSITY_CUBE"
+        )
+        cube["STRIDE"] = _format_stride(stride)
+    return parameters
+
+
+@task.graph_builder(outputs=[{"name": "charge", "from": "bader.bader_charge"}])
+def cp2k_bader_workgraph(
+    structure: orm.StructureData = None,
+    cp2k_code: orm.Code = None,
+    bader_code: orm.Code = None,
+    parameters: dict = None,
+    basissets: dict = None,
+    pseudos: dict = None,
+    pseudos_upf: dict = None,
+    files: dict = None,
+    metadata_cp2k: dict = None,
+    metadata_bader: dict = None,
+    stride: int = 2,
+    reference_density: str = "none",
+    cube_code: orm.Code = None,
+    core_pseudos: dict = None,
+):
+    """Workgraph for Bader charge analysis with CP2K.
+    1. Run the CP2K energy calculation, which writes the electron density cube with
+       the given ``stride``, see ``add_density_cube``.
+    2. Run the Bader charge analysis of the electron density. If ``reference_density``
+       is ``core``, the bader job first adds the core densities of the UPF
+       ``core_pseudos``, by default the ``pseudos_upf`` of CP2K, to the electron density
+       with the ``cube_code``, and uses it as the reference. The GTH pseudopotentials
+       of CP2K have no core density, so the UPF pseudopotentials of the same elements
+       can be given instead, they only serve to mark the atoms in the reference.
+    """
     from aiida_cp2k.workchains.base import Cp2kBaseWorkChain
     from aiida_bader.calculations import BaderCalculation
 
-    wt = WorkGraph("charge-density")
-    cp2k_node = wt.nodes.new(Cp2kBaseWorkChain, name="scf")
-    wt.nodes.new(
+    # the inputs of the graph builder are stored as AiiDA nodes
+    stride = getattr(stride, "value", stride)
+    if reference_density not in REFERENCE_DENSITIES:
+        raise ValueError(f"`reference_density` must be one of {REFERENCE_DENSITIES}")
+    parameters = {} if parameters is None else parameters.get_dict()
+    core_pseudos = core_pseudos or pseudos_upf
+    if reference_density == "core" and (cube_code is None or not core_pseudos):
+        raise ValueError(
+            "The `cube_code` and the `core_pseudos` or `pseudos_upf` are required "
+            "when `reference_density` is `core`."
+        )
+    if reference_density == "core" and not isinstance(cube_code, orm.InstalledCode):
+        raise ValueError(
+            "The `cube_code` must be an `InstalledCode` when `reference_density` is `core`."
+        )
+
+    wg = WorkGraph("BaderChargeCp2k")
+    # -------- scf -----------
+    cp2k_inputs = {
+        "structure": structure,
+        "parameters": orm.Dict(add_density_cube(parameters, stride)),
+        "code": cp2k_code,
+        "metadata": metadata_cp2k,
+    }
+    for name, value in (
+        ("basissets", basissets),
+        ("pseudos", pseudos),
+        ("pseudos_upf", pseudos_upf),
+        ("file", files),
+    ):
+        if value:
+            cp2k_inputs[name] = value
+    scf_task = wg.add_task(Cp2kBaseWorkChain, name="scf")
+    scf_task.set({"cp2k": cp2k_inputs})
+    # -------- bader -----------
+    bader_inputs = {}
+    if reference_density == "core":
+        bader_inputs = {"reference_code": cube_code, "reference_pseudos": core_pseudos}
+    wg.add_task(
         BaderCalculation,
         name="bader",
-        charge_density_folder=cp2k_node.outputs["remote_folder"],
+        code=bader_code,
+        charge_density_folder=scf_task.outputs["remote_folder"],
+        charge_density_filename=orm.Str(DENSITY_CUBE_FILENAME),
+        structure=structure,
+        metadata=metadata_bader,
+        **bader_inputs,
     )
-    return wt
+    return wg
@@ -3,6 +3,106 @@
 from aiida import orm
 from aiida_workgraph import WorkGraph, task
 
+# The ``cleanup`` policies of the ``QeBaderWorkChain`` but ``always``: the cleanup task
+# only runs if bader succeeded.
+CLEANUP_POLICIES = ("none", "on_success", "keep_density")
+
+
+@task()
+def clean_remote_folders(policy, scf_folder, pp_valence_folder, pp_all_folder=None):
+    """Delete the remote folders of the pw and pp calculations, see ``cleanup``."""
+    from aiida_bader.utils import clean_remote_folders as clean
+
+    folders = [scf_folder, pp_valence_folder, pp_all_folder]
+    clean(
+        [folder for folder in folders if folder is not None],
+        keep_density=policy == "keep_density",
+    )
+
+
+def _add_grid_tasks(
+    wg,
+    grid_factors,
+    grid_tolerance,
+    cube_code,
+    bader_code,
+    charge_density_folder,
+    reference_inputs,
+    structure,
+    metadata_bader,
+    parameters,
+):
+    """Add the tasks that resample the charge densities to the ``grid_factors``, run bader
+    on each grid and select the converged grid. The bader task of the finest grid is
+    named ``bader``, the others ``bader_grid_<i>``.
+
+    :param reference_inputs: the reference inputs of bader, either the
+        ``reference_charge_density_folder`` or the ``reference_code`` and the
+        ``reference_pseudos``, with which the reference is built on each grid.
+
+    :return: the bader tasks.
+    """
+    from aiida_bader.calculations import BaderCalculation
+    from aiida_bader.calculations.cube import CubeResampleCalculation
+    from aiida_bader.calculations.functions import select_converged_grid
+
+    resample_task = wg.add_task(
+        CubeResampleCalculation,
+        name="resample",
+        code=cube_code,
+        charge_density_folder=charge_density_folder,
+        grid_factors=orm.List(list(grid_factors)),
+    )
+    resample_folder = resample_task.outputs["remote_folder"]
+    if "reference_charge_density_folder" in reference_inputs:
+        resample_task.set(
+            {
+                "reference_charge_density_folder": reference_inputs[
+                    "reference_charge_density_folder"
+                ]
+            }
+        )
+    finest = max(range(len(grid_factors)), key=lambda index: grid_factors[index])
+    bader_tasks = []
+    for index in range(len(grid_factors)):
+        if "reference_charge_density_folder" in reference_inputs:
+            grid_reference_inputs = {
+                "reference_charge_density_folder": resample_folder,
+                "reference_charge_density_filename": orm.Str(
+                    f"grid_{index}/reference_charge_density.cube"
+                ),
+            }
+        else:
+            grid_reference_inputs = reference_inputs
+        bader_tasks.append(
+            wg.add_task(
+                BaderCalculation,
+                name="bader" if index == finest else f"bader_grid_{index}",
+                code=bader_code,
+                charge_density_folder=resample_folder,
+                charge_density_filename=orm.Str(f"grid_{index}/charge_density.cube"),
+                structure=structure,
+                metadata=metadata_bader,
+                **grid_reference_inputs,
+            )
+        )
+    system = parameters.get("SYSTEM", {})
+    ecutrho = system.get(
+        "ecutrho", 4 * system["ecutwfc"] if "ecutwfc" in system else None
+    )
+    wg.add_task(
+        select_converged_grid,
+        name="select_grid",
+        grids=resample_task.outputs["output_parameters"],
+        tolerance=orm.Float(grid_tolerance),
+        ecutrho=None if ecutrho is None else orm.Float(ecutrho),
+        bader_charges={
+            f"grid_{index}": bader_task.outputs["bader_charge"]
+            for index, bader_task in enumerate(bader_tasks)
+        },
+    )
+    return bader_tasks
+
 
 @task.graph_builder(outputs=[{"name": "charge", "from": "bader.charge"}])
 def bader_workgraph(
@@ -16,13 +116,34 @@ def bader_workgraph(
     metadata_pw: dict = None,
     metadata_pp: dict = None,
     metadata_bader: dict = None,
+    reference_density: str = "pp",
+    cube_code: orm.Code = None,
+    cleanup: str = "none",
+    grid_factors: list = None,
+    grid_tolerance: float = 0.01,
 ):
     """Workgraph for Bader charge analysis.
     1. Run the SCF calculation.
     2. Run the PP calculation for valence charge density.
-    3. Run the PP calculation for all-electron charge density.
-    4. Run the Bader charge analysis.
+    3. Run the PP calculation for all-electron charge density, unless
+       ``reference_density`` is ``core``, in which case the bader job adds the core
+       densities of the pseudos to the valence charge density with the ``cube_code``
+       before bader runs.
+    4. Run the Bader charge analysis. If ``grid_factors`` are given, the valence
+       charge density and the all-electron one of pp.x are first resampled to the grids
+       of these factors with the ``cube_code``, bader runs on each grid, and the ``select_grid`` task selects the
+       coarsest converged grid, see the inputs of the ``QeBaderWorkChain``. The ``bader``
+       task is then the one of the finest grid.
+    5. Clean the remote folders of the pw and pp calculations, unless ``cleanup`` is
+       ``none``, see the ``cleanup`` input of the ``QeBaderWorkChain``. The task only
+       runs if bader succeeded, so ``always`` is rejected.
     """
+    if cleanup not in CLEANUP_POLICIES:
+        raise ValueError(f"`cleanup` must be one of {CLEANUP_POLICIES}: {cleanup}")
+    if reference_density == "core" and not isinstance(cube_code, orm.InstalledCode):
+        raise ValueError(
+            "The `cube_code` must be an `InstalledCode` when `reference_density` is `core`."
+        )
 
     from aiida_quantumespresso.workflows.pw.base import PwBaseWorkChain
     from aiida_quantumespresso.calculations.pp import PpCalculation
@@ -73,26 +194,62 @@ def bader_workgraph(
         metadata=metadata_pp,
     )
     # -------- pp all -----------
-    pp_all = wg.add_task(
-        PpCalculation,
-        name="pp_all",
-        code=pp_code,
-        parent_folder=scf_task.outputs["remote_folder"],
-        parameters=orm.Dict(
-            {
-                "INPUTPP": {"plot_num": 21},
-                "PLOT": {"iflag": 3},
-            }
-        ),
-        metadata=metadata_pp,
-    )
+    pp_all = None
+    if reference_density == "core":
+        reference_inputs = {"reference_code": cube_code, "reference_pseudos": pseudos}
+    else:
+        pp_all = wg.add_task(
+            PpCalculation,
+            name="pp_all",
+            code=pp_code,
+            parent_folder=scf_task.outputs["remote_folder"],
+            parameters=orm.Dict(
+                {
+                    "INPUTPP": {"plot_num": 21},
+                    "PLOT": {"iflag": 3},
+                }
+            ),
+            metadata=metadata_pp,
+        )
+        reference_inputs = {
+            "reference_charge_density_folder": pp_all.outputs["remote_folder"]
+        }
     # -------- bader -----------
-    bader_task = wg.add_task(
-        BaderCalculation,
-        name="bader",
-        code=bader_code,
-        charge_density_folder=pp_valence.outputs["remote_folder"],
-        reference_charge_density_folder=pp_all.outputs["remote_folder"],
-        metadata=metadata_bader,
-    )
+    if grid_factors:
+        bader_tasks = _add_grid_tasks(
+            wg,
+            grid_factors,
+            grid_tolerance,
+            cube_code=cube_code,
+            bader_code=bader_code,
+            charge_density_folder=pp_valence.outputs["remote_folder"],
+            reference_inputs=reference_inputs,
+            structure=structure,
+            metadata_bader=metadata_bader,
+            parameters=parameters,
+        )
+    else:
+        bader_tasks = [
+            wg.add_task(
+                BaderCalculation,
+                name="bader",
+                code=bader_code,
+                charge_density_folder=pp_valence.outputs["remote_folder"],
+                structure=structure,
+                metadata=metadata_bader,
+                **reference_inputs,
+            )
+        ]
+    # -------- cleanup -----------
+    if cleanup != "none":
+        cleanup_task = wg.add_task(
+            clean_remote_folders,
+            name="cleanup",
+            policy=cleanup,
+            scf_folder=scf_task.outputs["remote_folder"],
+            pp_valence_folder=pp_valence.outputs["remote_folder"],
+        )
+        if pp_all is not None:
+            cleanup_task.set({"pp_all_folder": pp_all.outputs["remote_folder"]})
+        cleanup_task.waiting_on.add(bader_tasks)
     return wg
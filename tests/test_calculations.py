@@ -0,0 +1,157 @@
+import pytest
+from aiida import load_profile, orm
+from aiida.common import exceptions
+from aiida.engine import run_get_node
+
+from aiida_bader.calculations import (
+    POINTS_PER_THREAD,
+    get_cmdline_params,
+    get_default_num_threads,
+    get_density_digest,
+    validate_inputs,
+    validate_parameters,
+)
+from aiida_bader.calculations.pp_bader import PpBaderCalculation
+
+load_profile()
+
+
+def test_get_cmdline_params():
+    parameters = {
+        "algorithm": "weight",
+        "refine_edge": "auto",
+        "vacuum": 1e-3,
+        "print": ["sum_atom", ["sel_bader", 1, 2]],
+        "calculate": ["voronoi"],
+        "no_calculate": ["bader"],
+        "termination": "known",
+    }
+    assert validate_parameters(orm.Dict(parameters), None) is None
+    assert get_cmdline_params(parameters) == [
+        "-b",
+        "weight",
+        "-r",
+        "auto",
+        "-vac",
+        "0.001",
+        "-p",
+        "sum_atom",
+        "-p",
+        "sel_bader",
+        "1",
+        "2",
+        "-c",
+        "voronoi",
+        "-n",
+        "bader",
+        "-m",
+        "known",
+    ]
+
+
+def test_validate_parameters():
+    for parameters in (
+        {"algorithm": "fastest"},
+        {"vacuum": "on"},
+        {"print": ["sum_atoms"]},
+        {"print": [["sum_atom", 1]]},
+        {"calculate": ["voronoi", "hirshfeld"]},
+        {"unknown": True},
+    ):
+        assert validate_parameters(orm.Dict(parameters), None) is not None
+
+
+def test_validate_inputs():
+    code = orm.load_code("bader@localhost")
+    folder = orm.RemoteData(remote_path="/tmp", computer=code.computer)
+    inputs = {
+        "code": code,
+        "charge_density_folder": folder,
+        "structure": orm.StructureData(),
+        "reference_code": code,
+        "reference_pseudos": {"O": orm.Data()},
+    }
+    assert validate_inputs(inputs, None) is None
+    assert validate_inputs({**inputs, "reference_pseudos": {}}, None) is None
+    assert (
+        validate_inputs({**inputs, "reference_charge_density_folder": folder}, None)
+        is not None
+    )
+    inputs.pop("reference_code")
+    assert validate_inputs(inputs, None) is not None
+
+
+def test_get_default_num_threads():
+    assert get_default_num_threads(1000) == 1
+    assert get_default_num_threads(3 * POINTS_PER_THREAD) == 3
+    assert get_default_num_threads(3 * POINTS_PER_THREAD + 1) == 4
+    assert get_default_num_threads(400**3, max_threads=8) == 8
+
+
+def test_pp_bader_calculation(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    code = orm.load_code("bader@localhost")
+    # a pp.x code that does not set whether it runs with MPI
+    pp_code = orm.InstalledCode(
+        label="pp-bader-test",
+        computer=code.computer,
+        filepath_executable="/usr/bin/pp.x",
+    ).store()
+    builder = PpBaderCalculation.get_builder()
+    builder.code = pp_code
+    builder.bader_code = code
+    builder.parent_folder = orm.RemoteData(remote_path="/tmp", computer=code.computer)
+    builder.pp_valence_parameters = orm.Dict(
+        {"INPUTPP": {"plot_num": 0}, "PLOT": {"iflag": 3}}
+    )
+    builder.pp_all_parameters = orm.Dict(
+        {"INPUTPP": {"plot_num": 21}, "PLOT": {"iflag": 3}}
+    )
+    builder.parameters = orm.Dict({"algorithm": "weight"})
+    builder.metadata.dry_run = True
+    builder.metadata.store_provenance = False
+    run_get_node(builder)
+
+    folder = tmp_path / "submit_test"
+    script = next(folder.glob("*/_aiidasubmit.sh")).read_text()
+    commands = [line for line in script.splitlines() if "/pp.x'" in line]
+    assert "< 'pp_valence.in' > 'pp_valence.out'" in commands[0]
+    assert "< 'pp_all.in' > 'pp_all.out'" in commands[1]
+    # pp.x runs with MPI, bader does not
+    assert all(command.startswith("'mpirun'") for command in commands)
+    bader = [line for line in script.splitlines() if "-ref" in line]
+    assert bader == [
+        "'/usr/bin/bash' 'charge_density.cube' '-ref' 'reference_charge_density.cube' "
+        "'-b' 'weight'"
+    ]
+    assert "OMP_NUM_THREADS" not in script
+    pp_all = next(folder.glob("*/pp_all.in")).read_text()
+    assert "fileout = 'reference_charge_density.cube'" in pp_all
+    assert "output_format = 6" in pp_all
+
+    # a missing `iflag` is rejected like a wrong one
+    with pytest.raises(ValueError):
+        builder.pp_all_parameters = orm.Dict({"INPUTPP": {"plot_num": 21}})
+    builder.pp_all_parameters = orm.Dict(
+        {"INPUTPP": {"plot_num": 21}, "PLOT": {"iflag": 2}}
+    )
+    with pytest.raises(exceptions.InputValidationError):
+        run_get_node(builder)
+
+
+def test_get_density_digest(tmp_path):
+    from aiida.transports.plugins.local import LocalTransport
+
+    data = bytes(range(256)) * 4096
+    for name, content in (("a", data), ("b", data), ("c", data[:-1] + b"x")):
+        (tmp_path / name).write_bytes(content)
+    with LocalTransport() as transport:
+        for mode in ("sampled", "full"):
+            digests = [
+                get_density_digest(transport, str(tmp_path / name), mode)
+                for name in "abc"
+            ]
+            assert digests[0] == digests[1] != digests[2]
+        assert get_density_digest(transport, str(tmp_path / "a")) == digests[0]
+        with pytest.raises(OSError):
+            get_density_digest(transport, str(tmp_path / "missing"))
@@ -0,0 +1,76 @@
+import numpy as np
+import pytest
+
+from aiida_bader.charge_table import ChargeTable
+
+
+@pytest.fixture
+def table():
+    return ChargeTable(
+        [7.2, 0.4, 0.4, 7.0, 0.3, 10.5],
+        ["O", "H", "H", "O", "H", "Pt"],
+        z_valences={"O": 6.0, "H": 1.0},
+    )
+
+
+def test_query(table):
+    assert table.elements == ["H", "O", "Pt"]
+    assert table.query().tolist() == [0, 1, 2, 3, 4, 5]
+    assert table.query(elements=["O", "Pt"]).tolist() == [0, 3, 5]
+    assert table.query(charge_range=(0.35, 7.1)).tolist() == [1, 2, 3]
+    assert table.query(charge_range=(None, 1.0)).tolist() == [1, 2, 4]
+    # ties are kept in the order of the sites
+    assert table.query(sort_by="bader_charge").tolist() == [4, 1, 2, 3, 0, 5]
+    descending = [5, 0, 3, 1, 2, 4]
+    assert table.query(sort_by="bader_charge", ascending=False).tolist() == descending
+    assert table.query(sort_by="element", ascending=False).tolist() == descending
+    # an unknown difference is last either way
+    assert table.query(sort_by="charge_diff")[-1] == 5
+    assert table.query(sort_by="charge_diff", ascending=False)[-1] == 5
+    with pytest.raises(ValueError):
+        table.query(sort_by="volume")
+
+
+def test_rows(table):
+    rows = table.rows(table.query(elements=["O", "Pt"], sort_by="bader_charge"))
+    assert rows[0] == {
+        "id": 3,
+        "site_index": 3,
+        "element": "O",
+        "bader_charge": 7.0,
+        "charge_diff": -1.0,
+    }
+    assert rows[-1]["charge_diff"] is None
+
+
+def test_page(table):
+    indices = table.query()
+    page, num_pages = table.page(indices, 1, 4)
+    assert page.tolist() == [4, 5]
+    assert num_pages == 2
+    # out of range pages are clipped
+    assert table.page(indices, 5, 4)[0].tolist() == [4, 5]
+    assert table.page(indices[:0], 0, 4)[1] == 1
+
+
+def test_aggregate(table):
+    rows = {row["element"]: row for row in table.aggregate()}
+    assert rows["H"]["count"] == 3
+    assert rows["H"]["total_charge"] == pytest.approx(1.1)
+    assert rows["H"]["min_charge"] == 0.3
+    assert rows["H"]["max_charge"] == 0.4
+    assert rows["O"]["mean_charge_diff"] == pytest.approx(-1.1)
+    assert rows["Pt"]["mean_charge_diff"] is None
+    assert [row["element"] for row in table.aggregate([0, 5])] == ["O", "Pt"]
+
+
+def test_large_table():
+    num_sites = 100_000
+    charges = np.random.default_rng(0).random(num_sites)
+    table = ChargeTable(charges, np.where(np.arange(num_sites) % 2, "H", "O"))
+    indices = table.query(sort_by="bader_charge", ascending=False)
+    page, _ = table.page(indices, 0, 50)
+    assert [row["bader_charge"] for row in table.rows(page)][0] == round(
+        charges.max(), 3
+    )
+    assert sum(row["count"] for row in table.aggregate(indices)) == num_sites
@@ -0,0 +1,46 @@
+import numpy as np
+import pytest
+
+from aiida_bader.core_density import add_core_density, parse_upf_core_density
+
+RADIAL_GRID = np.linspace(0.0, 6.0, 601)
+UPF = f"""\
+<UPF version="2.0.1">
+  <PP_HEADER element="O" z_valence="6.0"/>
+  <PP_MESH mesh="601">
+    <PP_R type="real" size="601">
+      {" ".join(f"{r:.8E}" for r in RADIAL_GRID)}
+    </PP_R>
+  </PP_MESH>
+  <PP_NLCC type="real" size="601">
+      {" ".join(f"{0.5 * np.exp(-r ** 2):.8E}" for r in RADIAL_GRID)}
+  </PP_NLCC>
+  <PP_PAW>
+    <PP_AE_NLCC type="real" size="601">
+      {" ".join(f"{np.exp(-r ** 2):.8E}" for r in RADIAL_GRID)}
+    </PP_AE_NLCC>
+  </PP_PAW>
+</UPF>
+"""
+
+
+def test_parse_upf_core_density():
+    radial_grid, core = parse_upf_core_density(UPF)
+    assert np.allclose(radial_grid, RADIAL_GRID)
+    # the all-electron core density of PAW is preferred
+    assert core[0] == pytest.approx(1.0)
+    assert parse_upf_core_density(UPF.replace("NLCC", "XXXX")) is None
+
+
+def test_add_core_density():
+    shape = (50, 50, 50)
+    voxel = np.eye(3) * 0.2
+    rho = np.zeros(shape)
+    profile = parse_upf_core_density(UPF)
+    # the second atom is close to the cell boundary, its density wraps around
+    positions = np.array([[5.0, 5.0, 5.0], [0.1, 9.9, 5.0]])
+    added = add_core_density(rho, voxel, np.zeros(3), positions, [profile, profile])
+    expected = 2 * np.pi**1.5
+    assert added == pytest.approx(expected, rel=1e-3)
+    assert rho.sum() * 0.2**3 == pytest.approx(expected, rel=1e-3)
+    assert rho[0, 49, 25] == pytest.approx(rho[0, 0, 25])
@@ -0,0 +1,86 @@
+import io
+import re
+
+import numpy as np
+import pytest
+
+from aiida_bader.cube import (
+    convert_cube,
+    load_density_cache,
+    read_cube,
+    read_cube_header,
+)
+from aiida_bader.testing import synthetic_density, write_cube
+
+CELL = np.diag([10.0, 12.0, 14.0])
+POSITIONS = np.array([[2.0, 3.0, 4.0], [6.0, 8.0, 9.0]])
+
+
+@pytest.fixture
+def cube_text():
+    density = synthetic_density((10, 11, 13), POSITIONS, CELL)
+    text = io.StringIO()
+    write_cube(text, density, POSITIONS, [8, 1], CELL)
+    return text.getvalue(), density
+
+
+def test_read_cube_header(cube_text):
+    text, _ = cube_text
+    header = read_cube_header(io.StringIO(text))
+    assert header["shape"] == (10, 11, 13)
+    assert np.allclose(header["voxel"], CELL / np.array([10, 11, 13])[:, None])
+    assert header["numbers"].tolist() == [8, 1]
+    assert np.allclose(header["positions"], POSITIONS)
+
+
+@pytest.mark.parametrize("dtype", [np.float64, np.float32])
+def test_read_cube(cube_text, dtype):
+    text, density = cube_text
+    # a small chunk size checks that numbers split between chunks are read back
+    _, data = read_cube(io.BytesIO(text.encode()), dtype=dtype, chunk_size=100)
+    assert data.dtype == dtype
+    assert np.allclose(data, density, rtol=1e-4, atol=1e-30)
+
+
+def test_read_cube_fortran_exponent(cube_text):
+    text, density = cube_text
+    density = density.copy()
+    density.flat[5] = 1.23456e-100
+    density.flat[-1] = 2.5e101
+    lines = text.splitlines(keepends=True)
+    header = "".join(lines[: 6 + len(POSITIONS)])
+    # Fortran writes the exponents with three digits without the ``E``
+    values = [
+        re.sub(r"E([+-]\d{3})", r"\1", f"{value:13.5E}") for value in density.ravel()
+    ]
+    data = "\n".join(" ".join(values[i : i + 6]) for i in range(0, len(values), 6))
+    assert "1.23456-100" in data
+    _, result = read_cube(io.StringIO(header + data + "\n"), chunk_size=100)
+    assert np.allclose(result, density, rtol=1e-4, atol=1e-30)
+    assert result.flat[5] == pytest.approx(1.23456e-100)
+
+
+def test_read_cube_memmap(cube_text, tmp_path):
+    text, density = cube_text
+    _, data = read_cube(io.StringIO(text), memmap=tmp_path / "density.raw")
+    assert isinstance(data, np.memmap)
+    assert np.allclose(data, density, rtol=1e-4, atol=1e-30)
+
+
+def test_read_cube_truncated(cube_text):
+    text, _ = cube_text
+    with pytest.raises(ValueError):
+        read_cube(io.StringIO(text[:-100]))
+
+
+def test_convert_cube(cube_text, tmp_path):
+    text, density = cube_text
+    source = tmp_path / "aiida.fileout"
+    source.write_text(text)
+    convert_cube(source, tmp_path / "density")
+    header, data = load_density_cache(tmp_path / "density")
+    assert isinstance(data, np.memmap)
+    assert data.dtype == np.float32
+    assert header["shape"] == (10, 11, 13)
+    assert np.allclose(header["positions"], POSITIONS)
+    assert np.allclose(data, density, rtol=1e-4, atol=1e-30)
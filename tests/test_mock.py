@@ -0,0 +1,257 @@
+import io
+import sys
+
+import numpy as np
+import pytest
+from aiida import load_profile, orm
+from aiida.engine import run_get_node
+from ase.build import bulk
+
+from aiida_bader import mock
+from aiida_bader.timing import get_trace
+from aiida_bader.workchains import QeBaderWorkChain
+
+load_profile()
+
+PW_INPUT = """\
+&CONTROL
+  calculation = 'scf'
+  nat = 2
+/
+ATOMIC_SPECIES
+Na     22.98977 Na.upf
+Cl     35.453 Cl.upf
+
+ATOMIC_POSITIONS angstrom
+Na           0.0000000000       0.0000000000       0.0000000000
+Cl           2.8000000000       2.8000000000       2.8000000000
+
+K_POINTS automatic
+2 2 2 0 0 0
+CELL_PARAMETERS angstrom
+      0.0000000000       2.8000000000       2.8000000000
+      2.8000000000       0.0000000000       2.8000000000
+      2.8000000000       2.8000000000       0.0000000000
+"""
+
+
+@pytest.fixture(scope="module")
+def mock_codes(tmp_path_factory):
+    computer = mock.setup_mock_computer(
+        "aiida-bader-mock", tmp_path_factory.mktemp("workdir")
+    )
+    return mock.setup_mock_codes(computer, tmp_path_factory.mktemp("bin"), grid=16)
+
+
+@pytest.fixture(scope="module")
+def mock_family(tmp_path_factory):
+    return mock.create_pseudo_family(
+        "aiida-bader-mock-family", ["Na", "Cl"], tmp_path_factory.mktemp("pseudos")
+    )
+
+
+@pytest.fixture(scope="module")
+def cube_code(mock_codes):
+    from aiida.common.exceptions import NotExistent
+
+    computer = mock_codes["pw"].computer
+    try:
+        return orm.load_code(f"mock-python@{computer.label}")
+    except NotExistent:
+        return orm.InstalledCode(
+            label="mock-python",
+            computer=computer,
+            filepath_executable=sys.executable,
+            default_calc_job_plugin="bader.resample",
+        ).store()
+
+
+def test_write_pw_xml():
+    from aiida_quantumespresso.parsers.parse_xml.parse import parse_xml
+
+    system = mock.read_pw_input(PW_INPUT)
+    assert system["symbols"] == ["Na", "Cl"]
+    assert system["species"][1] == ("Cl", 35.453, "Cl.upf")
+
+    handle = io.StringIO()
+    mock.write_pw_xml(handle, system, (16, 16, 16), 8.0)
+    parsed, logs = parse_xml(io.StringIO(handle.getvalue()))
+    assert not logs.error
+    assert parsed["number_of_atoms"] == 2
+    assert parsed["fft_grid"] == [16, 16, 16]
+    assert parsed["number_of_electrons"] == 8.0
+
+
+def _get_builder(mock_codes, mock_family):
+    structure = orm.StructureData(ase=bulk("NaCl", "rocksalt", a=5.6))
+    # the pp.x parameters as given by the QE app
+    overrides = {
+        "scf": {"pseudo_family": mock_family.label},
+        "pp_valence": {
+            "parameters": {"INPUTPP": {"plot_num": 0}, "PLOT": {"iflag": 3}}
+        },
+        "pp_all": {"parameters": {"INPUTPP": {"plot_num": 21}, "PLOT": {"iflag": 3}}},
+    }
+    return QeBaderWorkChain.get_builder_from_protocol(
+        mock_codes["pw"],
+        mock_codes["pp"],
+        mock_codes["bader"],
+        structure,
+        overrides=overrides,
+    )
+
+
+def test_qe_bader_workchain(mock_codes, mock_family):
+    builder = _get_builder(mock_codes, mock_family)
+
+    results, node = run_get_node(builder)
+    assert node.is_finished_ok, node.exit_message
+    charges = results["bader"]["bader_charge"].get_array("charge")
+    assert len(charges) == 2
+    # the reference is the all-electron density, the charges sum to the valence
+    assert np.sum(charges) == pytest.approx(8.0, abs=0.1)
+
+    # the estimated resources only fill the options that the protocol left unset
+    (bader_calc,) = [
+        child
+        for child in node.called_descendants
+        if child.process_label == "BaderCalculation"
+    ]
+    assert bader_calc.get_option("max_wallclock_seconds") == 43200
+    assert bader_calc.get_option("max_memory_kb") > 0
+
+    timing = node.base.extras.get("timing")
+    stages = {stage["process_label"]: stage for stage in timing["stages"]}
+    assert set(stages) >= {"PwCalculation", "PpCalculation", "BaderCalculation"}
+    bader = stages["BaderCalculation"]
+    assert bader["job"]["seconds"] > 0
+    assert bader["cubes"]["charge_density.cube"]["transfer"] == "symlink"
+    assert bader["cubes"]["charge_density.cube"]["size"] > 0
+    trace = get_trace(timing)
+    assert {event["name"] for event in trace["traceEvents"]} >= {"job", "parse"}
+
+
+def test_qe_bader_workchain_grid_convergence(mock_codes, mock_family, cube_code):
+    builder = _get_builder(mock_codes, mock_family)
+    builder.cube_code = cube_code
+    builder.grid_factors = orm.List([0.5, 0.75, 1.0])
+    builder.grid_tolerance = orm.Float(0.05)
+    builder.cache_densities = orm.Bool(True)
+
+    results, node = run_get_node(builder)
+    assert node.is_finished_ok, node.exit_message
+    assert set(results["density_cache"]) == {"pp_valence", "pp_all"}
+    summary = results["grid_convergence"].get_dict()
+    assert [grid["shape"] for grid in summary["grids"]] == [
+        [8, 8, 8],
+        [12, 12, 12],
+        [16, 16, 16],
+    ]
+    assert summary["recommended_shape"] in [grid["shape"] for grid in summary["grids"]]
+    assert "recommended_ecutrho" in summary
+    # the bader outputs are those of the finest grid
+    charges = results["bader"]["bader_charge"].get_array("charge")
+    assert charges.tolist() == summary["grids"][-1]["charges"]
+    assert np.sum(charges) == pytest.approx(8.0, abs=0.1)
+
+
+def test_qe_bader_workchain_core_reference(mock_codes, mock_family, cube_code):
+    builder = _get_builder(mock_codes, mock_family)
+    builder.reference_density = orm.Str("core")
+    builder.cube_code = cube_code
+
+    results, node = run_get_node(builder)
+    assert node.is_finished_ok, node.exit_message
+    called = [child.process_label for child in node.called]
+    assert called.count("PpCalculation") == 1
+    # the densities are only cached on request
+    assert "CubeConversionCalculation" not in called
+    charges = results["bader"]["bader_charge"].get_array("charge")
+    assert np.sum(charges) == pytest.approx(8.0, abs=0.1)
+
+    # the reference is built in the bader job
+    timing = node.base.extras.get("timing")
+    stages = {stage["process_label"]: stage for stage in timing["stages"]}
+    cubes = stages["BaderCalculation"]["cubes"]
+    assert cubes["reference_charge_density.cube"]["transfer"] == "core_density"
+    assert cubes["reference_charge_density.cube"]["size"] > 0
+
+
+def test_qe_bader_workchain_cleanup(mock_codes, mock_family, cube_code):
+    builder = _get_builder(mock_codes, mock_family)
+    builder.cube_code = cube_code
+    builder.cache_densities = orm.Bool(True)
+    builder.cleanup = orm.Str("on_success")
+
+    results, node = run_get_node(builder)
+    assert node.is_finished_ok, node.exit_message
+    cleaned = {"PwCalculation", "PpCalculation"}
+    for calculation in node.called_descendants:
+        if isinstance(calculation, orm.CalcJobNode):
+            remote_folder = calculation.outputs.remote_folder
+            assert remote_folder.is_empty == (calculation.process_label in cleaned)
+    # the cached densities are outputs, and kept
+    for remote_folder in results["density_cache"].values():
+        assert not remote_folder.is_empty
+
+
+def test_qe_bader_workchain_missing_pp_output(mock_codes, mock_family):
+    from aiida.manage import get_manager
+
+    runner = get_manager().create_runner(communicator=None)
+    process = runner.instantiate_process(_get_builder(mock_codes, mock_family))
+    # a pp.x calculation without the remote folder
+    process.ctx.pp_valence_calc = orm.CalcJobNode().store()
+    process.ctx.bader_resources = {}
+
+    exit_code = process.run_bader()
+    assert exit_code.status == process.exit_codes.ERROR_PARSING_PP_VALENCE_OUTPUT.status
+    runner.close()
+
+
+def test_bader_calculation_density_cache(mock_codes, tmp_path):
+    from aiida.manage.caching import enable_caching
+
+    from aiida_bader.calculations import BaderCalculation
+    from aiida_bader.testing import synthetic_density, write_cube
+
+    cell = np.diag([6.0, 6.0, 6.0])
+    positions = np.array([[1.5, 3.0, 3.0], [4.5, 3.0, 3.0]])
+    # a width of its own, so that the densities are not in the cache of earlier runs
+    width = np.random.default_rng().uniform(0.9, 1.1)
+    folders = []
+    for name, width in (("first", width), ("second", width), ("other", width * 0.9)):
+        (tmp_path / name).mkdir()
+        with open(tmp_path / name / "aiida.fileout", "w") as handle:
+            density = synthetic_density((16, 16, 16), positions, cell, width=width)
+            write_cube(handle, density, positions, [1, 1], cell)
+        folders.append(
+            orm.RemoteData(
+                remote_path=str(tmp_path / name),
+                computer=mock_codes["bader"].computer,
+            )
+        )
+
+    nodes = []
+    with enable_caching(identifier=BaderCalculation.build_process_type()):
+        for folder in folders:
+            builder = BaderCalculation.get_builder()
+            builder.code = mock_codes["bader"]
+            builder.charge_density_folder = folder
+            builder.metadata.options.resources = {"num_machines": 1}
+            _, node = run_get_node(builder)
+            assert node.is_finished_ok, node.exit_message
+            nodes.append(node)
+
+    first, second, other = nodes
+    # the densities are compared by content, not by remote folder
+    assert first.base.extras.get("density_digests") == second.base.extras.get(
+        "density_digests"
+    )
+    assert not first.base.caching.is_created_from_cache
+    assert second.base.caching.get_cache_source() == first.uuid
+    assert np.allclose(
+        second.outputs.bader_charge.get_array("charge"),
+        first.outputs.bader_charge.get_array("charge"),
+    )
+    assert not other.base.caching.is_created_from_cache
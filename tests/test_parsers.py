@@ -0,0 +1,136 @@
+import io
+
+import numpy as np
+import pytest
+from aiida.common import OutputParsingError
+
+from aiida_bader.parsers import (
+    get_charge_summary,
+    parse_acf,
+    parse_avf,
+    parse_bcf,
+    parse_timing,
+)
+from aiida_bader.testing import write_acf
+
+
+def _acf_handle(num_atoms, **kwargs):
+    text = io.StringIO()
+    charges = write_acf(text, num_atoms, **kwargs)
+    return io.BytesIO(text.getvalue().encode()), charges
+
+
+def test_parse_acf():
+    handle, charges = _acf_handle(10, vacuum_charge=0.5, vacuum_volume=3.0)
+    columns, footer = parse_acf(handle)
+    assert np.allclose(columns["charge"], charges)
+    assert columns["coordinates"].shape == (10, 3)
+    assert columns["min_dist"].shape == (10,)
+    assert columns["atomic_volume"].shape == (10,)
+    assert footer["vacuum_charge"] == pytest.approx(0.5)
+    assert footer["vacuum_volume"] == pytest.approx(3.0)
+    assert footer["number_of_electrons"] == pytest.approx(charges.sum() + 0.5, abs=1e-3)
+    assert not handle.closed
+
+
+def test_parse_acf_truncated():
+    handle, _ = _acf_handle(10)
+    truncated = io.BytesIO(handle.getvalue()[:-200])
+    with pytest.raises(OutputParsingError):
+        parse_acf(truncated)
+
+
+def test_get_charge_summary():
+    summary = get_charge_summary(np.array([6.5, 0.75, 0.75]), ["O", "H", "H"])
+    assert summary["num_atoms"] == 3
+    assert summary["total_charge"] == pytest.approx(8.0)
+    assert summary["min_charge"] == pytest.approx(0.75)
+    assert summary["max_charge"] == pytest.approx(6.5)
+    assert summary["mean_charge"] == pytest.approx(8.0 / 3)
+    assert summary["charge_per_element"] == {"H": 1.5, "O": 6.5}
+
+
+BCF = b"""\
+    #         X           Y           Z        CHARGE     ATOM    DISTANCE
+ ---------------------------------------------------------------------------
+    1    0.0000    0.0000    0.2000    6.5000       1    0.2000
+    2    1.0000    1.0000    1.0000    0.7500       2    0.0100
+    3    1.5000    1.0000    1.0000    0.7500       2    0.5100
+ ---------------------------------------------------------------------------
+"""
+
+AVF = b"""\
+   Atom                     Volume(s)
+ ---------------------------------------------------------------------------
+     1      1
+     2      2    3
+ ---------------------------------------------------------------------------
+"""
+
+
+def test_parse_bcf():
+    basins = parse_bcf(io.BytesIO(BCF))
+    assert basins["basin_coordinates"].shape == (3, 3)
+    assert basins["basin_charge"].dtype == np.float32
+    assert basins["basin_atom"].dtype == np.int32
+    assert basins["basin_atom"].tolist() == [1, 2, 2]
+    assert np.allclose(basins["basin_charge"], [6.5, 0.75, 0.75])
+
+
+def test_parse_avf():
+    volumes = parse_avf(io.BytesIO(AVF))
+    assert volumes["atom_basins"].tolist() == [1, 2, 3]
+    assert volumes["atom_basin_offsets"].tolist() == [0, 1, 3]
+
+
+def test_parse_timing():
+    timing = parse_timing(
+        io.StringIO(
+            "start 1700000000.250000000\n"
+            "cube charge_density.cube symlink 1024\n"
+            "cube reference_charge_density.cube copy \n"
+            "end 1700000060.N\n"
+        )
+    )
+    assert timing["job"]["start"] == "2023-11-14T22:13:20.250000+00:00"
+    assert timing["job"]["seconds"] == pytest.approx(59.75)
+    assert timing["cubes"] == {
+        "charge_density.cube": {"transfer": "symlink", "size": 1024},
+        "reference_charge_density.cube": {"transfer": "copy", "size": None},
+    }
+    # the job was killed before it ended
+    assert "job" not in parse_timing(io.StringIO("start 1700000000.0\n"))
+
+
+@pytest.mark.parametrize(
+    ("files", "exit_status"),
+    [
+        ({"_scheduler-stdout.txt": "  charge_density.cube does not exist\n"}, 310),
+        ({"_scheduler-stderr.txt": "Fortran runtime error: End of file\n"}, 311),
+        ({"ACF.dat": "    #  X\n ----\n    1  0.0\n"}, 320),
+        ({}, 101),
+    ],
+)
+def test_bader_parser_failures(files, exit_status):
+    from aiida import load_profile, orm
+    from aiida.common.links import LinkType
+
+    from aiida_bader.parsers import BaderParser
+
+    load_profile()
+    node = orm.CalcJobNode(
+        computer=orm.load_computer("localhost"),
+        process_type="aiida.calculations:bader.bader",
+    )
+    node.set_option("scheduler_stdout", "_scheduler-stdout.txt")
+    node.set_option("scheduler_stderr", "_scheduler-stderr.txt")
+    node.store()
+    retrieved = orm.FolderData()
+    for filename, content in files.items():
+        retrieved.base.repository.put_object_from_bytes(content.encode(), filename)
+    retrieved.base.links.add_incoming(node, LinkType.CREATE, "retrieved")
+    retrieved.store()
+
+    _, calcfunction = BaderParser.parse_from_node(node, store_provenance=False)
+    assert calcfunction.exit_status == exit_status
+    assert node.base.extras.get("timing")["parse_seconds"] >= 0
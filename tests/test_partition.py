@@ -0,0 +1,85 @@
+import io
+
+import numpy as np
+import pytest
+from aiida import orm
+
+from aiida_bader.calculations.functions import bader_charge_from_cube
+from aiida_bader.partition import bader_partition, compress_paths
+from aiida_bader.testing import synthetic_density, write_cube
+
+CELL = np.diag([10.0, 12.0, 14.0])
+POSITIONS = np.array([[2.0, 3.0, 4.0], [6.0, 8.0, 9.0], [8.5, 2.0, 12.0]])
+WIDTH = 0.9
+
+
+def _density(shape=(40, 44, 48)):
+    return synthetic_density(shape, POSITIONS, CELL, width=WIDTH)
+
+
+def test_compress_paths():
+    steps = np.array([1, 2, 2, 3, 3, 4])
+    assert compress_paths(steps).tolist() == [2, 2, 2, 3, 3, 3]
+
+
+@pytest.mark.parametrize("algorithm", ["ongrid", "neargrid"])
+def test_bader_partition(algorithm):
+    rho = _density()
+    voxel = CELL / np.array(rho.shape)[:, None]
+    columns, footer = bader_partition(rho, voxel, POSITIONS, algorithm=algorithm)
+    # each atom carries the integral of one Gaussian
+    expected = (2 * np.pi) ** 1.5 * WIDTH**3
+    assert np.allclose(columns["charge"], expected, rtol=1e-3)
+    assert footer["number_of_electrons"] == pytest.approx(columns["charge"].sum())
+    assert columns["atomic_volume"].sum() == pytest.approx(np.linalg.det(CELL))
+    assert footer["vacuum_charge"] == 0.0
+
+
+def test_bader_partition_oblique_boundary():
+    """Two equal Gaussians split by a plane that is oblique to the grid."""
+    cell = np.diag([10.0, 10.0, 10.0])
+    center = np.array([5.03, 4.91, 5.07])
+    bond = np.array([1.0, 0.6, 0.25])
+    bond *= 1.1 / np.linalg.norm(bond)
+    positions = np.array([center - bond, center + bond])
+    shape = (64, 64, 64)
+    rho = synthetic_density(shape, positions, cell, width=0.8)
+    voxel = cell / np.array(shape)[:, None]
+
+    # the zero-flux surface is the bisecting plane, each point goes to the nearest atom
+    points = np.indices(shape).reshape(3, -1).T @ voxel
+    distances = []
+    for position in positions:
+        delta = points - position
+        delta -= np.round(delta / 10.0) * 10.0
+        distances.append(np.linalg.norm(delta, axis=1))
+    first = distances[0] < distances[1]
+    volume = np.linalg.det(voxel)
+    exact = np.array([rho.ravel()[first].sum(), rho.ravel()[~first].sum()]) * volume
+
+    ongrid, _ = bader_partition(rho, voxel, positions, algorithm="ongrid")
+    neargrid, _ = bader_partition(rho, voxel, positions, algorithm="neargrid")
+    # the on-grid steps are biased towards the grid directions
+    assert np.abs(ongrid["charge"] - exact).max() > 0.03
+    assert np.allclose(neargrid["charge"], exact, atol=0.01)
+
+
+def test_bader_partition_vacuum():
+    rho = _density()
+    voxel = CELL / np.array(rho.shape)[:, None]
+    columns, footer = bader_partition(rho, voxel, POSITIONS, vacuum="auto")
+    assert footer["vacuum_volume"] > 0
+    assert columns["charge"].sum() + footer["vacuum_charge"] == pytest.approx(
+        footer["number_of_electrons"]
+    )
+
+
+def test_bader_charge_from_cube():
+    rho = _density((20, 22, 24))
+    text = io.StringIO()
+    write_cube(text, rho, POSITIONS, [8, 1, 1], CELL)
+    cube = orm.SinglefileData(io.BytesIO(text.getvalue().encode()), filename="rho.cube")
+    results = bader_charge_from_cube(cube, parameters=orm.Dict({"algorithm": "ongrid"}))
+    charge = results["bader_charge"].get_array("charge")
+    assert charge.shape == (3,)
+    assert results["bader_charge"].base.attributes.get("num_atoms") == 3
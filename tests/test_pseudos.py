@@ -0,0 +1,67 @@
+import threading
+import uuid
+
+import pytest
+from aiida import load_profile, orm
+from aiida.tools import delete_nodes
+from aiida.tools.archive import create_archive
+
+from aiida_bader.pseudos import (
+    ARCHIVE_DIR_ENV,
+    BASE_URL,
+    PseudoInstaller,
+    get_archive_source,
+)
+from aiida_bader.utils import install_pseudos, pseudo_group_exists
+
+load_profile()
+
+
+@pytest.fixture
+def archive_dir(tmp_path):
+    """A local archive directory with the archive of a group, which is not stored."""
+    label = f"test_pseudos_{uuid.uuid4().hex}"
+    node = orm.Data()
+    node.label = "O"
+    node.store()
+    group = orm.Group(label=label).store()
+    group.add_nodes(node)
+    create_archive([group], filename=tmp_path / f"{label}.aiida")
+    orm.Group.collection.delete(group.pk)
+    delete_nodes([node.pk], dry_run=False)
+    return tmp_path, label
+
+
+def test_get_archive_source(archive_dir, monkeypatch):
+    directory, label = archive_dir
+    assert get_archive_source(label, directory) == directory / f"{label}.aiida"
+    assert get_archive_source("other", directory) == BASE_URL + "other.aiida"
+    monkeypatch.setenv(ARCHIVE_DIR_ENV, str(directory))
+    assert get_archive_source(label) == directory / f"{label}.aiida"
+
+
+def test_install(archive_dir):
+    directory, label = archive_dir
+    installer = PseudoInstaller(directory)
+    # hold the worker, so that the requests are queued
+    event = threading.Event()
+    installer._executor.submit(event.wait)
+    statuses = []
+    job = installer.install(label, callback=lambda job: statuses.append(job.status))
+    assert installer.install(label) is job
+    event.set()
+    job.wait()
+    assert statuses == ["queued", "importing", "finished"]
+    assert pseudo_group_exists(label)
+    assert orm.load_group(label).nodes[0].label == "O"
+    # a new request would run a new job
+    assert label not in installer._jobs
+
+
+def test_install_pseudos(archive_dir):
+    directory, label = archive_dir
+    install_pseudos(label, archive_dir=directory)
+    assert pseudo_group_exists(label)
+    # the group exists already
+    install_pseudos([label], archive_dir=directory)
+    assert len(orm.load_group(label).nodes) == 1
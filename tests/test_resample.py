@@ -0,0 +1,115 @@
+import json
+import os
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+
+from aiida_bader import resample
+from aiida_bader.cube import read_cube
+from aiida_bader.resample import (
+    get_grid_shape,
+    good_fft_order,
+    interpolate_density,
+    resample_density,
+)
+from aiida_bader.testing import synthetic_density, write_cube
+
+CELL = np.diag([10.0, 12.0, 14.0])
+POSITIONS = np.array([[2.0, 3.0, 4.0], [6.0, 8.0, 9.0]])
+
+
+def test_get_grid_shape():
+    assert good_fft_order(7) == 8
+    assert good_fft_order(11) == 12
+    assert good_fft_order(45) == 45
+    assert get_grid_shape((45, 45, 60), 1.0) == (45, 45, 60)
+    assert get_grid_shape((45, 45, 60), 0.5) == (24, 24, 30)
+    assert get_grid_shape((45, 45, 60), 1.5) == (72, 72, 90)
+
+
+@pytest.mark.parametrize("shape", [(8, 9, 6), (13, 16, 11), (24, 22, 26)])
+def test_resample_density(shape):
+    rho = np.random.default_rng(0).random((12, 15, 10))
+    resampled = resample_density(rho, shape)
+    assert resampled.shape == shape
+    # the same number of electrons on both grids
+    assert resampled.mean() == pytest.approx(rho.mean())
+    if all(new >= old for new, old in zip(shape, rho.shape)):
+        # no information is lost on a finer grid
+        assert np.allclose(resample_density(resampled, rho.shape), rho)
+
+
+def test_resample_density_band_limited():
+    """A density without frequencies beyond those of the coarse grid is exact on it."""
+    fine, coarse = [np.indices((n, n, n)) * 2 * np.pi / n for n in (16, 6)]
+
+    def density(grid):
+        return 1 + np.cos(grid[0]) * np.sin(2 * grid[1]) + np.cos(3 * grid[2])
+
+    assert np.allclose(resample_density(density(fine), (6, 6, 6)), density(coarse))
+
+
+def test_interpolate_density():
+    rho = np.random.default_rng(0).random((6, 8, 10))
+    fine = interpolate_density(rho, (12, 16, 20))
+    assert np.allclose(fine[::2, ::2, ::2], rho)
+    # the midpoints, periodic across the cell boundary
+    assert np.allclose(fine[1::2, ::2, ::2], (rho + np.roll(rho, -1, axis=0)) / 2)
+    assert np.allclose(interpolate_density(rho, (3, 4, 5)), rho[::2, ::2, ::2])
+    assert interpolate_density(rho, rho.shape) is rho
+
+
+def test_interpolate_density_cusp():
+    """A sharp density rings with Fourier interpolation, but not in real space."""
+    rho = synthetic_density((30, 30, 30), POSITIONS, CELL, width=0.2)
+    assert resample_density(rho, (16, 16, 16)).min() < 0
+    interpolated = interpolate_density(rho, (16, 16, 16))
+    assert interpolated.min() >= 0
+    assert interpolated.max() <= rho.max()
+
+
+def test_resample_cubes(tmp_path):
+    density = synthetic_density((10, 12, 14), POSITIONS, CELL)
+    with open(tmp_path / "charge_density.cube", "w") as handle:
+        write_cube(handle, density, POSITIONS, [8, 1], CELL)
+    reference = synthetic_density((10, 12, 14), POSITIONS, CELL, width=0.2)
+    with open(tmp_path / "reference_charge_density.cube", "w") as handle:
+        write_cube(handle, reference, POSITIONS, [8, 1], CELL)
+
+    subprocess.run(
+        [
+            sys.executable,
+            resample.__file__,
+            "charge_density.cube",
+            "--references",
+            "reference_charge_density.cube",
+            "--factors",
+            "0.5",
+            "1",
+            "--summary",
+            "summary.json",
+        ],
+        cwd=tmp_path,
+        check=True,
+    )
+    with open(tmp_path / "summary.json") as handle:
+        summary = json.load(handle)
+    assert summary["shape"] == [10, 12, 14]
+    assert [grid["shape"] for grid in summary["grids"]] == [[5, 6, 8], [10, 12, 14]]
+    electrons = [grid["electrons"]["charge_density.cube"] for grid in summary["grids"]]
+    assert electrons[0] == pytest.approx(electrons[1])
+
+    with open(tmp_path / "grid_0" / "charge_density.cube", "rb") as handle:
+        header, data = read_cube(handle)
+    assert data.shape == (5, 6, 8)
+    assert np.allclose(header["voxel"], CELL / np.array([5, 6, 8])[:, None])
+    assert np.allclose(header["positions"], POSITIONS)
+    # the same grid is linked to the source
+    assert os.path.islink(tmp_path / "grid_1" / "charge_density.cube")
+
+    with open(tmp_path / "grid_0" / "reference_charge_density.cube", "rb") as handle:
+        _, data = read_cube(handle)
+    assert np.allclose(data, interpolate_density(reference, (5, 6, 8)), atol=1e-4)
+    assert os.path.islink(tmp_path / "grid_1" / "reference_charge_density.cube")
@@ -0,0 +1,45 @@
+import io
+
+import numpy as np
+import pytest
+from aiida import load_profile, orm
+
+from aiida_bader.resources import (
+    MEMORY_OVERHEAD_KB,
+    MIN_WALLTIME,
+    estimate_bader_resources,
+    read_remote_cube_header,
+)
+from aiida_bader.testing import write_cube
+
+load_profile()
+
+
+def test_read_remote_cube_header(tmp_path):
+    handle = io.StringIO()
+    cell = np.eye(3) * 6.0
+    write_cube(handle, np.zeros((4, 5, 6)), [[0, 0, 0], [3, 3, 3]], [8, 1], cell)
+    (tmp_path / "aiida.fileout").write_text(handle.getvalue())
+    remote_folder = orm.RemoteData(
+        computer=orm.load_computer("localhost"), remote_path=str(tmp_path)
+    )
+
+    header = read_remote_cube_header(remote_folder, "aiida.fileout")
+    assert header == {"shape": (4, 5, 6), "num_atoms": 2}
+    with pytest.raises(OSError):
+        read_remote_cube_header(remote_folder, "missing.cube")
+
+
+def test_estimate_bader_resources():
+    small = estimate_bader_resources((10, 10, 10), 2)
+    assert small["max_wallclock_seconds"] == MIN_WALLTIME
+    assert small["max_memory_kb"] > MEMORY_OVERHEAD_KB
+    assert small["num_threads"] == 1
+
+    large = estimate_bader_resources((800, 800, 800), 200, max_threads=8)
+    assert large["max_wallclock_seconds"] > MIN_WALLTIME
+    assert large["max_wallclock_seconds"] % 60 == 0
+    assert large["num_threads"] == 8
+    weight = estimate_bader_resources((800, 800, 800), 200, algorithm="weight")
+    assert weight["max_memory_kb"] > large["max_memory_kb"]
+    assert weight["max_wallclock_seconds"] > large["max_wallclock_seconds"]
@@ -0,0 +1,84 @@
+import datetime
+import io
+import uuid
+
+import pytest
+from aiida import load_profile, orm
+from aiida.common.links import LinkType
+from aiida.engine import ProcessState
+from aiida.schedulers.datastructures import JobInfo
+
+from aiida_bader.stats import get_stats, write_stats_csv
+
+load_profile()
+
+
+def _process(cls, process_label, exit_status=0, caller=None, link_label=None):
+    node = (
+        cls(computer=orm.load_computer("localhost"))
+        if cls is orm.CalcJobNode
+        else cls()
+    )
+    node.set_process_label(process_label)
+    node.set_process_state(ProcessState.FINISHED)
+    node.set_exit_status(exit_status)
+    if caller is not None:
+        link_type = LinkType.CALL_CALC if cls is orm.CalcJobNode else LinkType.CALL_WORK
+        node.base.links.add_incoming(caller, link_type, link_label)
+    return node
+
+
+def _qe_bader_workchain(exit_status=0):
+    """Store a work chain whose first pw.x run failed, with a queue time of 60 s."""
+    root = _process(orm.WorkflowNode, "QeBaderWorkChain", exit_status).store()
+    base = _process(orm.WorkflowNode, "PwBaseWorkChain", 0, root, "call_pw_scf")
+    base.store()
+    _process(orm.CalcJobNode, "PwCalculation", 305, base, "iteration_01").store()
+    calculation = _process(orm.CalcJobNode, "PwCalculation", 0, base, "iteration_02")
+    submission = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+    job_info = JobInfo()
+    job_info.submission_time = submission
+    job_info.dispatch_time = submission + datetime.timedelta(seconds=60)
+    calculation.set_last_job_info(job_info)
+    calculation.store()
+    for label in ("call_pp_valence_calc", "call_pp_all_calc"):
+        _process(orm.CalcJobNode, "PpCalculation", 0, root, label).store()
+    _process(
+        orm.CalcJobNode,
+        "BaderCalculation",
+        exit_status and 320,
+        root,
+        "call_bader_calc",
+    ).store()
+    return root
+
+
+def test_get_stats():
+    group = orm.Group(label=f"test_stats_{uuid.uuid4().hex}").store()
+    group.add_nodes([_qe_bader_workchain(), _qe_bader_workchain(906)])
+
+    stats = get_stats(group=group.label)
+    assert stats["workflows"] == 2
+    assert stats["exit_status"] == {"0": 1, "906": 1}
+    assert stats["wall_time"]["total"]["count"] == 1
+    assert set(stats["wall_time"]) == {"total", "pw", "pp_valence", "pp_all", "bader"}
+    assert stats["wall_time"]["pp_valence"]["count"] == 2
+    assert stats["wall_time"]["bader"]["count"] == 1
+    assert stats["queue_time"]["pw"]["count"] == 2
+    assert stats["queue_time"]["pw"]["p50"] == pytest.approx(60.0)
+    assert stats["failures"][0] == {
+        "stage": "pw",
+        "process_label": "PwCalculation",
+        "exit_status": "305",
+        "count": 2,
+    }
+    assert stats["failures"][1]["exit_status"] == "320"
+    assert stats["throughput"][0]["terminated"] == 2
+    assert stats["throughput"][0]["ok"] == 1
+
+    handle = io.StringIO()
+    write_stats_csv(stats, handle)
+    assert "queue_time,pw,p50,60.0" in handle.getvalue().splitlines()
+
+    since = datetime.datetime(2999, 1, 1, tzinfo=datetime.timezone.utc)
+    assert get_stats(group=group.label, since=since)["workflows"] == 0
@@ -0,0 +1,400 @@
+import numpy as np
+import pytest
+from aiida import load_profile, orm
+from aiida.common.links import LinkType
+from aiida.engine import ToContext, WorkChain, run_get_node, while_
+from aiida.manage import get_manager
+
+from aiida_bader.calculations import BaderCalculation
+from aiida_bader.calculations.functions import (
+    collect_bader_charges,
+    select_converged_grid,
+)
+from aiida_bader.parsers import get_bader_charge_array
+from aiida_bader.utils import clean_remote_folders, find_scf_remote_folder
+from aiida_bader.workchains.bader_base import BaderBaseWorkChain
+from aiida_bader.workchains.batch import QeBaderBatchWorkChain, validate_inputs
+from aiida_bader.workchains.qe_bader import validate_inputs as validate_qe_inputs
+
+load_profile()
+
+
+def _bader_charge(charges):
+    columns = {
+        "coordinates": np.zeros((len(charges), 3)),
+        "charge": np.array(charges),
+        "min_dist": np.ones(len(charges)),
+        "atomic_volume": np.ones(len(charges)),
+    }
+    footer = {"vacuum_charge": 0.0, "vacuum_volume": 0.0, "number_of_electrons": 8.0}
+    return get_bader_charge_array(columns, footer)
+
+
+def test_collect_bader_charges():
+    summary = collect_bader_charges(
+        water=_bader_charge([6.5, 0.75, 0.75]), hydrogen=_bader_charge([1.0, 1.0])
+    )
+    assert summary["water"]["charges"] == [6.5, 0.75, 0.75]
+    assert summary["water"]["total_charge"] == pytest.approx(8.0)
+    assert summary["hydrogen"]["total_charge"] == pytest.approx(2.0)
+
+
+def test_select_converged_grid():
+    grids = orm.Dict(
+        {
+            "shape": [40, 40, 40],
+            "grids": [
+                {"factor": 1.0, "shape": [40, 40, 40]},
+                {"factor": 0.5, "shape": [20, 20, 20]},
+                {"factor": 0.75, "shape": [30, 30, 30]},
+            ],
+        }
+    )
+    charges = {
+        "grid_0": _bader_charge([7.0, 1.0]),
+        "grid_1": _bader_charge([7.2, 0.8]),
+        "grid_2": _bader_charge([7.005, 0.995]),
+    }
+    summary = select_converged_grid(
+        grids=grids, tolerance=orm.Float(0.01), ecutrho=orm.Float(240.0), **charges
+    )
+    assert [grid["factor"] for grid in summary["grids"]] == [0.5, 0.75, 1.0]
+    assert summary["grids"][0]["max_difference"] == pytest.approx(0.195)
+    assert summary["grids"][2]["max_difference"] is None
+    assert summary["converged"]
+    assert summary["recommended_grid"] == 2
+    assert summary["recommended_shape"] == [30, 30, 30]
+    assert summary["recommended_ecutrho"] == pytest.approx(135.0)
+
+    summary = select_converged_grid(grids=grids, tolerance=orm.Float(0.001), **charges)
+    assert not summary["converged"]
+    assert summary["recommended_factor"] == 1.0
+    assert "recommended_ecutrho" not in summary
+
+
+def test_validate_batch_inputs():
+    assert validate_inputs({"max_concurrent": orm.Int(4)}, None) is not None
+    structures = {"water": orm.StructureData()}
+    assert validate_inputs(
+        {"structures": structures, "max_concurrent": orm.Int(0)}, None
+    )
+    assert (
+        validate_inputs({"structures": structures, "max_concurrent": orm.Int(4)}, None)
+        is None
+    )
+
+
+def test_validate_qe_bader_inputs(tmp_path):
+    inputs = {
+        "parent_folder": orm.RemoteData(),
+        "reference_density": orm.Str("core"),
+        "cube_code": orm.load_code("bader@localhost"),
+    }
+    assert validate_qe_inputs(inputs, None) is None
+    # the reference is built in the prepend text of the bader job
+    (tmp_path / "python").write_text("#!/bin/sh\n")
+    inputs["cube_code"] = orm.PortableCode(
+        label="python", filepath_executable="python", filepath_files=tmp_path
+    )
+    assert "InstalledCode" in validate_qe_inputs(inputs, None)
+
+
+def test_bader_base_out_of_memory():
+    code = orm.load_code("bader@localhost")
+    builder = BaderBaseWorkChain.get_builder()
+    builder.bader.code = code
+    builder.bader.charge_density_folder = orm.RemoteData(
+        remote_path="/tmp", computer=code.computer
+    )
+    builder.bader.parameters = orm.Dict({"algorithm": "weight"})
+    builder.bader.metadata.options.max_memory_kb = 1000
+    runner = get_manager().create_runner(communicator=None)
+    process = runner.instantiate_process(builder)
+    process.setup()
+    calculation = orm.CalcJobNode()
+    calculation.set_exit_status(
+        BaderCalculation.exit_codes.ERROR_SCHEDULER_OUT_OF_MEMORY.status
+    )
+    calculation.store()
+
+    states = []
+    for _ in range(3):
+        report = process.handle_out_of_memory(calculation)
+        assert report.exit_code.status == 0
+        inputs = process.ctx.inputs
+        states.append(
+            (
+                inputs.metadata.options["max_memory_kb"],
+                inputs.parameters.get_dict()["algorithm"],
+            )
+        )
+    # one more memory, then the fallback, then more memory for ``neargrid``
+    assert states == [(2000, "weight"), (2000, "neargrid"), (4000, "neargrid")]
+    runner.close()
+
+
+# the start and the end of the members of the ``BatchWorkChain``, in order
+EVENTS = []
+
+
+class NoopWorkChain(WorkChain):
+    """A work chain that does nothing."""
+
+    @classmethod
+    def define(cls, spec):
+        super().define(spec)
+        spec.outline(cls.noop)
+
+    def noop(self):
+        pass
+
+
+class MemberWorkChain(WorkChain):
+    """A member that waits ``waits`` times for a ``NoopWorkChain``."""
+
+    @classmethod
+    def define(cls, spec):
+        super().define(spec)
+        spec.input("label", valid_type=orm.Str)
+        spec.input("waits", valid_type=orm.Int)
+        spec.input("bader_charge", valid_type=orm.ArrayData)
+        spec.outline(cls.start, while_(cls.should_wait)(cls.wait), cls.results)
+        spec.output("bader.bader_charge", valid_type=orm.ArrayData)
+
+    def start(self):
+        EVENTS.append(("start", self.inputs.label.value))
+        self.ctx.waits = self.inputs.waits.value
+
+    def should_wait(self):
+        return self.ctx.waits > 0
+
+    def wait(self):
+        self.ctx.waits -= 1
+        return ToContext(noop=self.submit(NoopWorkChain))
+
+    def results(self):
+        EVENTS.append(("end", self.inputs.label.value))
+        self.out("bader.bader_charge", self.inputs.bader_charge)
+
+
+class BatchWorkChain(QeBaderBatchWorkChain):
+    """The ``QeBaderBatchWorkChain`` with ``MemberWorkChain`` members."""
+
+    def _get_member_builder(self, structure):
+        builder = MemberWorkChain.get_builder()
+        builder.label = orm.Str(structure.label)
+        builder.waits = orm.Int(10 if structure.label == "slow" else 0)
+        builder.bader_charge = _bader_charge([1.0]).store()
+        return builder
+
+
+def _batch_inputs(labels, max_concurrent):
+    code = orm.load_code("bader@localhost")
+    return {
+        "structures": {
+            label: orm.StructureData(cell=np.eye(3) * 5.0, label=label)
+            for label in labels
+        },
+        "pw_code": code,
+        "pp_code": code,
+        "bader_code": code,
+        "max_concurrent": orm.Int(max_concurrent),
+    }
+
+
+def test_batch_throttle():
+    EVENTS.clear()
+    labels = ["a", "slow", "b", "c", "d"]
+    results, node = run_get_node(BatchWorkChain, **_batch_inputs(labels, 2))
+    assert node.is_finished_ok
+    assert sorted(results["bader_charge"]) == sorted(labels)
+
+    running, max_running = set(), 0
+    for event, label in EVENTS:
+        if event == "start":
+            running.add(label)
+            max_running = max(max_running, len(running))
+        else:
+            running.remove(label)
+    assert max_running == 2
+    starts = [label for event, label in EVENTS if event == "start"]
+    assert starts == labels
+    # the slot of the first member is refilled while the slow member is still running
+    assert EVENTS.index(("start", "b")) < EVENTS.index(("end", "slow"))
+
+
+def test_batch_restart(monkeypatch):
+    inputs = _batch_inputs(["a", "b", "c"], 2)
+    runner = get_manager().create_runner(communicator=None)
+    process = runner.instantiate_process(BatchWorkChain, **inputs)
+    finished = orm.WorkflowNode().store()
+    finished.set_process_state("finished")
+    running = orm.WorkflowNode().store()
+    running.set_process_state("running")
+    # the context of a work chain that was reloaded after a daemon restart
+    process.ctx.pending = [["c", inputs["structures"]["c"].store().pk]]
+    process.ctx.running = [["a", finished.pk], ["b", running.pk]]
+    process.ctx.finished = []
+    submitted = []
+
+    def submit(builder):
+        submitted.append(builder.label.value)
+        return orm.WorkflowNode().store()
+
+    monkeypatch.setattr(process, "submit", submit)
+    awaitables = process.submit_members()
+    assert submitted == ["c"]
+    assert process.ctx.finished == [["a", finished.pk]]
+    assert process.ctx.running[0] == ["b", running.pk]
+    assert [label for label, _ in process.ctx.running] == ["b", "c"]
+    assert process.ctx.pending == []
+    # only the oldest running member is awaited
+    assert [node.pk for node in awaitables.values()] == [running.pk]
+    runner.close()
+
+
+def test_clean_remote_folders(tmp_path):
+    save = tmp_path / "out" / "aiida.save"
+    save.mkdir(parents=True)
+    for path in (
+        tmp_path / "out" / "aiida.wfc1",
+        save / "wfc1.dat",
+        save / "charge-density.dat",
+        tmp_path / "aiida.fileout",
+    ):
+        path.write_text("data")
+    folder = orm.RemoteData(
+        remote_path=str(tmp_path), computer=orm.load_computer("localhost")
+    )
+
+    assert clean_remote_folders([folder], keep_density=True) == [folder]
+    assert sorted(path.name for path in tmp_path.rglob("*") if path.is_file()) == [
+        "aiida.fileout",
+        "charge-density.dat",
+    ]
+    clean_remote_folders([folder])
+    assert not tmp_path.exists() or not any(tmp_path.iterdir())
+
+
+def _kpoints(mesh, offset=(0, 0, 0)):
+    kpoints = orm.KpointsData()
+    kpoints.set_kpoints_mesh(mesh, offset)
+    return kpoints
+
+
+def _scf_calculation(structure, parameters, remote_path, kpoints=None):
+    computer = orm.load_computer("localhost")
+    node = orm.CalcJobNode(
+        computer=computer, process_type="aiida.calculations:quantumespresso.pw"
+    )
+    node.base.links.add_incoming(structure, LinkType.INPUT_CALC, "structure")
+    node.base.links.add_incoming(
+        orm.Dict(parameters).store(), LinkType.INPUT_CALC, "parameters"
+    )
+    kpoints = kpoints or _kpoints([2, 2, 2])
+    node.base.links.add_incoming(kpoints.store(), LinkType.INPUT_CALC, "kpoints")
+    node.set_exit_status(0)
+    node.store()
+    remote_folder = orm.RemoteData(remote_path=str(remote_path), computer=computer)
+    remote_folder.base.links.add_incoming(node, LinkType.CREATE, "remote_folder")
+    return remote_folder.store()
+
+
+def test_find_scf_remote_folder(tmp_path):
+    structure = orm.StructureData(cell=np.eye(3) * 5.0)
+    structure.append_atom(position=(0, 0, 0), symbols="O")
+    structure.store()
+    parameters = {"CONTROL": {"calculation": "scf"}, "SYSTEM": {"ecutwfc": 30}}
+    assert find_scf_remote_folder(structure, parameters) is None
+
+    (tmp_path / "old").mkdir()
+    (tmp_path / "old" / "aiida.out").write_text("data")
+    old = _scf_calculation(structure, parameters, tmp_path / "old")
+    _scf_calculation(structure, {"SYSTEM": {"ecutwfc": 40}}, tmp_path / "old")
+    # the latest matching calculation was cleaned
+    (tmp_path / "cleaned").mkdir()
+    _scf_calculation(structure, parameters, tmp_path / "cleaned")
+
+    assert find_scf_remote_folder(structure, parameters).uuid == old.uuid
+    assert find_scf_remote_folder(structure, {"SYSTEM": {"ecutwfc": 50}}) is None
+
+
+def test_find_scf_remote_folder_convergence(tmp_path):
+    structure = orm.StructureData(cell=np.eye(3) * 5.0)
+    structure.append_atom(position=(0, 0, 0), symbols="O")
+    structure.store()
+    (tmp_path / "aiida.out").write_text("data")
+    parameters = {"SYSTEM": {"ecutwfc": 30}, "ELECTRONS": {"conv_thr": 1e-8}}
+    remote_folder = _scf_calculation(
+        structure, parameters, tmp_path, _kpoints([2, 2, 2], [0.5, 0.5, 0.5])
+    )
+
+    def find(electrons, kpoints):
+        return find_scf_remote_folder(
+            structure,
+            {"SYSTEM": {"ecutwfc": 30}, "ELECTRONS": electrons},
+            None,
+            kpoints,
+        )
+
+    kpoints = _kpoints([2, 2, 2], [0.5, 0.5, 0.5])
+    assert find({"conv_thr": 1e-8}, kpoints).uuid == remote_folder.uuid
+    # a tighter conv_thr than requested is fine, and the default is 1e-6
+    assert find({"conv_thr": 1e-6}, kpoints).uuid == remote_folder.uuid
+    assert find({}, None).uuid == remote_folder.uuid
+    assert find({"conv_thr": 1e-10}, kpoints) is None
+    assert find({"conv_thr": 1e-8, "tqr": True}, kpoints) is None
+    assert find({"conv_thr": 1e-8}, _kpoints([2, 2, 2])) is None
+    assert find({"conv_thr": 1e-8}, _kpoints([3, 3, 3], [0.5, 0.5, 0.5])) is None
+
+
+def test_get_scf_kpoints():
+    from aiida_bader.utils import get_scf_kpoints
+
+    structure = orm.StructureData(cell=np.eye(3) * 5.0)
+    structure.append_atom(position=(0, 0, 0), symbols="O")
+    kpoints = _kpoints([2, 2, 2])
+    assert get_scf_kpoints(structure, {"kpoints": kpoints}) is kpoints
+    assert get_scf_kpoints(structure, {}) is None
+    generated = get_scf_kpoints(structure, {"kpoints_distance": orm.Float(0.5)})
+    assert not generated.is_stored
+    assert generated.get_kpoints_mesh()[0] == [3, 3, 3]
+
+
+def test_load_pseudos():
+    import uuid
+
+    from aiida.common.exceptions import NotExistent
+
+    from aiida_bader.utils import _PSEUDO_UUIDS, load_pseudos, pseudo_group_exists
+
+    label = f"test_pseudos_{uuid.uuid4().hex}"
+    assert not pseudo_group_exists(label)
+    group = orm.Group(label=label).store()
+    assert not pseudo_group_exists(label)
+
+    pseudos = {}
+    for element in ("O", "H", "Na"):
+        pseudos[element] = orm.Data()
+        pseudos[element].label = element
+        pseudos[element].store()
+    group.add_nodes([pseudos["O"], pseudos["H"]])
+    assert pseudo_group_exists(label)
+
+    structure = orm.StructureData(cell=np.eye(3) * 5.0)
+    structure.append_atom(position=(0, 0, 0), symbols="O")
+    structure.append_atom(position=(1, 0, 0), symbols="H")
+    loaded = load_pseudos(structure, label)
+    assert {key: node.uuid for key, node in loaded.items()} == {
+        "O": pseudos["O"].uuid,
+        "H": pseudos["H"].uuid,
+    }
+    assert _PSEUDO_UUIDS[label][0] == 2
+
+    structure.append_atom(position=(2, 0, 0), symbols="Na")
+    with pytest.raises(NotExistent):
+        load_pseudos(structure, label)
+    # a new node of the group invalidates the cache
+    group.add_nodes([pseudos["Na"]])
+    assert load_pseudos(structure, label)["Na"].uuid == pseudos["Na"].uuid
+    assert _PSEUDO_UUIDS[label][0] == 3
@@ -0,0 +1,104 @@
+import io
+
+import pytest
+from aiida import load_profile, orm
+from ase.build import molecule
+
+from aiida_bader.workgraph.cp2k_bader import (
+    DENSITY_CUBE_FILENAME,
+    add_density_cube,
+    cp2k_bader_workgraph,
+)
+from aiida_bader.workgraph.qe_bader import bader_workgraph
+
+load_profile()
+
+
+def _upf(element):
+    from aiida_pseudo.data.pseudo import UpfData
+
+    from aiida_bader.testing import write_upf
+
+    handle = io.StringIO()
+    write_upf(handle, element, 1)
+    return UpfData(io.BytesIO(handle.getvalue().encode()))
+
+
+def test_add_density_cube():
+    parameters = {
+        "FORCE_EVAL": {"METHOD": "Quickstep", "dft": {"print": {"MO": {}}}},
+        "GLOBAL": {"PROJECT": "aiida"},
+    }
+    result = add_density_cube(parameters, stride=[1, 2, 3])
+    assert result["GLOBAL"]["RUN_TYPE"] == "ENERGY"
+    # the existing sections are kept, whatever their case
+    assert result["FORCE_EVAL"]["dft"]["print"]["MO"] == {}
+    assert result["FORCE_EVAL"]["dft"]["print"]["E_DENSITY_CUBE"] == {"STRIDE": "1 2 3"}
+    assert "E_DENSITY_CUBE" not in parameters["FORCE_EVAL"]["dft"]["print"]
+
+    result = add_density_cube({"FORCE_EVAL": [{}, {}]}, stride=4)
+    for force_eval in result["FORCE_EVAL"]:
+        assert force_eval["DFT"]["PRINT"]["E_DENSITY_CUBE"]["STRIDE"] == "4"
+
+    for stride in (0, [1, 2], 1.5):
+        with pytest.raises(ValueError):
+            add_density_cube({}, stride=stride)
+
+
+def test_add_density_cube_run_type():
+    result = add_density_cube({"global": {"run_type": "energy_force"}})
+    assert result["global"] == {"run_type": "energy_force"}
+    for run_type in ("GEO_OPT", "md"):
+        with pytest.raises(ValueError, match="run type"):
+            add_density_cube({"GLOBAL": {"RUN_TYPE": run_type}})
+
+
+def test_cp2k_bader_workgraph():
+    structure = orm.StructureData(ase=molecule("H2O", vacuum=4.0))
+    wg = cp2k_bader_workgraph(structure=structure, parameters=orm.Dict(), stride=3)
+    assert [task.name for task in wg.tasks] == ["scf", "bader"]
+    parameters = wg.tasks["scf"].inputs["cp2k"]["parameters"].value.get_dict()
+    assert parameters["FORCE_EVAL"]["DFT"]["PRINT"]["E_DENSITY_CUBE"]["STRIDE"] == "3"
+    bader = wg.tasks["bader"]
+    assert bader.inputs["charge_density_filename"].value == DENSITY_CUBE_FILENAME
+
+    with pytest.raises(ValueError):
+        cp2k_bader_workgraph(
+            structure=structure, parameters=orm.Dict(), reference_density="core"
+        )
+
+    # the reference is built in the bader job
+    cube_code = orm.load_code("bader@localhost")
+    pseudos = {element: _upf(element) for element in ("H", "O")}
+    wg = cp2k_bader_workgraph(
+        structure=structure,
+        parameters=orm.Dict(),
+        reference_density="core",
+        cube_code=cube_code,
+        pseudos_upf=pseudos,
+    )
+    assert [task.name for task in wg.tasks] == ["scf", "bader"]
+    bader = wg.tasks["bader"]
+    assert bader.inputs["reference_code"].value.uuid == cube_code.uuid
+    assert bader.inputs["reference_pseudos"]["O"].value is pseudos["O"]
+
+
+def test_bader_workgraph_cleanup():
+    structure = orm.StructureData(ase=molecule("H2O", vacuum=4.0))
+    # the cleanup task only runs if bader succeeded
+    for cleanup in ("always", "everything"):
+        with pytest.raises(ValueError, match="cleanup"):
+            bader_workgraph(structure=structure, cleanup=cleanup)
+
+
+def test_bader_workgraph_reference_code(tmp_path):
+    structure = orm.StructureData(ase=molecule("H2O", vacuum=4.0))
+    (tmp_path / "python").write_text("#!/bin/sh\n")
+    cube_code = orm.PortableCode(
+        label="python", filepath_executable="python", filepath_files=tmp_path
+    )
+    # the reference is built in the prepend text of the bader job
+    with pytest.raises(ValueError, match="InstalledCode"):
+        bader_workgraph(
+            structure=structure, reference_density="core", cube_code=cube_code
+        )